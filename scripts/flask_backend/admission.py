@@ -0,0 +1,289 @@
+"""
+Admission Module
+Rate limits and concurrency pools that shed load with fast 429/503 answers
+instead of letting expensive work pile up.
+"""
+
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from metrics import metrics
+
+ADMISSION_WAIT_METRIC = 'webot_admission_wait_seconds'
+ADMISSION_REJECTED = 'webot_admission_rejected_total'
+
+# Seconds between heartbeat calls while a background caller waits for a slot
+HEARTBEAT_INTERVAL = 30.0
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is not admitted.
+
+    status is 429 when the caller exceeded a rate limit and 503 when the
+    server is saturated; retry_after is a whole number of seconds for the
+    Retry-After header.
+    """
+
+    def __init__(self, message: str, status: int = 503, retry_after: float = 1.0):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+
+class RateLimit:
+    """
+    A global token bucket plus one bucket per user.
+
+    Buckets for the least recently seen users are dropped beyond max_users.
+    A rate of 0 disables that bucket.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float,
+        user_rate: float,
+        user_burst: float,
+        max_users: int = 10000
+    ):
+        self.name = name
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_users = max_users
+        self._global = TokenBucket(rate, burst) if rate > 0 else None
+        self._users: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _user_bucket(self, user_id: str) -> Optional[TokenBucket]:
+        if self.user_rate <= 0:
+            return None
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self._users[user_id] = bucket
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return bucket
+
+    def check(self, user_id: str) -> None:
+        """
+        Take one token from both the user's and the global bucket.
+
+        Raises:
+            Overloaded: 429 if either bucket is empty (no token is taken)
+        """
+        now = time.monotonic()
+        with self._lock:
+            user_bucket = self._user_bucket(user_id)
+            user_wait = user_bucket.wait_time(now) if user_bucket else 0.0
+            global_wait = self._global.wait_time(now) if self._global else 0.0
+            if user_wait == 0 and global_wait == 0:
+                if user_bucket:
+                    user_bucket.consume()
+                if self._global:
+                    self._global.consume()
+                return
+
+        scope = 'user' if user_wait >= global_wait else 'global'
+        metrics.inc(ADMISSION_REJECTED, limit=self.name, reason=f"rate_{scope}")
+        raise Overloaded(
+            "Too many requests. Please slow down." if scope == 'user'
+            else "Server is busy. Please retry shortly.",
+            status=429,
+            retry_after=max(user_wait, global_wait)
+        )
+
+
+class WorkPool:
+    """
+    Caps how many expensive operations of one kind run at once.
+
+    Interactive callers wait in a bounded queue (max_waiting) for at most
+    max_wait seconds, and are rejected with 503 as soon as either bound is
+    hit. Background callers (jobs) wait for a slot as long as it takes;
+    their own queue already bounds them. A waiting caller's heartbeat is
+    called every heartbeat_interval seconds so its job isn't taken for
+    dead while it waits.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        max_waiting: int = 0,
+        max_wait: float = 0.0,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL
+    ):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.heartbeat_interval = heartbeat_interval
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._avg_hold = 1.0  # moving average of seconds a slot is held
+        self.stats = {"admitted": 0, "rejected_full": 0, "rejected_timeout": 0}
+
+    def _retry_after(self) -> float:
+        """Rough time for the current queue to drain."""
+        return self._avg_hold * (self._waiting + 1) / max(1, self.limit)
+
+    def _reject(self, reason: str) -> Overloaded:
+        self.stats[f"rejected_{reason}"] += 1
+        metrics.inc(ADMISSION_REJECTED, limit=self.name, reason=reason)
+        return Overloaded("Server is busy. Please retry shortly.", status=503, retry_after=self._retry_after())
+
+    @contextmanager
+    def slot(self, background: bool = False, heartbeat: Optional[Callable[[], None]] = None):
+        """
+        Hold one of the pool's slots for the duration of the block.
+
+        Args:
+            background: Wait as long as it takes instead of being rejected
+            heartbeat: Optional callable called every heartbeat_interval
+                       seconds while waiting (e.g. a job progress report)
+
+        Raises:
+            Overloaded: 503 if an interactive caller can't get a slot in time
+        """
+        started = time.monotonic()
+        with self._cond:
+            if self._active >= self.limit:
+                if not background and self._waiting >= self.max_waiting:
+                    raise self._reject('full')
+                deadline = None if background else started + self.max_wait
+                next_beat = started + self.heartbeat_interval
+                self._waiting += 1
+                try:
+                    while self._active >= self.limit:
+                        now = time.monotonic()
+                        remaining = None if deadline is None else deadline - now
+                        if remaining is not None and remaining <= 0:
+                            raise self._reject('timeout')
+                        if heartbeat is not None:
+                            if now >= next_beat:
+                                # May write to the job DB; don't hold up the pool meanwhile
+                                self._cond.release()
+                                try:
+                                    heartbeat()
+                                finally:
+                                    self._cond.acquire()
+                                next_beat = time.monotonic() + self.heartbeat_interval
+                                continue
+                            remaining = next_beat - now if remaining is None else min(remaining, next_beat - now)
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+            self.stats["admitted"] += 1
+
+        acquired = time.monotonic()
+        waited = acquired - started
+        metrics.observe(ADMISSION_WAIT_METRIC, waited, pool=self.name)
+        timings = metrics.current()
+        if timings:
+            timings.add(f"queue_{self.name}", waited)
+
+        try:
+            yield
+        finally:
+            held = time.monotonic() - acquired
+            with self._cond:
+                self._active -= 1
+                self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+                self._cond.notify()
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return dict(self.stats, active=self._active, waiting=self._waiting, limit=self.limit)
+
+
+class AdmissionController:
+    """Rate limits per endpoint class and work pools per resource, per worker process."""
+
+    def __init__(self, limits: Dict[str, RateLimit], pools: Dict[str, WorkPool]):
+        self.limits = limits
+        self.pools = pools
+
+    def check_rate(self, kind: str, user_id: str) -> None:
+        """Apply the rate limit for an endpoint class ('chat' or 'ingest')."""
+        limit = self.limits.get(kind)
+        if limit:
+            limit.check(user_id)
+
+    def slot(self, pool: str, background: bool = False, heartbeat: Optional[Callable[[], None]] = None):
+        """Hold a slot in a work pool ('crawl', 'embed' or 'llm')."""
+        return self.pools[pool].slot(background=background, heartbeat=heartbeat)
+
+    def stats(self) -> Dict:
+        return {name: pool.snapshot() for name, pool in self.pools.items()}
+
+
+def _env_float(name: str, default: str) -> float:
+    return float(os.environ.get(name, default))
+
+
+metrics.describe(ADMISSION_WAIT_METRIC, 'histogram', 'Time spent waiting for a work pool slot')
+metrics.describe(ADMISSION_REJECTED, 'counter', 'Requests rejected by admission control')
+
+# Process-wide admission control; each gunicorn worker enforces its own share
+admission = AdmissionController(
+    limits={
+        'chat': RateLimit(
+            'chat',
+            rate=_env_float('CHAT_RATE_LIMIT', '20'),
+            burst=_env_float('CHAT_RATE_BURST', '40'),
+            user_rate=_env_float('CHAT_USER_RATE_LIMIT', '1'),
+            user_burst=_env_float('CHAT_USER_RATE_BURST', '5')
+        ),
+        'ingest': RateLimit(
+            'ingest',
+            rate=_env_float('INGEST_RATE_LIMIT', '1'),
+            burst=_env_float('INGEST_RATE_BURST', '10'),
+            user_rate=_env_float('INGEST_USER_RATE_LIMIT', '0.2'),
+            user_burst=_env_float('INGEST_USER_RATE_BURST', '5')
+        ),
+    },
+    pools={
+        'crawl': WorkPool('crawl', int(os.environ.get('CRAWL_CONCURRENCY', '4'))),
+        'embed': WorkPool('embed', int(os.environ.get('EMBED_CONCURRENCY', '1'))),
+        'llm': WorkPool(
+            'llm',
+            int(os.environ.get('LLM_CONCURRENCY', '8')),
+            max_waiting=int(os.environ.get('LLM_MAX_WAITING', '16')),
+            max_wait=_env_float('LLM_MAX_WAIT', '5')
+        ),
+    }
+)
@@ -4,29 +4,49 @@ Main application entry point with all API endpoints
 """
 
 import os
-import hashlib
+import hmac
 import json
+import base64
+from functools import partial
 from datetime import datetime
-from flask import Flask, request, jsonify
+from typing import Optional
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 
 # Import our modules
 from scraper import WebScraper
 from embeddings import EmbeddingManager
 from rag_chat import RAGChatbot
+from singleflight import SingleFlight, make_key
+from conversation import Conversation, ConversationStore
+from jobs import JobQueue, QUEUED, RUNNING, FAILED
+from site_registry import SiteRegistry
+from metrics import metrics, REQUEST_METRIC, REQUEST_COUNTER
+from profiling import RequestProfiler
+from bulk_ingest import BulkIngestor
+from admission import admission, Overloaded
+from sharding import get_url_hash
+from crawl_state import CrawlCheckpointStore
+from page_archive import PageArchive
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 
+# Behind the shard router (or another proxy), take the client address from
+# X-Forwarded-For so per-user rate limits see real clients
+if os.environ.get('TRUST_PROXY', 'False').lower() == 'true':
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+
 # Enable CORS for all routes
 CORS(app, resources={
     r"/*": {
         "origins": ["http://localhost:3000", "https://*.vercel.app", "*"],
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization", "X-Profile"]
     }
 })
 
@@ -35,13 +55,206 @@ scraper = WebScraper()
 embedding_manager = EmbeddingManager()
 chatbot = RAGChatbot()
 
-# In-memory storage for processed websites (in production, use a database)
-processed_websites = {}
+# Local state (site registry, job queue DB etc.) lives here
+DATA_DIR = os.environ.get('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+# Processed websites, shared by all worker processes through SQLite
+site_registry = SiteRegistry(
+    os.environ.get('SITES_DB_PATH', os.path.join(DATA_DIR, 'sites.sqlite3'))
+)
+
+# Crawl checkpoints: a scrape job interrupted by a restart resumes from its
+# last checkpoint instead of re-fetching every page
+crawl_store = CrawlCheckpointStore(
+    os.environ.get('CRAWL_DB_PATH', os.path.join(DATA_DIR, 'crawls.sqlite3')),
+    every_pages=int(os.environ.get('CRAWL_CHECKPOINT_PAGES', '10')),
+    every_seconds=float(os.environ.get('CRAWL_CHECKPOINT_SECONDS', '10')),
+    max_age=float(os.environ.get('CRAWL_CHECKPOINT_MAX_AGE', str(24 * 3600)))
+)
+
+# Raw HTML of crawled pages, kept so extraction and chunking changes can be
+# applied with reprocess.py instead of crawling every site again
+page_archive = PageArchive(
+    os.environ.get('PAGE_ARCHIVE_PATH', os.path.join(DATA_DIR, 'archive.sqlite3'))
+) if os.environ.get('ARCHIVE_PAGES', 'True').lower() == 'true' else None
+
+# Chat sessions, shared by all worker processes so a follow-up can land on
+# any of them; history sent per prompt is capped at HISTORY_TOKEN_BUDGET +
+# SUMMARY_TOKEN_BUDGET tokens
+conversations = ConversationStore(
+    os.environ.get('CHAT_DB_PATH', os.path.join(DATA_DIR, 'conversations.sqlite3')),
+    max_sessions=int(os.environ.get('MAX_CHAT_SESSIONS', '10000')),
+    ttl_seconds=float(os.environ.get('CHAT_SESSION_TTL', '1800')),
+    history_budget=int(os.environ.get('HISTORY_TOKEN_BUDGET', '600')),
+    summary_budget=int(os.environ.get('SUMMARY_TOKEN_BUDGET', '300'))
+)
+
+# Opt-in cProfile capture: send "X-Profile: $PROFILE_TOKEN" to profile one
+# request, or set PROFILE_SAMPLE_RATE for always-on sampling
+profiler = RequestProfiler(
+    profile_dir=os.environ.get('PROFILE_DIR', os.path.join(DATA_DIR, 'profiles')),
+    token=os.environ.get('PROFILE_TOKEN') or None,
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0')),
+    max_files=int(os.environ.get('PROFILE_MAX_FILES', '50'))
+)
+
+# Coalesces identical concurrent /chat requests. Set SINGLEFLIGHT_DIR to a
+# directory shared by all workers to also coalesce across processes.
+chat_flight = SingleFlight(
+    shared_dir=os.environ.get('SINGLEFLIGHT_DIR') or None,
+    shared_ttl=float(os.environ.get('SINGLEFLIGHT_TTL', '5'))
+)
+
+
+def ensure_index_loaded(url_hash: str, site: dict) -> bool:
+    """
+    Make sure this worker holds the current index for a site.
+    
+    The site may have been trained by another worker, or retrained since
+    this worker loaded it; either way the stored index is loaded.
+    """
+    if (
+        url_hash in embedding_manager.chunks_store
+        and embedding_manager.index_versions.get(url_hash) == site.get('index_version')
+    ):
+        return True
+    
+    stored = site_registry.load_index(url_hash)
+    if stored is None:
+        return False
+    
+    version, chunks, embeddings = stored
+    embedding_manager.load_index(url_hash, chunks, embeddings, version=version)
+    print(f"[EMBEDDINGS] Loaded stored index v{version} for {url_hash}")
+    return True
+
+
+def client_id(user_id: Optional[str]) -> str:
+    """Rate-limit key: the user ID, or the client address for anonymous callers."""
+    if user_id and user_id != 'anonymous':
+        return f"user:{user_id}"
+    return f"addr:{request.remote_addr}"
+
+
+def admit_ingest(user_id: Optional[str]) -> None:
+    """
+    Admission control for ingest endpoints.
+    
+    Raises:
+        Overloaded: 429 over the ingest rate limits, 503 when the job
+                    backlog is full
+    """
+    admission.check_rate('ingest', client_id(user_id))
+    if job_queue.counts().get(QUEUED, 0) >= MAX_QUEUED_JOBS:
+        raise Overloaded("Too many websites are queued for processing. Please retry later.",
+                         status=503, retry_after=JOB_BACKLOG_RETRY_AFTER)
+
+
+@app.errorhandler(Overloaded)
+def handle_overloaded(error: Overloaded):
+    """Fast rejection with a Retry-After hint."""
+    response = jsonify({"error": str(error), "retryAfter": error.retry_after})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
 
-def get_url_hash(url: str) -> str:
-    """Generate a unique hash for a URL."""
-    return hashlib.md5(url.encode()).hexdigest()
+def profile_token() -> Optional[str]:
+    """
+    Profiling token supplied with the current request, if any. Only the
+    X-Profile header is read: a query parameter would end up in access logs.
+    """
+    return request.headers.get('X-Profile')
+
+
+@app.before_request
+def start_request_timing():
+    """Collect per-stage timings for this request."""
+    metrics.start_request(request.endpoint or 'unknown')
+
+
+@app.before_request
+def start_request_profile():
+    """Profile this request if it asked for it or was sampled."""
+    if request.endpoint in ('list_profiles', 'download_profile'):
+        g.profile_reason = None
+    else:
+        g.profile_reason = profiler.should_profile(profile_token())
+    g.profile = profiler.start() if g.profile_reason else None
+    # One capture per process at a time; tell the caller theirs was skipped
+    g.profile_skipped = g.profile_reason == 'requested' and g.profile is None
+
+
+@app.after_request
+def save_request_profile(response):
+    """Save the request's profile and point to it in a response header."""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        name = profiler.stop(profile, request.endpoint or 'unknown')
+        if name and g.get('profile_reason') == 'requested':
+            response.headers['X-Profile-Id'] = name
+    elif g.get('profile_skipped'):
+        response.headers['X-Profile-Skipped'] = 'another profile is being captured'
+    return response
+
+
+@app.after_request
+def record_request_timing(response):
+    """Record request metrics and attach the timing breakdown as "debug"."""
+    timings = metrics.end_request()
+    if timings is None:
+        return response
+    
+    if response.status_code < 400:
+        outcome = 'ok'
+    elif response.status_code < 500:
+        outcome = 'client_error'
+    else:
+        outcome = 'error'
+    
+    breakdown = timings.to_dict()
+    metrics.observe(REQUEST_METRIC, breakdown["totalMs"] / 1000, endpoint=timings.endpoint, outcome=outcome)
+    metrics.inc(REQUEST_COUNTER, endpoint=timings.endpoint, status=str(response.status_code))
+    
+    if response.is_json:
+        data = response.get_json(silent=True)
+        if isinstance(data, dict):
+            data["debug"] = {"timing": breakdown}
+            response.set_data(app.json.dumps(data))
+    
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage and request metrics in Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    """List recent saved profiles (requires the profiling token)."""
+    if not profiler.authorized(profile_token()):
+        return jsonify({"error": "Profiling token required"}), 403
+    return jsonify({"profiles": profiler.list_profiles()})
+
+
+@app.route('/profiles/<name>', methods=['GET'])
+def download_profile(name: str):
+    """
+    Download a saved profile as a pstats file (open with snakeviz or
+    pstats), or as a text summary with ?format=text.
+    """
+    if not profiler.authorized(profile_token()):
+        return jsonify({"error": "Profiling token required"}), 403
+    
+    path = profiler.path_for(name)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    
+    if request.args.get('format') == 'text':
+        return Response(profiler.render_text(path), mimetype='text/plain')
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=name)
 
 
 @app.route('/health', methods=['GET'])
@@ -54,10 +267,158 @@ def health_check():
     })
 
 
+def run_scrape_job(job: dict, report) -> dict:
+    """Background job: crawl a website and store its text."""
+    url = job["payload"]["url"]
+    user_id = job["payload"].get("userId", "anonymous")
+    url_hash = job["url_hash"]
+    
+    print(f"[SCRAPER] Starting scrape for: {url}")
+    checkpoint = crawl_store.open(url_hash, url)
+    if page_archive and not checkpoint.resumed:
+        page_archive.discard(url_hash)  # pages of an abandoned earlier crawl
+    done = len(checkpoint.state.visited)
+    report("fetching", done, scraper.max_pages, pages_fetched=done)
+    try:
+        # Waiting for a crawl slot can outlast the queue's stale_after; keep
+        # reporting so another worker doesn't requeue this job meanwhile
+        with admission.slot(
+            'crawl',
+            background=True,
+            heartbeat=lambda: report("fetching", done, scraper.max_pages, pages_fetched=done)
+        ):
+            content = scraper.scrape_website(
+                url,
+                progress=lambda done, total: report("fetching", done, total, pages_fetched=done),
+                checkpoint=checkpoint,
+                on_fetch=partial(page_archive.put_response, url_hash) if page_archive else None
+            )
+        
+        if not content or len(content.strip()) < 100:
+            raise ValueError(
+                "Could not extract meaningful content from the website. The page might be empty, blocked, or requires authentication."
+            )
+        
+        # Store the scraped content
+        site_registry.save_scraped(url_hash, url, user_id, content)
+    except Exception:
+        # Keep the archive at the last successful crawl
+        if page_archive:
+            page_archive.discard(url_hash)
+        raise
+    crawl_store.discard(url_hash)
+    if page_archive:
+        page_archive.commit(url_hash, checkpoint.state.visited)
+    
+    print(f"[SCRAPER] Successfully scraped {len(content)} characters from {url}")
+    return {"contentLength": len(content), "resumed": checkpoint.resumed}
+
+
+def run_train_job(job: dict, report) -> dict:
+    """Background job: chunk scraped content and build its vector index."""
+    url = job["payload"]["url"]
+    url_hash = job["url_hash"]
+    
+    if url_hash not in site_registry:
+        raise ValueError("Website not found. Please scrape the website first.")
+    
+    content = site_registry.get_content(url_hash)
+    if not content:
+        raise ValueError("No content found for this website")
+    
+    # Create embeddings and store in vector database
+    print(f"[EMBEDDINGS] Processing content for: {url}")
+    report("chunking")
+    
+    chunks = embedding_manager.chunk_text(content)
+    print(f"[EMBEDDINGS] Created {len(chunks)} chunks")
+    
+    report("embedding", 0, len(chunks), chunks_total=len(chunks), chunks_embedded=0)
+    embedding_manager.create_index(
+        url_hash,
+        chunks,
+        progress=lambda done, total: report("embedding", done, total, chunks_embedded=done)
+    )
+    print(f"[EMBEDDINGS] Index created for {url_hash}")
+    
+    # Persist the index and mark the site ready so any worker can serve it
+    report("saving")
+    chunks, embeddings = embedding_manager.export_index(url_hash)
+    version = site_registry.save_index(url_hash, chunks, embeddings)
+    embedding_manager.index_versions[url_hash] = version
+    
+    return {"chunksCreated": len(chunks)}
+
+
+# Multi-site onboarding: concurrent crawls, process-pool parsing/chunking and
+# large shared embedding batches
+bulk_ingestor = BulkIngestor(
+    embedding_manager,
+    site_registry,
+    crawl_threads=int(os.environ.get('BULK_CRAWL_THREADS', '8')),
+    processes=int(os.environ['BULK_PROCESSES']) if os.environ.get('BULK_PROCESSES') else None,
+    embed_batch_size=int(os.environ.get('BULK_EMBED_BATCH_SIZE', '1024')),
+    max_pages=scraper.max_pages,
+    request_delay=scraper.request_delay,
+    crawl_store=crawl_store,
+    archive=page_archive
+)
+BULK_MAX_URLS = int(os.environ.get('BULK_MAX_URLS', '50'))
+
+
+def run_bulk_ingest_job(job: dict, report) -> dict:
+    """Background job: scrape and train a batch of websites."""
+    payload = job["payload"]
+    sites = [{"url": url, "url_hash": get_url_hash(url)} for url in payload["urls"]]
+    return bulk_ingestor.ingest(sites, payload.get("userId", "anonymous"), report)
+
+
+# Background jobs for ingest work; the DB file lets every worker see every job
+job_queue = JobQueue(
+    db_path=os.environ.get('JOBS_DB_PATH', os.path.join(DATA_DIR, 'jobs.sqlite3')),
+    workers=int(os.environ.get('JOB_WORKERS', '2')),
+    retention=float(os.environ.get('JOB_RETENTION_SECONDS', str(7 * 24 * 3600))),
+    profiler=profiler,
+    limits={
+        'scrape': int(os.environ.get('MAX_CONCURRENT_SCRAPES', '2')),
+        'train': int(os.environ.get('MAX_CONCURRENT_TRAINS', '1')),
+        'bulk_ingest': int(os.environ.get('MAX_CONCURRENT_BULK_INGESTS', '1'))
+    }
+)
+# Ingest requests are refused with 503 once this many jobs are waiting
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', '100'))
+JOB_BACKLOG_RETRY_AFTER = 30
+
+job_queue.register('scrape', run_scrape_job)
+job_queue.register('train', run_train_job)
+job_queue.register('bulk_ingest', run_bulk_ingest_job)
+job_queue.start()
+
+
+def job_to_json(job: dict) -> dict:
+    """Public view of a background job."""
+    progress = job.get("progress") or {}
+    return {
+        "jobId": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "phase": job["phase"],
+        "pagesFetched": progress.get("pages_fetched"),
+        "chunksEmbedded": progress.get("chunks_embedded"),
+        "chunksTotal": progress.get("chunks_total"),
+        "sitesDone": progress.get("sites_done"),
+        "sitesTotal": progress.get("sites_total"),
+        "etaSeconds": progress.get("eta_seconds"),
+        "result": job.get("result"),
+        "error": job.get("error")
+    }
+
+
 @app.route('/scrape-website', methods=['POST'])
 def scrape_website():
     """
-    Scrape a website and extract its content.
+    Queue a website scrape. Returns 202 with a job ID at once; poll
+    /status/<url_hash> or /jobs/<job_id> for progress.
     
     Request body:
     {
@@ -84,34 +445,24 @@ def scrape_website():
         # Generate unique key for this URL
         url_hash = get_url_hash(url)
         
-        # Scrape the website
-        print(f"[SCRAPER] Starting scrape for: {url}")
-        content = scraper.scrape_website(url)
-        
-        if not content or len(content.strip()) < 100:
-            return jsonify({
-                "error": "Could not extract meaningful content from the website. The page might be empty, blocked, or requires authentication."
-            }), 400
-        
-        # Store the scraped content
-        processed_websites[url_hash] = {
+        admit_ingest(user_id)
+        job = job_queue.submit('scrape', url_hash, {
             "url": url,
-            "user_id": user_id,
-            "content": content,
-            "scraped_at": datetime.utcnow().isoformat(),
-            "status": "scraped"
-        }
-        
-        print(f"[SCRAPER] Successfully scraped {len(content)} characters from {url}")
+            "userId": user_id,
+            "profile": g.get('profile_reason') == 'requested'
+        })
         
         return jsonify({
             "success": True,
-            "message": "Website scraped successfully",
+            "message": "Website scrape queued",
             "url": url,
-            "contentLength": len(content),
-            "urlHash": url_hash
-        })
+            "urlHash": url_hash,
+            "jobId": job["id"],
+            "status": job["status"]
+        }), 202
         
+    except Overloaded:
+        raise
     except Exception as e:
         print(f"[ERROR] Scraping failed: {str(e)}")
         return jsonify({"error": f"Failed to scrape website: {str(e)}"}), 500
@@ -120,7 +471,8 @@ def scrape_website():
 @app.route('/train-website', methods=['POST'])
 def train_website():
     """
-    Process scraped content and create embeddings for RAG.
+    Queue embedding creation for scraped content. Returns 202 with a job
+    ID at once; poll /status/<url_hash> or /jobs/<job_id> for progress.
     
     Request body:
     {
@@ -143,42 +495,147 @@ def train_website():
         url_hash = get_url_hash(url)
         
         # Check if website was scraped
-        if url_hash not in processed_websites:
+        if url_hash not in site_registry:
             return jsonify({
                 "error": "Website not found. Please scrape the website first."
             }), 404
         
-        website_data = processed_websites[url_hash]
-        content = website_data.get('content', '')
+        admit_ingest(user_id)
+        job = job_queue.submit('train', url_hash, {
+            "url": url,
+            "userId": user_id,
+            "profile": g.get('profile_reason') == 'requested'
+        })
         
-        if not content:
-            return jsonify({"error": "No content found for this website"}), 400
+        return jsonify({
+            "success": True,
+            "message": "Website training queued",
+            "url": url,
+            "urlHash": url_hash,
+            "jobId": job["id"],
+            "status": job["status"]
+        }), 202
         
-        # Create embeddings and store in vector database
-        print(f"[EMBEDDINGS] Processing content for: {url}")
+    except Overloaded:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Training failed: {str(e)}")
+        return jsonify({"error": f"Failed to train on website: {str(e)}"}), 500
+
+
+@app.route('/ingest-batch', methods=['POST'])
+def ingest_batch():
+    """
+    Queue scraping and training for many websites at once. Returns 202 with
+    a job ID; poll /jobs/<job_id> for progress, per-URL results and
+    aggregate throughput.
+    
+    Request body:
+    {
+        "urls": ["https://example.com", "https://example.org"],
+        "userId": "user123"
+    }
+    """
+    try:
+        data = request.get_json(silent=True)
         
-        chunks = embedding_manager.chunk_text(content)
-        print(f"[EMBEDDINGS] Created {len(chunks)} chunks")
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        if not isinstance(data, dict):
+            return jsonify({"error": "Request body must be a JSON object"}), 400
         
-        embedding_manager.create_index(url_hash, chunks)
-        print(f"[EMBEDDINGS] Index created for {url_hash}")
+        urls = data.get('urls')
+        user_id = data.get('userId', 'anonymous')
         
-        # Update status
-        processed_websites[url_hash]["status"] = "ready"
-        processed_websites[url_hash]["chunks_count"] = len(chunks)
-        processed_websites[url_hash]["trained_at"] = datetime.utcnow().isoformat()
+        if not urls or not isinstance(urls, list):
+            return jsonify({"error": "urls must be a non-empty list"}), 400
         
-        return jsonify({
-            "success": True,
-            "message": "Website trained successfully",
-            "url": url,
-            "chunksCreated": len(chunks),
-            "urlHash": url_hash
+        # Check before deduplicating: non-string items may not be hashable
+        invalid = [url for url in urls if not isinstance(url, str) or not url.startswith(('http://', 'https://'))]
+        if invalid:
+            return jsonify({
+                "error": "Invalid URL. Must start with http:// or https://",
+                "invalid": invalid
+            }), 400
+        
+        urls = list(dict.fromkeys(urls))
+        if len(urls) > BULK_MAX_URLS:
+            return jsonify({"error": f"At most {BULK_MAX_URLS} URLs per batch"}), 400
+        
+        # Identical batches share one job while it is active
+        batch_hash = get_url_hash("\n".join(sorted(urls)))
+        admit_ingest(user_id)
+        job = job_queue.submit('bulk_ingest', f"batch:{batch_hash}", {
+            "urls": urls,
+            "userId": user_id,
+            "profile": g.get('profile_reason') == 'requested'
         })
         
+        return jsonify({
+            "success": True,
+            "message": f"Batch ingest of {len(urls)} websites queued",
+            "sites": [{"url": url, "urlHash": get_url_hash(url)} for url in urls],
+            "jobId": job["id"],
+            "status": job["status"]
+        }), 202
+        
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"[ERROR] Training failed: {str(e)}")
-        return jsonify({"error": f"Failed to train on website: {str(e)}"}), 500
+        print(f"[ERROR] Batch ingest failed: {str(e)}")
+        return jsonify({"error": f"Failed to queue batch ingest: {str(e)}"}), 500
+
+
+def answer_question(
+    url_hash: str,
+    url: str,
+    question: str,
+    language: str,
+    conversation: Optional[Conversation] = None
+) -> dict:
+    """Retrieve relevant chunks and generate an answer payload for /chat."""
+    # Follow-ups are expanded into a standalone query for retrieval
+    search_query = chatbot.condense_query(question, conversation)
+    
+    # Retrieve relevant chunks
+    print(f"[RAG] Searching for: {search_query}")
+    relevant_chunks = embedding_manager.search_with_scores(url_hash, search_query, top_k=5)
+    
+    if not relevant_chunks:
+        no_info_messages = {
+            'en': "I could not find this information on the website.",
+            'hi': "मुझे वेबसाइट पर यह जानकारी नहीं मिली।",
+            'te': "వెబ్‌సైట్‌లో ఈ సమాచారం కనుగొనలేకపోయాను."
+        }
+        chatbot.router.record('not_found')
+        return {
+            "answer": no_info_messages.get(language, no_info_messages['en']),
+            "sources": [],
+            "language": language,
+            "route": "not_found"
+        }
+    
+    print(f"[RAG] Found {len(relevant_chunks)} relevant chunks")
+    
+    # Generate answer using Gemini
+    result = chatbot.generate_response(
+        question=question,
+        context_chunks=relevant_chunks,
+        language=language,
+        website_url=url,
+        conversation=conversation,
+        search_query=search_query
+    )
+    
+    return {
+        "answer": result["answer"],
+        "sources": [hit["chunk"] for hit in relevant_chunks[:3]],  # Return top 3 sources
+        "language": language,
+        "url": url,
+        "route": result["route"],
+        "contextTokens": result["context_tokens"],
+        "historyTokens": result["history_tokens"]
+    }
 
 
 @app.route('/chat', methods=['POST'])
@@ -191,7 +648,8 @@ def chat():
         "question": "What services do you offer?",
         "url": "https://example.com",
         "userId": "user123",
-        "language": "en"  # en, hi, or te
+        "language": "en",  # en, hi, or te
+        "sessionId": "..."  # optional, from a previous /chat response
     }
     """
     try:
@@ -204,6 +662,7 @@ def chat():
         url = data.get('url')
         user_id = data.get('userId', 'anonymous')
         language = data.get('language', 'en')
+        session_id = data.get('sessionId')
         
         if not question:
             return jsonify({"error": "Question is required"}), 400
@@ -211,54 +670,51 @@ def chat():
         if not url:
             return jsonify({"error": "URL is required"}), 400
         
+        admission.check_rate('chat', client_id(user_id))
+        
         url_hash = get_url_hash(url)
         
         # Check if website is trained
-        if url_hash not in processed_websites:
+        website_data = site_registry.get(url_hash)
+        if website_data is None:
+            # Deleted or moved to another node; drop any copy this worker still holds
+            embedding_manager.delete_index(url_hash)
             return jsonify({
                 "error": "Website not found. Please process the website first."
             }), 404
         
-        website_data = processed_websites[url_hash]
-        
-        if website_data.get('status') != 'ready':
+        if website_data.get('status') != 'ready' or not ensure_index_loaded(url_hash, website_data):
             return jsonify({
                 "error": "Website is not ready. Please wait for training to complete."
             }), 400
         
-        # Retrieve relevant chunks
-        print(f"[RAG] Searching for: {question}")
-        relevant_chunks = embedding_manager.search(url_hash, question, top_k=5)
-        
-        if not relevant_chunks:
-            no_info_messages = {
-                'en': "I could not find this information on the website.",
-                'hi': "मुझे वेबसाइट पर यह जानकारी नहीं मिली।",
-                'te': "వెబ్‌సైట్‌లో ఈ సమాచారం కనుగొనలేకపోయాను."
-            }
-            return jsonify({
-                "answer": no_info_messages.get(language, no_info_messages['en']),
-                "sources": [],
-                "language": language
-            })
-        
-        print(f"[RAG] Found {len(relevant_chunks)} relevant chunks")
-        
-        # Generate answer using Gemini
-        answer = chatbot.generate_answer(
-            question=question,
-            context_chunks=relevant_chunks,
-            language=language,
-            website_url=url
-        )
-        
-        return jsonify({
-            "answer": answer,
-            "sources": relevant_chunks[:3],  # Return top 3 sources
-            "language": language,
-            "url": url
-        })
-        
+        # Unknown or expired sessions start a new conversation, flagged in the response
+        conversation = conversations.get(session_id, url_hash) if session_id else None
+        session_restarted = bool(session_id) and conversation is None
+        
+        if conversation and conversation.has_history():
+            # Answers depend on this session's history, so they can't be shared
+            payload = answer_question(url_hash, url, question, language, conversation)
+        else:
+            # Identical concurrent questions share one retrieval + generation
+            flight_key = make_key(url_hash, question, language)
+            payload, coalesced = chat_flight.do(
+                flight_key,
+                lambda: answer_question(url_hash, url, question, language)
+            )
+            if coalesced:
+                print(f"[RAG] Coalesced duplicate question for {url_hash}")
+            conversation = conversation or conversations.create(url_hash)
+        
+        conversations.add_turn(conversation, question, payload["answer"])
+        
+        payload = dict(payload, sessionId=conversation.session_id)
+        if session_restarted:
+            payload["sessionRestarted"] = True
+        return jsonify(payload)
+        
+    except Overloaded:
+        raise
     except Exception as e:
         print(f"[ERROR] Chat failed: {str(e)}")
         return jsonify({"error": f"Failed to generate response: {str(e)}"}), 500
@@ -271,38 +727,198 @@ def get_history(user_id: str):
     Note: In production, this would fetch from Firebase/database.
     """
     try:
-        # This endpoint is mostly handled by Firebase in the frontend
-        # This is a placeholder for any additional server-side history needs
+        # Chat history is mostly handled by Firebase in the frontend; the
+        # server only knows which websites the user has processed
+        websites = site_registry.list_for_user(user_id)
         return jsonify({
             "message": "History is managed by Firebase on the frontend",
-            "userId": user_id
+            "userId": user_id,
+            "websites": [
+                {
+                    "url": site["url"],
+                    "urlHash": site["url_hash"],
+                    "status": site["status"],
+                    "scrapedAt": site["scraped_at"],
+                    "trainedAt": site["trained_at"]
+                }
+                for site in websites
+            ]
         })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """Runtime counters for the chat pipeline."""
+    return jsonify({
+        "chatCoalescing": dict(chat_flight.stats),
+        "chatRoutes": dict(chatbot.router.stats),
+        "queryBatching": dict(embedding_manager.query_batcher.stats),
+        "jobs": job_queue.counts(),
+        "sites": site_registry.counts(),
+        "admission": admission.stats(),
+        "archive": page_archive.stats() if page_archive else None
+    })
+
+
 @app.route('/status/<url_hash>', methods=['GET'])
 def get_status(url_hash: str):
-    """Get the processing status of a website."""
+    """Get the processing status of a website, including any background job."""
     try:
-        if url_hash not in processed_websites:
+        website_data = site_registry.get(url_hash)
+        job = job_queue.latest_for(url_hash)
+        
+        if website_data is None and job is None:
             return jsonify({"error": "Website not found"}), 404
         
-        website_data = processed_websites[url_hash]
+        website_data = website_data or {}
+        status = website_data.get('status')
+        
+        # An active or failed job is more current than the stored status
+        if job and job["status"] in (QUEUED, RUNNING):
+            status = 'scraping' if job["kind"] == 'scrape' else 'training'
+        elif job and job["status"] == FAILED:
+            status = 'failed'
         
         return jsonify({
-            "url": website_data.get('url'),
-            "status": website_data.get('status'),
+            "url": website_data.get('url') or job["payload"].get("url"),
+            "status": status,
             "scrapedAt": website_data.get('scraped_at'),
             "trainedAt": website_data.get('trained_at'),
-            "chunksCount": website_data.get('chunks_count', 0)
+            "chunksCount": website_data.get('chunks_count', 0),
+            "job": job_to_json(job) if job else None,
+            "crawl": crawl_store.status(url_hash)
         })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id: str):
+    """Get a background job's progress."""
+    try:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(dict(job_to_json(job), urlHash=job["url_hash"]))
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Node-to-node API used by the shard router to move sites between nodes.
+# Disabled unless INTERNAL_TOKEN is set.
+INTERNAL_TOKEN = os.environ.get('INTERNAL_TOKEN') or None
+
+
+def internal_authorized() -> bool:
+    provided = request.headers.get('X-Internal-Token')
+    return bool(INTERNAL_TOKEN and provided and hmac.compare_digest(INTERNAL_TOKEN, provided))
+
+
+def _b64(blob: Optional[bytes]) -> Optional[str]:
+    return base64.b64encode(blob).decode('ascii') if blob is not None else None
+
+
+def _unb64(text: Optional[str]) -> Optional[bytes]:
+    return base64.b64decode(text) if text is not None else None
+
+
+def busy_sites() -> set:
+    """url_hash of every site with a queued or running job on this node."""
+    hashes = set()
+    for job in job_queue.active():
+        if job["kind"] == 'bulk_ingest':
+            hashes.update(get_url_hash(url) for url in job["payload"]["urls"])
+        else:
+            hashes.add(job["url_hash"])
+    return hashes
+
+
+@app.route('/internal/sites', methods=['GET'])
+def internal_list_sites():
+    """
+    url_hash of every site stored on this node, plus sites that only have
+    jobs in flight (they will be stored here once the jobs finish).
+    """
+    if not internal_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    busy = busy_sites()
+    return jsonify({"sites": sorted(set(site_registry.list_hashes()) | busy), "busy": sorted(busy)})
+
+
+@app.route('/internal/sites/<url_hash>', methods=['GET'])
+def internal_export_site(url_hash: str):
+    """
+    Export a site's metadata, content and index (compressed, base64).
+    
+    Answers 409 while the site has jobs in flight, so the router waits
+    for them instead of moving a half-processed site.
+    """
+    if not internal_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    
+    if url_hash in busy_sites():
+        return jsonify({"error": "Website has active jobs", "busy": True}), 409
+    
+    data = site_registry.export_site(url_hash)
+    if data is None:
+        return jsonify({"error": "Website not found"}), 404
+    
+    index = data["index"]
+    if index is not None:
+        index = dict(index, chunks=_b64(index["chunks"]), embeddings=_b64(index["embeddings"]))
+    archive = None
+    if page_archive:
+        archive = [dict(page, data=_b64(page["data"])) for page in page_archive.pages(url_hash)]
+    return jsonify({
+        "site": data["site"],
+        "content": _b64(data["content"]),
+        "index": index,
+        "archive": archive
+    })
+
+
+@app.route('/internal/sites/<url_hash>', methods=['PUT'])
+def internal_import_site(url_hash: str):
+    """Store a site exported by another node."""
+    if not internal_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    
+    data = request.get_json()
+    if not data or data.get("site", {}).get("url_hash") != url_hash:
+        return jsonify({"error": "Site data does not match url_hash"}), 400
+    
+    index = data.get("index")
+    if index is not None:
+        index = dict(index, chunks=_unb64(index["chunks"]), embeddings=_unb64(index["embeddings"]))
+    site_registry.import_site({"site": data["site"], "content": _unb64(data.get("content")), "index": index})
+    if page_archive and data.get("archive") is not None:
+        page_archive.import_pages(url_hash, [dict(page, data=_unb64(page["data"])) for page in data["archive"]])
+    print(f"[SHARD] Imported site {url_hash}")
+    return jsonify({"success": True, "urlHash": url_hash})
+
+
+@app.route('/internal/sites/<url_hash>', methods=['DELETE'])
+def internal_delete_site(url_hash: str):
+    """Drop a site that now belongs to another node (409 while it has jobs in flight)."""
+    if not internal_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    
+    if url_hash in busy_sites():
+        return jsonify({"error": "Website has active jobs", "busy": True}), 409
+    
+    deleted = site_registry.delete_site(url_hash)
+    embedding_manager.delete_index(url_hash)
+    if page_archive:
+        page_archive.delete_site(url_hash)
+    print(f"[SHARD] Removed site {url_hash}")
+    return jsonify({"success": True, "deleted": deleted})
+
+
 @app.errorhandler(404)
 def not_found(e):
     return jsonify({"error": "Endpoint not found"}), 404
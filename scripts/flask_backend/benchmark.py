@@ -0,0 +1,345 @@
+"""
+Benchmark Module
+Offline, reproducible benchmarks for the crawl -> chunk -> embed -> index ->
+search -> chat pipeline against a synthetic site served from localhost.
+
+Usage:
+    python benchmark.py --pages 50 --queries 200 --output results.json
+"""
+
+import os
+import sys
+import json
+import time
+import contextlib
+import random
+import argparse
+import platform
+import resource
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import numpy as np
+
+# Keep the chatbot from configuring a real Gemini client
+for _key in ('GOOGLE_GENERATIVE_AI_API_KEY', 'GEMINI_API_KEY'):
+    os.environ.pop(_key, None)
+
+# Pipeline modules log to stdout (also at import); keep it clean for JSON results
+with contextlib.redirect_stdout(sys.stderr):
+    from scraper import WebScraper
+    from embeddings import EmbeddingManager, FAISS_AVAILABLE, QueryBatcher, SimpleEmbedder, assign_pages
+    from rag_chat import RAGChatbot
+
+TOPICS = [
+    'pricing', 'support', 'shipping', 'returns', 'warranty', 'installation',
+    'security', 'privacy', 'integrations', 'billing', 'accounts', 'reporting',
+    'onboarding', 'training', 'hardware', 'mobile', 'api', 'compliance'
+]
+
+WORDS = (
+    'customer team plan service product feature option account update data '
+    'request order delivery contract invoice device access level policy '
+    'month year week hour minute standard premium basic enterprise trial'
+).split()
+
+
+class FixtureSite:
+    """Deterministic multi-page website served from memory on localhost."""
+
+    def __init__(self, pages: int, paragraphs: int, seed: int):
+        rng = random.Random(seed)
+        self.pages: Dict[str, str] = {}
+        self.facts: List[Dict[str, str]] = []
+
+        for page in range(pages):
+            topic = TOPICS[page % len(TOPICS)]
+            body = []
+            for para in range(paragraphs):
+                words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(25, 45)))
+                fact = f"The {topic} detail {page}-{para} is {rng.randint(10, 999)} units."
+                self.facts.append({"question": f"What is the {topic} detail {page}-{para}?", "answer": fact})
+                body.append(f"<p>{fact} {words.capitalize()}.</p>")
+            links = ''.join(
+                f'<a href="/page-{(page + step) % pages}.html">{TOPICS[(page + step) % len(TOPICS)]}</a>'
+                for step in (1, 2, 3)
+            )
+            self.pages[f"/page-{page}.html"] = (
+                f"<html><head><title>{topic.title()} page {page}</title>"
+                f'<meta name="description" content="All about {topic}."></head>'
+                f"<body><main><h1>{topic.title()}</h1>{''.join(body)}{links}</main></body></html>"
+            )
+        self.pages["/"] = self.pages["/page-0.html"]
+        self.server = None
+
+    def start(self) -> str:
+        pages = self.pages
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                html = pages.get(self.path)
+                if html is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                data = html.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_port}/"
+
+    def stop(self) -> None:
+        if self.server:
+            self.server.shutdown()
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubModel:
+    """Stand-in for the Gemini model with a fixed latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, prompt, generation_config=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return StubResponse(f"Stub answer ({len(prompt)} prompt chars).")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    return float(np.percentile(values, pct)) if values else 0.0
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    ms = [s * 1000 for s in seconds]
+    return {
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "mean_ms": round(float(np.mean(ms)), 3) if ms else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 2)
+
+
+def exact_top_k(embeddings: np.ndarray, query: np.ndarray, k: int) -> List[int]:
+    """Brute-force cosine top-k, the ground truth for recall."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    q = query / (np.linalg.norm(query) or 1)
+    scores = (embeddings / norms) @ q
+    return list(np.argsort(-scores)[:k])
+
+
+def concurrent_encode(batcher: QueryBatcher, queries: List[str], threads: int) -> Dict:
+    """Encode queries from concurrent threads; returns throughput and latency."""
+    latencies: List[float] = []
+    lock = threading.Lock()
+    pending = list(queries)
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                query = pending.pop()
+            started = time.perf_counter()
+            batcher.encode(query)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - started
+    return dict(
+        latency_summary(latencies),
+        queries_per_sec=round(len(queries) / seconds, 2) if seconds else 0.0,
+        batches=batcher.stats["batches"],
+    )
+
+
+def run(args) -> Dict:
+    rng = random.Random(args.seed)
+    site = FixtureSite(args.pages, args.paragraphs, args.seed)
+    base_url = site.start()
+    results: Dict = {
+        "config": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "faiss": FAISS_AVAILABLE,
+        },
+    }
+
+    try:
+        # Crawl
+        scraper = WebScraper()
+        scraper.max_pages = args.pages
+        scraper.request_delay = args.crawl_delay
+        started = time.perf_counter()
+        content = scraper.scrape_website(base_url)
+        crawl_seconds = time.perf_counter() - started
+        pages_crawled = len(scraper.visited_urls)
+        results["crawl"] = {
+            "pages": pages_crawled,
+            "seconds": round(crawl_seconds, 4),
+            "pages_per_sec": round(pages_crawled / crawl_seconds, 2) if crawl_seconds else 0.0,
+            "content_chars": len(content),
+        }
+
+        # Chunk
+        manager = EmbeddingManager()
+        if args.hierarchical_min_chunks is not None:
+            manager.hierarchical_min_chunks = args.hierarchical_min_chunks
+        results["environment"]["embedder"] = (
+            'simple' if isinstance(manager.model, SimpleEmbedder) else manager.model_name
+        )
+        started = time.perf_counter()
+        chunks = manager.chunk_text(content)
+        chunk_seconds = time.perf_counter() - started
+        results["chunk"] = {
+            "chunks": len(chunks),
+            "seconds": round(chunk_seconds, 4),
+            "chunks_per_sec": round(len(chunks) / chunk_seconds, 2) if chunk_seconds else 0.0,
+        }
+
+        # Embed
+        started = time.perf_counter()
+        embeddings = manager.create_embeddings(chunks)
+        embed_seconds = time.perf_counter() - started
+        results["embed"] = {
+            "seconds": round(embed_seconds, 4),
+            "chunks_per_sec": round(len(chunks) / embed_seconds, 2) if embed_seconds else 0.0,
+            "dimension": int(embeddings.shape[1]),
+        }
+
+        # Index build (includes re-embedding, as in /train-website)
+        index_id = 'benchmark'
+        started = time.perf_counter()
+        manager.create_index(index_id, chunks)
+        results["index"] = {"seconds": round(time.perf_counter() - started, 4)}
+
+        # Search latency and recall@k against exact search
+        sample = rng.sample(site.facts, min(args.queries, len(site.facts)))
+        queries = [fact["question"] for fact in sample]
+        page_ids = assign_pages(chunks)
+        page_index = manager.page_indices.get(index_id)
+        search_seconds = []
+        recalls = []
+        distinct_pages = []
+        for query in queries:
+            started = time.perf_counter()
+            hits = manager.search_with_scores(index_id, query, top_k=args.top_k)
+            search_seconds.append(time.perf_counter() - started)
+
+            query_vector = manager.create_embeddings([query])[0]
+            truth = set(exact_top_k(embeddings, query_vector, args.top_k))
+            found = {hit["position"] for hit in hits}
+            recalls.append(len(truth & found) / len(truth) if truth else 1.0)
+            distinct_pages.append(len({page_ids[position] for position in found}))
+
+        results["search"] = dict(
+            latency_summary(search_seconds),
+            queries=len(queries),
+            top_k=args.top_k,
+            recall_at_k=round(float(np.mean(recalls)), 4) if recalls else 0.0,
+            distinct_pages_at_k=round(float(np.mean(distinct_pages)), 2) if distinct_pages else 0.0,
+            mode='hierarchical' if page_index else 'flat',
+            pages=len(page_index["members"]) if page_index else len(set(page_ids)),
+        )
+
+        # Query encoding from concurrent requests, one by one vs micro-batched
+        encode_queries = [queries[i % len(queries)] for i in range(args.queries)]
+        results["query_encode"] = {
+            "threads": args.query_threads,
+            "unbatched": concurrent_encode(
+                QueryBatcher(manager.create_embeddings, max_wait=0), encode_queries, args.query_threads
+            ),
+            "batched": concurrent_encode(
+                QueryBatcher(manager.create_embeddings, max_batch=args.query_batch_size,
+                             max_wait=args.query_batch_wait_ms / 1000),
+                encode_queries, args.query_threads
+            ),
+        }
+
+        # Chat with a stubbed LLM
+        chatbot = RAGChatbot()
+        chatbot.model = StubModel(args.llm_latency)
+        chat_seconds = []
+        routes: Dict[str, int] = {}
+        for query in queries[:args.chat_queries]:
+            started = time.perf_counter()
+            hits = manager.search_with_scores(index_id, query, top_k=5)
+            response = chatbot.generate_response(query, hits, 'en', base_url)
+            chat_seconds.append(time.perf_counter() - started)
+            routes[response["route"]] = routes.get(response["route"], 0) + 1
+
+        results["chat"] = dict(
+            latency_summary(chat_seconds),
+            requests=len(chat_seconds),
+            llm_calls=chatbot.model.calls,
+            routes=routes,
+        )
+
+        results["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        site.stop()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks for the Flask backend")
+    parser.add_argument('--pages', type=int, default=30, help='Pages in the fixture site')
+    parser.add_argument('--paragraphs', type=int, default=20, help='Paragraphs per page')
+    parser.add_argument('--queries', type=int, default=200, help='Search queries to time')
+    parser.add_argument('--chat-queries', type=int, default=50, help='Chat requests to time')
+    parser.add_argument('--query-threads', type=int, default=16, help='Concurrent callers for query encoding')
+    parser.add_argument('--query-batch-size', type=int, default=32, help='Max queries per encode batch')
+    parser.add_argument('--query-batch-wait-ms', type=float, default=2.0, help='Max wait to fill an encode batch')
+    parser.add_argument('--hierarchical-min-chunks', type=int, default=None,
+                        help='Chunk count from which search is two-stage (default: HIERARCHICAL_MIN_CHUNKS)')
+    parser.add_argument('--top-k', type=int, default=5, help='k for search latency and recall@k')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='Stub LLM latency in seconds')
+    parser.add_argument('--crawl-delay', type=float, default=0.0, help='Scraper politeness delay in seconds')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the fixture site and query sample')
+    parser.add_argument('--output', help='Write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args)
+    output = json.dumps(results, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+        print(f"[BENCHMARK] Results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
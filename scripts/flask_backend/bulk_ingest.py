@@ -0,0 +1,377 @@
+"""
+Bulk Ingest Module
+Scrapes and trains many websites in one job: hosts are crawled concurrently,
+parsing and chunking run in a process pool, and all chunks are embedded
+through the shared model in large batches. Sites can also be reprocessed
+from the page archive without crawling.
+"""
+
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+from scraper import WebScraper, combine_pages, parse_html
+from embeddings import EmbeddingManager, split_text
+from site_registry import SiteRegistry
+from crawl_state import CrawlCheckpointStore
+from page_archive import PageArchive, decompress
+from admission import admission
+from metrics import metrics
+
+# Sites smaller than this are treated as failed scrapes, as in /scrape-website
+MIN_CONTENT_LENGTH = 100
+
+
+def extract_archived(url: str, data: bytes, codec: str, encoding: Optional[str]) -> str:
+    """Text of an archived page (module-level so it can run in a process pool)."""
+    html = decompress(data, codec).decode(encoding or 'utf-8', errors='replace')
+    text, _ = parse_html(html, url, with_links=False)
+    return text
+
+
+class BulkIngestor:
+    """
+    Runs the scrape -> chunk -> embed -> index pipeline for a batch of URLs.
+
+    Each host gets one crawler thread (so per-host politeness delays still
+    apply) and up to crawl_threads hosts are crawled at once. HTML parsing
+    and chunking are CPU-bound and go to a pool of processes, one per core
+    by default, started on first use and shared by every job until close().
+    Workers are started by a forkserver (spawn where that's unavailable)
+    rather than forked from a server process that holds the embedding
+    model and running threads. Chunks from every site are queued into one buffer that is
+    embedded embed_batch_size at a time, so the model sees full batches
+    regardless of how small individual sites are, and embedding overlaps
+    with the crawls still in progress.
+    """
+
+    def __init__(
+        self,
+        embedding_manager: EmbeddingManager,
+        site_registry: SiteRegistry,
+        crawl_threads: int = 8,
+        processes: Optional[int] = None,
+        embed_batch_size: int = 1024,
+        max_pages: int = 10,
+        request_delay: float = 0.5,
+        crawl_store: Optional[CrawlCheckpointStore] = None,
+        archive: Optional[PageArchive] = None
+    ):
+        self.embedding_manager = embedding_manager
+        self.site_registry = site_registry
+        self.crawl_threads = crawl_threads
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.embed_batch_size = embed_batch_size
+        self.max_pages = max_pages
+        self.request_delay = request_delay
+        self.crawl_store = crawl_store
+        self.archive = archive
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        """The shared process pool, started on first use; None when processes is 0."""
+        if self.processes <= 0:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context(method)
+                )
+            return self._pool
+
+    def _run(self, pool: ProcessPoolExecutor, func: Callable, *iterables) -> List:
+        """
+        Map func over iterables in the pool. If a worker died the pool is
+        broken for good, so it is dropped and the next call starts a new one.
+        """
+        try:
+            return list(pool.map(func, *iterables))
+        except BrokenProcessPool:
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False)
+            raise
+
+    def close(self) -> None:
+        """Shut down the process pool."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def ingest(
+        self,
+        sites: List[Dict],
+        user_id: str,
+        report: Optional[Callable] = None,
+        from_archive: bool = False
+    ) -> Dict:
+        """
+        Scrape, chunk, embed and index a batch of websites.
+
+        A failure on one site is recorded in its result and does not stop
+        the others. Each site is saved to the registry (scraped, then ready)
+        as soon as its own chunks are embedded.
+
+        Args:
+            sites: List of {"url", "url_hash"} dicts, optionally with "user_id"
+            user_id: Owner recorded in the site registry for sites without one
+            report: Optional job progress callback, report(phase, done, total, **counters)
+            from_archive: Extract pages from the page archive instead of
+                          crawling (see reprocess)
+
+        Returns:
+            Dict with per-URL "results" and aggregate "throughput"
+        """
+        started = time.perf_counter()
+        results = {
+            site["url_hash"]: {"url": site["url"], "urlHash": site["url_hash"], "status": "pending"}
+            for site in sites
+        }
+        counters = {"pages_fetched": 0, "chunks_total": 0, "chunks_embedded": 0, "sites_done": 0}
+        counters_lock = threading.Lock()
+        chunked: "queue.Queue[Tuple[Dict, Optional[List[str]]]]" = queue.Queue()
+        embed_seconds = 0.0
+        embed_batches = 0
+
+        def publish() -> None:
+            if report:
+                with counters_lock:
+                    snapshot = dict(counters)
+                report("ingesting", snapshot["sites_done"], len(sites), sites_total=len(sites), **snapshot)
+
+        pool = self._get_pool()
+
+        def parse(html: str, url: str, with_links: bool) -> Tuple[str, List[str]]:
+            if pool is None:
+                return parse_html(html, url, with_links)
+            return self._run(pool, parse_html, [html], [url], [with_links])[0]
+
+        def chunk(content: str) -> List[str]:
+            if pool is None:
+                return split_text(content)
+            return self._run(pool, split_text, [content])[0]
+
+        def load_archived(site: Dict, result: Dict) -> str:
+            pages = self.archive.pages(site["url_hash"])
+            if not pages:
+                raise ValueError("No archived pages for this website")
+            args = [(page["url"], page["data"], page["codec"], page["encoding"]) for page in pages]
+            with metrics.timer('parse'):
+                if pool is None:
+                    texts = [extract_archived(*arg) for arg in args]
+                else:
+                    texts = self._run(pool, extract_archived, *zip(*args))
+            with counters_lock:
+                counters["pages_fetched"] += len(pages)
+            result["pages"] = len(pages)
+            # Same filter as the crawler applies to freshly fetched pages
+            return combine_pages([text for text in texts if text and len(text) > 100])
+
+        def crawl_host(host_sites: List[Dict]) -> None:
+            # Stage metrics from this thread are labeled like the job's own
+            metrics.start_request('job:bulk_ingest')
+            scraper = WebScraper()
+            scraper.max_pages = self.max_pages
+            scraper.request_delay = self.request_delay
+
+            def page_done(done: int, total: int) -> None:
+                with counters_lock:
+                    counters["pages_fetched"] += 1
+
+            try:
+                for site in host_sites:
+                    result = results[site["url_hash"]]
+                    site_started = time.perf_counter()
+                    checkpoint = None
+                    try:
+                        if from_archive:
+                            content = load_archived(site, result)
+                        else:
+                            checkpoint = self.crawl_store.open(site["url_hash"], site["url"]) if self.crawl_store else None
+                            if self.archive and not (checkpoint and checkpoint.resumed):
+                                self.archive.discard(site["url_hash"])
+                            on_fetch = partial(self.archive.put_response, site["url_hash"]) if self.archive else None
+                            with admission.slot('crawl', background=True):
+                                content = scraper.scrape_website(
+                                    site["url"], progress=page_done, parse=parse,
+                                    checkpoint=checkpoint, on_fetch=on_fetch
+                                )
+                            result["pages"] = len(scraper.visited_urls)
+                        result["contentLength"] = len(content)
+                        if not content or len(content.strip()) < MIN_CONTENT_LENGTH:
+                            raise ValueError("Could not extract meaningful content from the website")
+                        self.site_registry.save_scraped(
+                            site["url_hash"], site["url"], site.get("user_id", user_id), content
+                        )
+                        if checkpoint:
+                            self.crawl_store.discard(site["url_hash"])
+                        if self.archive and not from_archive:
+                            self.archive.commit(site["url_hash"], scraper.visited_urls)
+
+                        with metrics.timer('chunk'):
+                            chunks = chunk(content)
+                        if not chunks:
+                            raise ValueError("No chunks created from the website content")
+                        result["chunks"] = len(chunks)
+                        result["crawlSeconds"] = round(time.perf_counter() - site_started, 3)
+                        chunked.put((site, chunks))
+                    except Exception as e:
+                        print(f"[BULK] Failed to ingest {site['url']}: {str(e)}")
+                        if self.archive and not from_archive:
+                            self.archive.discard(site["url_hash"])  # no-op once committed
+                        result["status"] = "failed"
+                        result["error"] = str(e)
+                        chunked.put((site, None))
+            finally:
+                metrics.end_request()
+
+        # One crawler per host, so a host is never hit by two crawls at once;
+        # archived sites need no politeness and each get their own
+        by_host: Dict[str, List[Dict]] = {}
+        for site in sites:
+            key = site["url_hash"] if from_archive else urlparse(site["url"]).netloc
+            by_host.setdefault(key, []).append(site)
+
+        # Chunks waiting for a full embedding batch, as (url_hash, chunk)
+        pending: List[Tuple[str, str]] = []
+        vectors: Dict[str, List[np.ndarray]] = {}
+        embedded_counts: Dict[str, int] = {}
+        site_chunks: Dict[str, List[str]] = {}
+
+        def finish_site(url_hash: str) -> None:
+            result = results[url_hash]
+            try:
+                chunks = site_chunks.pop(url_hash)
+                embeddings = np.vstack(vectors.pop(url_hash))
+                embedded_counts.pop(url_hash)
+                self.embedding_manager.load_index(url_hash, chunks, embeddings)
+                version = self.site_registry.save_index(url_hash, chunks, embeddings)
+                self.embedding_manager.index_versions[url_hash] = version
+                result["status"] = "ready"
+            except Exception as e:
+                print(f"[BULK] Failed to index {result['url']}: {str(e)}")
+                result["status"] = "failed"
+                result["error"] = str(e)
+            with counters_lock:
+                counters["sites_done"] += 1
+
+        def embed_pending(limit: int) -> None:
+            nonlocal embed_seconds, embed_batches
+            batch, pending[:] = pending[:limit], pending[limit:]
+            if not batch:
+                return
+            batch_started = time.perf_counter()
+            with admission.slot('embed', background=True, heartbeat=publish):
+                embedded = self.embedding_manager.create_embeddings([text for _, text in batch])
+            embed_seconds += time.perf_counter() - batch_started
+            embed_batches += 1
+
+            completed = []
+            start = 0
+            while start < len(batch):
+                # Runs of consecutive chunks from the same site
+                url_hash = batch[start][0]
+                end = start
+                while end < len(batch) and batch[end][0] == url_hash:
+                    end += 1
+                vectors[url_hash].append(embedded[start:end])
+                embedded_counts[url_hash] += end - start
+                if embedded_counts[url_hash] == len(site_chunks[url_hash]):
+                    completed.append(url_hash)
+                start = end
+            with counters_lock:
+                counters["chunks_embedded"] += len(batch)
+            for url_hash in completed:
+                finish_site(url_hash)
+
+        print(f"[BULK] {'Reprocessing' if from_archive else 'Ingesting'} {len(sites)} sites across {len(by_host)} hosts "
+              f"({self.processes} processes)")
+        publish()
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.crawl_threads, len(by_host)))) as crawlers:
+            futures = [crawlers.submit(crawl_host, host_sites) for host_sites in by_host.values()]
+
+            received = 0
+            while received < len(sites):
+                try:
+                    site, chunks = chunked.get(timeout=1.0)
+                except queue.Empty:
+                    if all(future.done() for future in futures):
+                        break  # a crawler died without reporting its sites
+                    publish()
+                    continue
+                received += 1
+
+                if chunks is None:
+                    with counters_lock:
+                        counters["sites_done"] += 1
+                else:
+                    url_hash = site["url_hash"]
+                    site_chunks[url_hash] = chunks
+                    vectors[url_hash] = []
+                    embedded_counts[url_hash] = 0
+                    pending.extend((url_hash, text) for text in chunks)
+                    with counters_lock:
+                        counters["chunks_total"] += len(chunks)
+
+                # Embed whole batches while crawls continue; flush the rest at the end
+                while len(pending) >= self.embed_batch_size:
+                    embed_pending(self.embed_batch_size)
+                publish()
+
+            for future in futures:
+                future.result()
+
+        while pending:
+            embed_pending(self.embed_batch_size)
+
+        publish()
+        elapsed = time.perf_counter() - started
+        succeeded = sum(1 for r in results.values() if r["status"] == "ready")
+        throughput = {
+            "sites": len(sites),
+            "succeeded": succeeded,
+            "failed": len(sites) - succeeded,
+            "pages": counters["pages_fetched"],
+            "chunks": counters["chunks_embedded"],
+            "embedBatches": embed_batches,
+            "seconds": round(elapsed, 3),
+            "embedSeconds": round(embed_seconds, 3),
+            "pagesPerSec": round(counters["pages_fetched"] / elapsed, 2) if elapsed else 0.0,
+            "chunksPerSec": round(counters["chunks_embedded"] / elapsed, 2) if elapsed else 0.0,
+            "processes": self.processes,
+        }
+        print(f"[BULK] Done: {succeeded}/{len(sites)} sites, {counters['pages_fetched']} pages, "
+              f"{counters['chunks_embedded']} chunks in {elapsed:.1f}s")
+
+        return {"results": list(results.values()), "throughput": throughput}
+
+    def reprocess(self, sites: List[Dict], report: Optional[Callable] = None) -> Dict:
+        """
+        Re-run extraction, chunking and embedding for sites from the page
+        archive, with no network I/O.
+
+        Args:
+            sites: List of {"url", "url_hash", "user_id"} dicts
+            report: Optional job progress callback
+
+        Returns:
+            Same shape as ingest()
+        """
+        if self.archive is None:
+            raise ValueError("No page archive configured")
+        return self.ingest(sites, "anonymous", report, from_archive=True)
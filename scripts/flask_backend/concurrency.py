@@ -0,0 +1,50 @@
+"""
+Concurrency Module
+Helpers for running the backend under cooperative (gevent) workers.
+"""
+
+import os
+from typing import Any, Callable
+
+# gevent is optional: without it the backend runs on plain sync workers
+try:
+    import gevent
+    from gevent import monkey
+    GEVENT_AVAILABLE = True
+except ImportError:
+    GEVENT_AVAILABLE = False
+
+# Native threads used for CPU-bound work while greenlets keep serving
+EXECUTOR_THREADS = int(os.environ.get('EXECUTOR_THREADS', '4'))
+
+# Outbound HTTP connection pool size per session
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '50'))
+
+
+def is_cooperative() -> bool:
+    """Check whether we're running under gevent with patched sockets."""
+    return GEVENT_AVAILABLE and monkey.is_module_patched('socket')
+
+
+def run_in_executor(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a CPU-bound call without blocking other requests.
+
+    Under gevent the call is handed to the hub's native thread pool so the
+    event loop keeps serving other greenlets while it runs. Under sync
+    workers there is nothing else to serve, so the call runs inline.
+
+    Args:
+        func: Callable to run
+        *args, **kwargs: Arguments forwarded to func
+
+    Returns:
+        Whatever func returns
+    """
+    if not is_cooperative():
+        return func(*args, **kwargs)
+
+    pool = gevent.get_hub().threadpool
+    if pool.maxsize != EXECUTOR_THREADS:
+        pool.maxsize = EXECUTOR_THREADS
+    return pool.apply(func, args, kwargs)
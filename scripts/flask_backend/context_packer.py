@@ -0,0 +1,169 @@
+"""
+Context Packer Module
+Packs retrieved chunks into a deduplicated, token-budgeted prompt context.
+"""
+
+from typing import List, Dict, Union
+
+# Minimum suffix/prefix match treated as chunk overlap rather than coincidence
+MIN_OVERLAP_CHARS = 20
+
+# Separator between non-contiguous spans in the packed context
+SPAN_SEPARATOR = "\n\n---\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token for Latin text)."""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+def _overlap_length(left: str, right: str, max_overlap: int) -> int:
+    """Length of the longest suffix of left that is also a prefix of right."""
+    limit = min(len(left), len(right), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_overlapping(left: str, right: str, max_overlap: int = 400) -> str:
+    """
+    Join two chunks, dropping the text right repeats from the end of left.
+
+    chunk_text prefixes each chunk with the tail of its predecessor, so
+    adjacent hits share up to chunk_overlap characters.
+    """
+    right_stripped = right.lstrip()
+    overlap = _overlap_length(left, right_stripped, max_overlap)
+    if overlap:
+        return left + right_stripped[overlap:]
+    return left + " " + right_stripped
+
+
+class ContextPacker:
+    """Merges adjacent chunks into spans and fills a token budget in score order."""
+
+    def __init__(self, token_budget: int = 1500, max_overlap: int = 400):
+        self.token_budget = token_budget
+        self.max_overlap = max_overlap
+
+    def _normalize_hits(self, hits: List[Union[str, Dict]]) -> List[Dict]:
+        """Accept plain chunk strings or search hits with score/position."""
+        normalized = []
+        for rank, hit in enumerate(hits):
+            if isinstance(hit, str):
+                hit = {"chunk": hit}
+            normalized.append({
+                "chunk": hit.get("chunk", ""),
+                # Plain strings arrive in score order; keep that order
+                "score": hit.get("score", -float(rank)),
+                "position": hit.get("position"),
+            })
+        return normalized
+
+    def _build_spans(self, hits: List[Dict]) -> List[Dict]:
+        """Merge hits at consecutive chunk positions into contiguous spans."""
+        positioned = sorted(
+            (h for h in hits if h["position"] is not None),
+            key=lambda h: h["position"]
+        )
+        spans = []
+        for hit in positioned:
+            last = spans[-1] if spans else None
+            if last and hit["position"] == last["end"] + 1:
+                last["text"] = merge_overlapping(last["text"], hit["chunk"], self.max_overlap)
+                last["end"] = hit["position"]
+                last["score"] = max(last["score"], hit["score"])
+                last["chunks"] += 1
+            else:
+                spans.append({
+                    "text": hit["chunk"],
+                    "start": hit["position"],
+                    "end": hit["position"],
+                    "score": hit["score"],
+                    "chunks": 1,
+                })
+
+        # Without positions, fall back to textual overlap detection
+        for hit in hits:
+            if hit["position"] is not None:
+                continue
+            for span in spans:
+                if span["start"] is None and _overlap_length(span["text"], hit["chunk"].lstrip(), self.max_overlap):
+                    span["text"] = merge_overlapping(span["text"], hit["chunk"], self.max_overlap)
+                    span["score"] = max(span["score"], hit["score"])
+                    span["chunks"] += 1
+                    break
+            else:
+                spans.append({
+                    "text": hit["chunk"],
+                    "start": None,
+                    "end": None,
+                    "score": hit["score"],
+                    "chunks": 1,
+                })
+
+        return spans
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text to roughly max_tokens, preferring a sentence boundary."""
+        max_chars = max_tokens * 4
+        if len(text) <= max_chars:
+            return text
+        cut = text[:max_chars]
+        boundary = max(cut.rfind('. '), cut.rfind('! '), cut.rfind('? '))
+        if boundary > max_chars // 2:
+            return cut[:boundary + 1]
+        return cut
+
+    def pack(self, hits: List[Union[str, Dict]], token_budget: int = None) -> Dict:
+        """
+        Pack retrieved chunks into a single context string.
+
+        Args:
+            hits: Chunk strings (in score order) or dicts with
+                  'chunk', 'score' and optional 'position'
+            token_budget: Override for the configured budget
+
+        Returns:
+            Dict with 'context', 'tokens', 'spans' and 'chunks' used
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        spans = self._build_spans(self._normalize_hits(hits))
+        spans.sort(key=lambda s: s["score"], reverse=True)
+
+        selected: List[str] = []
+        tokens_used = 0
+        chunks_used = 0
+        separator_tokens = estimate_tokens(SPAN_SEPARATOR)
+
+        for span in spans:
+            text = span["text"].strip()
+            if not text:
+                continue
+
+            # Drop spans whose text is already present (e.g. repeated boilerplate)
+            if any(text in kept for kept in selected):
+                continue
+
+            cost = estimate_tokens(text) + (separator_tokens if selected else 0)
+            if tokens_used + cost > budget:
+                # Always send something: trim the best span to fit
+                if not selected:
+                    text = self._truncate(text, budget)
+                    cost = estimate_tokens(text)
+                else:
+                    continue
+
+            selected.append(text)
+            tokens_used += cost
+            chunks_used += span["chunks"]
+
+        return {
+            "context": SPAN_SEPARATOR.join(selected),
+            "tokens": tokens_used,
+            "spans": len(selected),
+            "chunks": chunks_used,
+        }
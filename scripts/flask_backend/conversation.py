@@ -0,0 +1,220 @@
+"""
+Conversation Module
+Server-side chat sessions with a bounded, incrementally summarized history,
+stored in SQLite so every worker process sees every session.
+"""
+
+import re
+import json
+import time
+import uuid
+import threading
+from typing import List, Dict, Optional
+
+from context_packer import estimate_tokens
+from db import connect, ensure_parent_dir, transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    session_id TEXT PRIMARY KEY,
+    url_hash TEXT NOT NULL,
+    turns TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    turn_count INTEGER NOT NULL,
+    last_active REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_last_active_idx ON conversations (last_active);
+"""
+
+
+def _first_sentence(text: str, max_chars: int = 200) -> str:
+    """First sentence of text, capped at max_chars."""
+    text = re.sub(r'\s+', ' ', text or '').strip()
+    match = re.match(r'(.+?[.!?।])(\s|$)', text)
+    sentence = match.group(1) if match else text
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars].rstrip() + "..."
+    return sentence
+
+
+class Conversation:
+    """
+    One chat session. Recent turns are kept verbatim within history_budget
+    tokens; each turn that falls out of that window is compacted into a
+    one-line entry of the rolling summary, which is itself capped at
+    summary_budget tokens. Only the evicted turn is processed, so the cost
+    of adding a turn doesn't grow with conversation length.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        url_hash: str,
+        history_budget: int = 600,
+        summary_budget: int = 300
+    ):
+        self.session_id = session_id
+        self.url_hash = url_hash
+        self.history_budget = history_budget
+        self.summary_budget = summary_budget
+        self.turns: List[Dict[str, str]] = []
+        self.summary_lines: List[str] = []
+        self.turn_count = 0
+        self.last_active = time.time()
+        self._lock = threading.Lock()
+
+    def _turn_tokens(self, turn: Dict[str, str]) -> int:
+        return estimate_tokens(turn["question"]) + estimate_tokens(turn["answer"])
+
+    def _compact_turn(self, turn: Dict[str, str]) -> str:
+        """Reduce a turn to a single summary line."""
+        return f"- Q: {_first_sentence(turn['question'], 150)} A: {_first_sentence(turn['answer'])}"
+
+    def add_turn(self, question: str, answer: str) -> None:
+        """Record a turn and compact older turns into the summary."""
+        # A single oversized answer must not blow the whole history budget
+        max_answer_chars = max(200, self.history_budget * 2)
+        if len(answer) > max_answer_chars:
+            answer = answer[:max_answer_chars].rstrip() + "..."
+
+        with self._lock:
+            self.turns.append({"question": question, "answer": answer})
+            self.turn_count += 1
+            self.last_active = time.time()
+
+            while len(self.turns) > 1 and sum(self._turn_tokens(t) for t in self.turns) > self.history_budget:
+                self.summary_lines.append(self._compact_turn(self.turns.pop(0)))
+
+            while len(self.summary_lines) > 1 and estimate_tokens("\n".join(self.summary_lines)) > self.summary_budget:
+                self.summary_lines.pop(0)
+
+    def last_question(self) -> Optional[str]:
+        """The most recent user question, if any."""
+        with self._lock:
+            return self.turns[-1]["question"] if self.turns else None
+
+    def has_history(self) -> bool:
+        return self.turn_count > 0
+
+    def render(self) -> str:
+        """History text for the prompt: rolling summary, then recent turns."""
+        with self._lock:
+            parts = []
+            if self.summary_lines:
+                parts.append("Earlier in this conversation:\n" + "\n".join(self.summary_lines))
+            if self.turns:
+                recent = "\n".join(
+                    f"User: {t['question']}\nAssistant: {t['answer']}" for t in self.turns
+                )
+                parts.append("Recent messages:\n" + recent)
+            return "\n\n".join(parts)
+
+
+class ConversationStore:
+    """
+    Chat sessions shared by every worker process through SQLite.
+
+    A follow-up may land on any worker, so each turn is applied to the
+    session's stored state inside a write transaction. Sessions idle for
+    longer than ttl_seconds expire; beyond max_sessions the least recently
+    active are dropped. Both are enforced by a sweep run at most once per
+    sweep_interval seconds when sessions are created.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_sessions: int = 10000,
+        ttl_seconds: float = 1800,
+        history_budget: int = 600,
+        summary_budget: int = 300,
+        sweep_interval: float = 60
+    ):
+        self.db_path = db_path
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.history_budget = history_budget
+        self.summary_budget = summary_budget
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        ensure_parent_dir(db_path)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return connect(self.db_path)
+
+    def _load(self, conversation: Conversation, row) -> None:
+        with conversation._lock:
+            conversation.turns = json.loads(row["turns"])
+            conversation.summary_lines = json.loads(row["summary"])
+            conversation.turn_count = row["turn_count"]
+            conversation.last_active = row["last_active"]
+
+    def sweep(self) -> int:
+        """Delete expired sessions and those over max_sessions. Returns the number deleted."""
+        with self._connect() as conn, transaction(conn):
+            deleted = conn.execute(
+                "DELETE FROM conversations WHERE last_active < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            deleted += conn.execute(
+                "DELETE FROM conversations WHERE session_id IN ("
+                "SELECT session_id FROM conversations ORDER BY last_active DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            ).rowcount
+        self._last_sweep = time.monotonic()
+        return deleted
+
+    def create(self, url_hash: str) -> Conversation:
+        """Start a new session for a website."""
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self.sweep()
+        conversation = Conversation(
+            uuid.uuid4().hex, url_hash, self.history_budget, self.summary_budget
+        )
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO conversations (session_id, url_hash, turns, summary, turn_count, last_active) "
+                "VALUES (?, ?, '[]', '[]', 0, ?)",
+                (conversation.session_id, url_hash, conversation.last_active)
+            )
+        return conversation
+
+    def get(self, session_id: str, url_hash: str) -> Optional[Conversation]:
+        """Look up a live session; sessions are bound to one website."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM conversations WHERE session_id = ? AND url_hash = ?",
+                (session_id, url_hash)
+            ).fetchone()
+        if row is None or time.time() - row["last_active"] > self.ttl_seconds:
+            return None
+        conversation = Conversation(session_id, url_hash, self.history_budget, self.summary_budget)
+        self._load(conversation, row)
+        return conversation
+
+    def add_turn(self, conversation: Conversation, question: str, answer: str) -> None:
+        """
+        Record a turn on the stored session, so a turn recorded meanwhile by
+        another worker is kept, and refresh conversation from the result.
+        """
+        with self._connect() as conn, transaction(conn):
+            row = conn.execute(
+                "SELECT * FROM conversations WHERE session_id = ?", (conversation.session_id,)
+            ).fetchone()
+            if row is not None:
+                self._load(conversation, row)
+            conversation.add_turn(question, answer)
+            with conversation._lock:
+                conn.execute(
+                    "INSERT OR REPLACE INTO conversations "
+                    "(session_id, url_hash, turns, summary, turn_count, last_active) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (conversation.session_id, conversation.url_hash, json.dumps(conversation.turns),
+                     json.dumps(conversation.summary_lines), conversation.turn_count,
+                     conversation.last_active)
+                )
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) AS n FROM conversations").fetchone()["n"]
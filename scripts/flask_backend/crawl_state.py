@@ -0,0 +1,338 @@
+"""
+Crawl State Module
+In-memory crawl state (visited set, prioritized frontier, per-page results)
+and SQLite checkpoints that let an interrupted crawl resume.
+"""
+
+import time
+import heapq
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+from db import connect, ensure_parent_dir, transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawls (
+    url_hash TEXT PRIMARY KEY,
+    start_url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    next_seq INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS crawl_pages (
+    url_hash TEXT NOT NULL,
+    url TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    http_status INTEGER,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    text BLOB,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (url_hash, url)
+);
+CREATE TABLE IF NOT EXISTS crawl_frontier (
+    url_hash TEXT NOT NULL,
+    url TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (url_hash, url)
+);
+"""
+
+# Crawl lifecycle
+CRAWLING = 'crawling'
+COMPLETE = 'complete'
+
+# Page outcomes
+PAGE_OK = 'ok'
+PAGE_SKIPPED = 'skipped'
+PAGE_ERROR = 'error'
+
+
+class CrawlState:
+    """
+    Everything a crawl has learned so far.
+
+    The frontier is a heap ordered by (depth, discovery order), i.e.
+    breadth-first. visited holds pages fetched as HTML (they count towards
+    max_pages); seen also covers queued, skipped and failed URLs so nothing
+    is queued or fetched twice.
+    """
+
+    def __init__(self):
+        self.visited: Set[str] = set()
+        self.seen: Set[str] = set()
+        self.frontier: List[Tuple[int, int, str]] = []
+        self.pages: Dict[str, Dict] = {}
+        self.next_seq = 0
+        self.dirty: Set[str] = set()
+
+    def _seq(self) -> int:
+        self.next_seq += 1
+        return self.next_seq
+
+    def push(self, url: str, depth: int) -> bool:
+        """Queue a URL unless it was already queued or fetched."""
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        heapq.heappush(self.frontier, (depth, self._seq(), url))
+        return True
+
+    def pop(self) -> Tuple[str, int]:
+        depth, _, url = heapq.heappop(self.frontier)
+        return url, depth
+
+    def record(
+        self,
+        url: str,
+        depth: int,
+        status: str,
+        http_status: Optional[int] = None,
+        text: Optional[str] = None,
+        error: Optional[str] = None
+    ) -> None:
+        """Record the outcome of fetching a page."""
+        previous = self.pages.get(url)
+        self.pages[url] = {
+            "seq": self._seq(),
+            "depth": depth,
+            "status": status,
+            "http_status": http_status,
+            "attempts": (previous["attempts"] if previous else 0) + 1,
+            "error": error,
+            "text": text,
+            "fetched_at": time.time(),
+        }
+        if status == PAGE_OK:
+            self.visited.add(url)
+        self.dirty.add(url)
+
+    def texts(self) -> List[str]:
+        """Extracted text of fetched pages, in fetch order."""
+        pages = sorted(
+            (page for page in self.pages.values() if page["status"] == PAGE_OK and page["text"]),
+            key=lambda page: page["seq"]
+        )
+        return [page["text"] for page in pages]
+
+    def counts(self) -> Dict[str, int]:
+        counts = {PAGE_OK: 0, PAGE_SKIPPED: 0, PAGE_ERROR: 0}
+        for page in self.pages.values():
+            counts[page["status"]] += 1
+        return dict(counts, queued=len(self.frontier))
+
+
+class CrawlCheckpoint:
+    """
+    A crawl's state plus periodic persistence.
+
+    maybe_save() writes pages fetched since the last save and the current
+    frontier after every `every_pages` pages or `every_seconds` seconds, in
+    one transaction, so a resumed crawl sees a consistent snapshot.
+    """
+
+    def __init__(
+        self,
+        store: 'CrawlCheckpointStore',
+        url_hash: str,
+        state: CrawlState,
+        resumed: bool,
+        every_pages: int,
+        every_seconds: float
+    ):
+        self.store = store
+        self.url_hash = url_hash
+        self.state = state
+        self.resumed = resumed
+        self.every_pages = every_pages
+        self.every_seconds = every_seconds
+        self._last_save = time.monotonic()
+
+    def maybe_save(self) -> None:
+        if (
+            len(self.state.dirty) >= self.every_pages
+            or time.monotonic() - self._last_save >= self.every_seconds
+        ):
+            self.save()
+
+    def save(self, status: str = CRAWLING) -> None:
+        self.store.save(self.url_hash, self.state, status)
+        self.state.dirty.clear()
+        self._last_save = time.monotonic()
+
+
+class CrawlCheckpointStore:
+    """
+    SQLite-backed crawl checkpoints, keyed by url_hash.
+
+    A checkpoint not saved for max_age seconds is too old to resume (the
+    site has likely changed since): open() starts that crawl over, and
+    checkpoints of crawls never reopened are swept at most every
+    sweep_interval seconds.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        every_pages: int = 10,
+        every_seconds: float = 10.0,
+        max_attempts: int = 3,
+        max_age: float = 24 * 3600,
+        sweep_interval: float = 3600
+    ):
+        self.db_path = db_path
+        self.every_pages = every_pages
+        self.every_seconds = every_seconds
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        ensure_parent_dir(db_path)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return connect(self.db_path)
+
+    def open(self, url_hash: str, start_url: str) -> CrawlCheckpoint:
+        """
+        Resume the unfinished crawl for url_hash, or start a new one.
+
+        Pages that failed fewer than max_attempts times are queued again.
+        A checkpoint older than max_age is discarded rather than resumed.
+        """
+        now = time.time()
+        state = CrawlState()
+        resumed = False
+
+        with self._connect() as conn, transaction(conn):
+            self._sweep_stale(conn, now)
+            crawl = conn.execute("SELECT * FROM crawls WHERE url_hash = ?", (url_hash,)).fetchone()
+            if (
+                crawl is not None
+                and crawl["status"] == CRAWLING
+                and crawl["start_url"] == start_url
+                and now - crawl["updated_at"] <= self.max_age
+            ):
+                resumed = True
+                state.next_seq = crawl["next_seq"]
+                retry = []
+                for row in conn.execute(
+                    "SELECT * FROM crawl_pages WHERE url_hash = ? ORDER BY seq", (url_hash,)
+                ):
+                    state.pages[row["url"]] = self._row_to_page(row)
+                    if row["status"] == PAGE_ERROR and row["attempts"] < self.max_attempts:
+                        retry.append((row["url"], row["depth"]))
+                        continue
+                    state.seen.add(row["url"])
+                    if row["status"] == PAGE_OK:
+                        state.visited.add(row["url"])
+                for row in conn.execute(
+                    "SELECT url, depth, seq FROM crawl_frontier WHERE url_hash = ?", (url_hash,)
+                ):
+                    state.seen.add(row["url"])
+                    state.frontier.append((row["depth"], row["seq"], row["url"]))
+                heapq.heapify(state.frontier)
+                # Failed pages are fetched again; their rows keep the attempt count
+                for url, depth in retry:
+                    state.push(url, depth)
+            else:
+                self._clear(conn, url_hash)
+                conn.execute(
+                    "INSERT INTO crawls (url_hash, start_url, status, next_seq, started_at, updated_at) "
+                    "VALUES (?, ?, ?, 0, ?, ?)",
+                    (url_hash, start_url, CRAWLING, now, now)
+                )
+
+        if resumed:
+            counts = state.counts()
+            print(f"[SCRAPER] Resuming crawl {url_hash}: {counts[PAGE_OK]} pages done, "
+                  f"{counts['queued']} queued")
+        return CrawlCheckpoint(self, url_hash, state, resumed, self.every_pages, self.every_seconds)
+
+    def _row_to_page(self, row) -> Dict:
+        return {
+            "seq": row["seq"],
+            "depth": row["depth"],
+            "status": row["status"],
+            "http_status": row["http_status"],
+            "attempts": row["attempts"],
+            "error": row["error"],
+            "text": zlib.decompress(row["text"]).decode('utf-8') if row["text"] is not None else None,
+            "fetched_at": row["fetched_at"],
+        }
+
+    def save(self, url_hash: str, state: CrawlState, status: str = CRAWLING) -> None:
+        """Persist new page results and the whole frontier atomically."""
+        now = time.time()
+        pages = [
+            (url_hash, url, page["seq"], page["depth"], page["status"], page["http_status"],
+             page["attempts"], page["error"],
+             zlib.compress(page["text"].encode('utf-8'), 6) if page["text"] is not None else None,
+             page["fetched_at"])
+            for url, page in ((url, state.pages[url]) for url in state.dirty)
+        ]
+        with self._connect() as conn, transaction(conn):
+            conn.executemany(
+                "INSERT OR REPLACE INTO crawl_pages (url_hash, url, seq, depth, status, http_status, "
+                "attempts, error, text, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                pages
+            )
+            conn.execute("DELETE FROM crawl_frontier WHERE url_hash = ?", (url_hash,))
+            conn.executemany(
+                "INSERT INTO crawl_frontier (url_hash, url, depth, seq) VALUES (?, ?, ?, ?)",
+                [(url_hash, url, depth, seq) for depth, seq, url in state.frontier]
+            )
+            conn.execute(
+                "UPDATE crawls SET status = ?, next_seq = ?, updated_at = ? WHERE url_hash = ?",
+                (status, state.next_seq, now, url_hash)
+            )
+
+    def _sweep_stale(self, conn, now: float) -> None:
+        """Drop checkpoints not saved for max_age seconds."""
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        stale = [
+            row["url_hash"] for row in conn.execute(
+                "SELECT url_hash FROM crawls WHERE updated_at < ?", (now - self.max_age,)
+            )
+        ]
+        for url_hash in stale:
+            self._clear(conn, url_hash)
+        if stale:
+            print(f"[SCRAPER] Dropped {len(stale)} crawl checkpoints older than {self.max_age:.0f}s")
+
+    def _clear(self, conn, url_hash: str) -> None:
+        conn.execute("DELETE FROM crawls WHERE url_hash = ?", (url_hash,))
+        conn.execute("DELETE FROM crawl_pages WHERE url_hash = ?", (url_hash,))
+        conn.execute("DELETE FROM crawl_frontier WHERE url_hash = ?", (url_hash,))
+
+    def discard(self, url_hash: str) -> None:
+        """Drop a crawl's checkpoint once its content is safely stored."""
+        with self._connect() as conn, transaction(conn):
+            self._clear(conn, url_hash)
+
+    def status(self, url_hash: str) -> Optional[Dict]:
+        """Checkpoint summary for a crawl, if one exists."""
+        with self._connect() as conn:
+            crawl = conn.execute("SELECT * FROM crawls WHERE url_hash = ?", (url_hash,)).fetchone()
+            if crawl is None:
+                return None
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM crawl_pages WHERE url_hash = ? GROUP BY status",
+                (url_hash,)
+            ).fetchall()
+            queued = conn.execute(
+                "SELECT COUNT(*) AS n FROM crawl_frontier WHERE url_hash = ?", (url_hash,)
+            ).fetchone()["n"]
+        return {
+            "status": crawl["status"],
+            "pages": {row["status"]: row["n"] for row in rows},
+            "queued": queued,
+            "updated_at": crawl["updated_at"],
+        }
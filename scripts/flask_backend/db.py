@@ -0,0 +1,43 @@
+"""
+Database Module
+Shared SQLite connection helper for the backend's local stores.
+"""
+
+import os
+import sqlite3
+from contextlib import contextmanager
+
+
+def ensure_parent_dir(db_path: str) -> None:
+    """Create the directory holding a database file."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+
+@contextmanager
+def connect(db_path: str):
+    """
+    Short-lived autocommit connection to a WAL-mode database.
+
+    WAL lets readers in every worker process run alongside a writer; use
+    explicit BEGIN IMMEDIATE ... COMMIT for multi-statement transactions.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    """Run a block as one write transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
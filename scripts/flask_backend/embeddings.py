@@ -6,7 +6,10 @@ Handles text chunking, embedding generation, and vector storage using FAISS.
 import os
 import re
 import pickle
-from typing import List, Dict, Optional
+import zlib
+import threading
+from functools import partial
+from typing import Callable, List, Dict, Optional, Tuple
 import numpy as np
 
 # Try to import FAISS, fall back to simple similarity if not available
@@ -23,20 +26,37 @@ try:
     SENTENCE_TRANSFORMERS_AVAILABLE = True
 except ImportError:
     SENTENCE_TRANSFORMERS_AVAILABLE = False
-    print("[WARNING] sentence-transformers not available, using simple TF-IDF")
+    print("[WARNING] sentence-transformers not available, using simple hashed TF")
 
 # Fallback imports
 from collections import Counter
 import math
 
+from admission import admission
+from concurrency import is_cooperative, run_in_executor
+from metrics import metrics
+
+# Each scraped page's text starts with "Page: <url>" (see WebScraper)
+PAGE_MARKER = re.compile(r'Page: (\S+)')
+
+QUERY_BATCH_METRIC = 'webot_query_embed_batch_size'
+metrics.describe(
+    QUERY_BATCH_METRIC, 'histogram', 'Queries encoded per query-embedding batch',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
 
 class SimpleEmbedder:
-    """Simple TF-IDF based embedder as fallback."""
+    """
+    Simple hashed term-frequency embedder as fallback.
+    
+    Tokens are hashed into a fixed number of dimensions, so documents and
+    queries encoded in separate calls share one vector space and no state
+    is kept between calls.
+    """
     
     def __init__(self, dimension: int = 384):
         self.dimension = dimension
-        self.vocabulary = {}
-        self.idf = {}
     
     def _tokenize(self, text: str) -> List[str]:
         """Simple tokenization."""
@@ -45,51 +65,206 @@ class SimpleEmbedder:
         return text.split()
     
     def _compute_tf(self, tokens: List[str]) -> Dict[str, float]:
-        """Compute term frequency."""
+        """Compute sublinear term frequency."""
         counter = Counter(tokens)
-        total = len(tokens)
-        return {word: count / total for word, count in counter.items()}
+        return {word: 1.0 + math.log(count) for word, count in counter.items()}
+    
+    def _bucket(self, token: str) -> Tuple[int, float]:
+        """Stable hash bucket and sign for a token (builtin hash() is salted per process)."""
+        h = zlib.crc32(token.encode('utf-8'))
+        return h % self.dimension, (1.0 if (h >> 31) & 1 else -1.0)
     
     def encode(self, texts: List[str]) -> np.ndarray:
-        """Encode texts to vectors using simple TF-IDF."""
-        all_tokens = []
-        for text in texts:
-            all_tokens.extend(self._tokenize(text))
-        
-        # Build vocabulary from all unique tokens
-        unique_tokens = list(set(all_tokens))[:self.dimension]
-        self.vocabulary = {token: idx for idx, token in enumerate(unique_tokens)}
-        
-        # Compute IDF
-        doc_freq = Counter()
-        for text in texts:
-            tokens = set(self._tokenize(text))
-            doc_freq.update(tokens)
-        
-        n_docs = len(texts)
-        self.idf = {word: math.log(n_docs / (freq + 1)) for word, freq in doc_freq.items()}
-        
-        # Create vectors
-        vectors = []
-        for text in texts:
-            tokens = self._tokenize(text)
-            tf = self._compute_tf(tokens)
-            
-            vector = np.zeros(self.dimension)
+        """Encode texts to vectors using hashed term frequencies."""
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        
+        for row, text in enumerate(texts):
+            tf = self._compute_tf(self._tokenize(text))
             for word, tf_val in tf.items():
-                if word in self.vocabulary:
-                    idx = self.vocabulary[word]
-                    idf_val = self.idf.get(word, 0)
-                    vector[idx] = tf_val * idf_val
+                idx, sign = self._bucket(word)
+                vectors[row, idx] += sign * tf_val
             
             # Normalize
-            norm = np.linalg.norm(vector)
+            norm = np.linalg.norm(vectors[row])
             if norm > 0:
-                vector = vector / norm
+                vectors[row] /= norm
+        
+        return vectors
+
+
+def split_text(
+    text: str,
+    chunk_size: int = 500,
+    chunk_overlap: int = 100
+) -> List[str]:
+    """
+    Split text into overlapping chunks.
+    
+    A module-level function so bulk ingest can run it in a process pool.
+    
+    Args:
+        text: Input text to chunk
+        chunk_size: Target size of each chunk in characters
+        chunk_overlap: Number of characters to overlap between chunks
+    
+    Returns:
+        List of text chunks
+    """
+    # Clean the text
+    text = re.sub(r'\s+', ' ', text).strip()
+    
+    if len(text) <= chunk_size:
+        return [text]
+    
+    chunks = []
+    
+    # Split by paragraphs first
+    paragraphs = re.split(r'\n\n+', text)
+    
+    current_chunk = ""
+    
+    for para in paragraphs:
+        para = para.strip()
+        
+        if not para:
+            continue
+        
+        # If adding this paragraph exceeds chunk size
+        if len(current_chunk) + len(para) > chunk_size:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
             
-            vectors.append(vector)
+            # If paragraph itself is too long, split it
+            if len(para) > chunk_size:
+                sentences = re.split(r'(?<=[.!?])\s+', para)
+                current_chunk = ""
+                
+                for sentence in sentences:
+                    if len(current_chunk) + len(sentence) > chunk_size:
+                        if current_chunk:
+                            chunks.append(current_chunk.strip())
+                        current_chunk = sentence + " "
+                    else:
+                        current_chunk += sentence + " "
+            else:
+                current_chunk = para + " "
+        else:
+            current_chunk += para + " "
+    
+    # Add the last chunk
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    
+    # Create overlapping chunks
+    overlapped_chunks = []
+    for i, chunk in enumerate(chunks):
+        if i > 0 and chunk_overlap > 0:
+            # Add overlap from previous chunk
+            prev_chunk = chunks[i - 1]
+            overlap_text = prev_chunk[-chunk_overlap:] if len(prev_chunk) > chunk_overlap else prev_chunk
+            chunk = overlap_text + " " + chunk
+        
+        overlapped_chunks.append(chunk)
+    
+    # Filter out very short chunks
+    overlapped_chunks = [c for c in overlapped_chunks if len(c) > 50]
+    
+    print(f"[EMBEDDINGS] Created {len(overlapped_chunks)} chunks from {len(text)} characters")
+    
+    return overlapped_chunks
+
+
+def assign_pages(chunks: List[str]) -> List[int]:
+    """
+    Page number of each chunk, in document order.
+    
+    A chunk belongs to the last page whose marker it contains, or else to
+    the page the previous chunk ended on.
+    """
+    pages: Dict[str, int] = {}
+    page_ids = []
+    current = 0
+    for chunk in chunks:
+        markers = PAGE_MARKER.findall(chunk)
+        if markers:
+            current = pages.setdefault(markers[-1], len(pages))
+        page_ids.append(current)
+    return page_ids
+
+
+class _QueryBatch:
+    """Queries collected for one encode call."""
+    
+    def __init__(self):
+        self.texts: List[str] = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.vectors: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class QueryBatcher:
+    """
+    Micro-batches query encodes from concurrent requests.
+    
+    The first caller to arrive opens a batch and waits up to max_wait
+    seconds (less if max_batch queries join sooner); everyone who arrives
+    meanwhile joins that batch. The first caller then encodes the whole
+    batch in one call and each caller takes its own row. A max_wait of 0
+    disables batching.
+    """
+    
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch: int = 32, max_wait: float = 0.002):
+        self._encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._open: Optional[_QueryBatch] = None
+        self.stats = {"queries": 0, "batches": 0}
+    
+    def encode(self, text: str) -> np.ndarray:
+        """Encode one query, sharing a batch with concurrent callers."""
+        if self.max_wait <= 0 or self.max_batch <= 1:
+            self._record(1)
+            return self._encode([text])[0]
         
-        return np.array(vectors, dtype=np.float32)
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = _QueryBatch()
+                self._open = batch
+            position = len(batch.texts)
+            batch.texts.append(text)
+            if len(batch.texts) >= self.max_batch:
+                # Full: close it so later arrivals start a new batch
+                self._open = None
+                batch.full.set()
+        
+        if not leader:
+            batch.done.wait()
+        else:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            try:
+                self._record(len(batch.texts))
+                batch.vectors = self._encode(batch.texts)
+            except BaseException as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        
+        if batch.error is not None:
+            raise batch.error
+        return batch.vectors[position].copy()
+    
+    def _record(self, size: int) -> None:
+        with self._lock:
+            self.stats["queries"] += size
+            self.stats["batches"] += 1
+        metrics.observe(QUERY_BATCH_METRIC, size)
 
 
 class EmbeddingManager:
@@ -110,118 +285,103 @@ class EmbeddingManager:
                 self.model = SimpleEmbedder(self.dimension)
         else:
             self.model = SimpleEmbedder(self.dimension)
-            print("[EMBEDDINGS] Using simple TF-IDF embedder")
+            print("[EMBEDDINGS] Using simple hashed TF embedder")
+        
+        # Chunks per create_embeddings call when building an index
+        self.embed_batch_size = int(os.environ.get('EMBED_BATCH_SIZE', '256'))
+        
+        # Concurrent chat queries share encode calls. Sync workers serve one
+        # request at a time, so waiting would only add latency there.
+        default_wait_ms = '2' if is_cooperative() else '0'
+        self.query_batcher = QueryBatcher(
+            self.create_embeddings,
+            max_batch=int(os.environ.get('QUERY_BATCH_MAX_SIZE', '32')),
+            max_wait=float(os.environ.get('QUERY_BATCH_MAX_WAIT_MS', default_wait_ms)) / 1000
+        )
         
         # Storage for indices and chunks
         self.indices: Dict[str, any] = {}
         self.chunks_store: Dict[str, List[str]] = {}
         self.embeddings_store: Dict[str, np.ndarray] = {}
+        self.index_versions: Dict[str, Optional[int]] = {}
+        
+        # Two-stage search for large sites: score page centroids, then only
+        # the chunks of the best pages. Smaller sites use flat search.
+        self.page_indices: Dict[str, Dict] = {}
+        self.hierarchical_min_chunks = int(os.environ.get('HIERARCHICAL_MIN_CHUNKS', '1000'))
+        self.search_top_pages = int(os.environ.get('SEARCH_TOP_PAGES', '8'))
+        self.search_max_per_page = int(os.environ.get('SEARCH_MAX_PER_PAGE', '3'))
     
+    @metrics.timed('chunk')
     def chunk_text(
         self,
         text: str,
         chunk_size: int = 500,
         chunk_overlap: int = 100
     ) -> List[str]:
-        """
-        Split text into overlapping chunks.
-        
-        Args:
-            text: Input text to chunk
-            chunk_size: Target size of each chunk in characters
-            chunk_overlap: Number of characters to overlap between chunks
-        
-        Returns:
-            List of text chunks
-        """
-        # Clean the text
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        if len(text) <= chunk_size:
-            return [text]
-        
-        chunks = []
-        
-        # Split by paragraphs first
-        paragraphs = re.split(r'\n\n+', text)
-        
-        current_chunk = ""
-        
-        for para in paragraphs:
-            para = para.strip()
-            
-            if not para:
-                continue
-            
-            # If adding this paragraph exceeds chunk size
-            if len(current_chunk) + len(para) > chunk_size:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                
-                # If paragraph itself is too long, split it
-                if len(para) > chunk_size:
-                    sentences = re.split(r'(?<=[.!?])\s+', para)
-                    current_chunk = ""
-                    
-                    for sentence in sentences:
-                        if len(current_chunk) + len(sentence) > chunk_size:
-                            if current_chunk:
-                                chunks.append(current_chunk.strip())
-                            current_chunk = sentence + " "
-                        else:
-                            current_chunk += sentence + " "
-                else:
-                    current_chunk = para + " "
-            else:
-                current_chunk += para + " "
-        
-        # Add the last chunk
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
-        
-        # Create overlapping chunks
-        overlapped_chunks = []
-        for i, chunk in enumerate(chunks):
-            if i > 0 and chunk_overlap > 0:
-                # Add overlap from previous chunk
-                prev_chunk = chunks[i - 1]
-                overlap_text = prev_chunk[-chunk_overlap:] if len(prev_chunk) > chunk_overlap else prev_chunk
-                chunk = overlap_text + " " + chunk
-            
-            overlapped_chunks.append(chunk)
-        
-        # Filter out very short chunks
-        overlapped_chunks = [c for c in overlapped_chunks if len(c) > 50]
-        
-        print(f"[EMBEDDINGS] Created {len(overlapped_chunks)} chunks from {len(text)} characters")
-        
-        return overlapped_chunks
+        """Split text into overlapping chunks (see split_text)."""
+        return split_text(text, chunk_size, chunk_overlap)
     
+    @metrics.timed('embed')
     def create_embeddings(self, texts: List[str]) -> np.ndarray:
         """Create embeddings for a list of texts."""
         if isinstance(self.model, SimpleEmbedder):
             return self.model.encode(texts)
         else:
-            embeddings = self.model.encode(texts, show_progress_bar=False)
+            # Transformer inference is CPU-bound; offload it so green-thread
+            # workers keep serving other requests meanwhile
+            embeddings = run_in_executor(self.model.encode, texts, show_progress_bar=False)
             return np.array(embeddings, dtype=np.float32)
     
-    def create_index(self, index_id: str, chunks: List[str]) -> None:
+    def create_index(
+        self,
+        index_id: str,
+        chunks: List[str],
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> None:
         """
         Create a FAISS index for the given chunks.
         
         Args:
             index_id: Unique identifier for this index (usually URL hash)
             chunks: List of text chunks to index
+            progress: Optional callback called as progress(chunks_embedded, total)
+                      after each embedding batch
         """
         if not chunks:
             raise ValueError("No chunks provided for indexing")
         
-        # Create embeddings
-        embeddings = self.create_embeddings(chunks)
+        # Create embeddings in batches so long sites can report progress
+        batches = []
+        for start in range(0, len(chunks), self.embed_batch_size):
+            # Ingest embedding shares the CPU with chat; cap concurrent batches
+            heartbeat = partial(progress, start, len(chunks)) if progress else None
+            with admission.slot('embed', background=True, heartbeat=heartbeat):
+                batches.append(self.create_embeddings(chunks[start:start + self.embed_batch_size]))
+            if progress:
+                progress(min(start + self.embed_batch_size, len(chunks)), len(chunks))
+        embeddings = np.vstack(batches)
         
-        # Store chunks and embeddings
-        self.chunks_store[index_id] = chunks
-        self.embeddings_store[index_id] = embeddings
+        self.load_index(index_id, chunks, embeddings)
+    
+    @metrics.timed('index_build')
+    def load_index(
+        self,
+        index_id: str,
+        chunks: List[str],
+        embeddings: np.ndarray,
+        version: Optional[int] = None
+    ) -> None:
+        """
+        Build a searchable index from precomputed embeddings.
+        
+        Args:
+            index_id: Unique identifier for this index (usually URL hash)
+            chunks: Text chunks, in the same order as embeddings
+            embeddings: Chunk vectors (normalized here for cosine similarity)
+            version: Optional stored index version, see index_versions
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
         
         if FAISS_AVAILABLE:
             # Create FAISS index
@@ -232,16 +392,59 @@ class EmbeddingManager:
             
             # Add to index
             index.add(embeddings)
-            
-            self.indices[index_id] = index
             print(f"[EMBEDDINGS] Created FAISS index '{index_id}' with {len(chunks)} vectors")
         else:
             # Store normalized embeddings for simple search
             norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
             norms[norms == 0] = 1  # Avoid division by zero
-            self.embeddings_store[index_id] = embeddings / norms
-            self.indices[index_id] = "simple"
+            embeddings = embeddings / norms
+            index = "simple"
             print(f"[EMBEDDINGS] Created simple index '{index_id}' with {len(chunks)} vectors")
+        
+        page_index = self._build_page_index(chunks, embeddings)
+        if page_index:
+            print(f"[EMBEDDINGS] Built page index '{index_id}' with {len(page_index['members'])} pages")
+        
+        # Publish only once the index is complete so concurrent searches never
+        # see chunks without their vectors
+        self.embeddings_store[index_id] = embeddings
+        self.indices[index_id] = index
+        self.chunks_store[index_id] = chunks
+        self.index_versions[index_id] = version
+        if page_index:
+            self.page_indices[index_id] = page_index
+        else:
+            self.page_indices.pop(index_id, None)
+    
+    def _build_page_index(self, chunks: List[str], embeddings: np.ndarray) -> Optional[Dict]:
+        """
+        Page centroids (normalized mean of a page's chunk vectors) and each
+        page's chunk positions, or None if the site is small enough for
+        flat search. Keeps its own references to chunks and embeddings so a
+        search never mixes two versions of a site's index.
+        """
+        if len(chunks) < self.hierarchical_min_chunks:
+            return None
+        
+        page_ids = np.asarray(assign_pages(chunks))
+        page_count = int(page_ids.max()) + 1
+        if page_count <= self.search_top_pages:
+            return None
+        
+        centroids = np.zeros((page_count, embeddings.shape[1]), dtype=np.float32)
+        np.add.at(centroids, page_ids, embeddings)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        centroids /= norms
+        
+        members = [np.flatnonzero(page_ids == page) for page in range(page_count)]
+        return {"centroids": centroids, "members": members, "chunks": chunks, "embeddings": embeddings}
+    
+    def export_index(self, index_id: str) -> Optional[Tuple[List[str], np.ndarray]]:
+        """Return (chunks, normalized embeddings) for persisting an index."""
+        if index_id not in self.chunks_store:
+            return None
+        return self.chunks_store[index_id], self.embeddings_store[index_id]
     
     def search(
         self,
@@ -260,14 +463,50 @@ class EmbeddingManager:
         Returns:
             List of relevant text chunks
         """
+        return [hit["chunk"] for hit in self.search_with_scores(index_id, query, top_k)]
+    
+    def search_with_scores(
+        self,
+        index_id: str,
+        query: str,
+        top_k: int = 5
+    ) -> List[Dict]:
+        """
+        Search for relevant chunks and keep their similarity scores.
+        
+        Args:
+            index_id: Index identifier to search
+            query: Search query
+            top_k: Number of top results to return
+        
+        Returns:
+            List of dicts with 'chunk', 'score' (cosine similarity) and
+            'position' (index of the chunk in document order), best first
+        """
         if index_id not in self.chunks_store:
             print(f"[EMBEDDINGS] Index '{index_id}' not found")
             return []
         
         chunks = self.chunks_store[index_id]
         
-        # Create query embedding
-        query_embedding = self.create_embeddings([query])
+        # Create query embedding (batched with concurrent queries)
+        with metrics.timer('query_embed'):
+            query_embedding = self.query_batcher.encode(query)[np.newaxis, :]
+        
+        with metrics.timer('search'):
+            return self._search_vectors(index_id, chunks, query_embedding, top_k)
+    
+    def _search_vectors(
+        self,
+        index_id: str,
+        chunks: List[str],
+        query_embedding: np.ndarray,
+        top_k: int
+    ) -> List[Dict]:
+        """Rank an index's chunks against an encoded query."""
+        page_index = self.page_indices.get(index_id)
+        if page_index is not None:
+            return self._search_pages(page_index, query_embedding, top_k)
         
         if FAISS_AVAILABLE and index_id in self.indices and self.indices[index_id] != "simple":
             # Use FAISS search
@@ -281,9 +520,9 @@ class EmbeddingManager:
             distances, indices = index.search(query_embedding, k)
             
             results = []
-            for idx in indices[0]:
-                if idx < len(chunks):
-                    results.append(chunks[idx])
+            for score, idx in zip(distances[0], indices[0]):
+                if 0 <= idx < len(chunks):
+                    results.append({"chunk": chunks[idx], "score": float(score), "position": int(idx)})
             
             return results
         else:
@@ -302,7 +541,63 @@ class EmbeddingManager:
             k = min(top_k, len(chunks))
             top_indices = np.argsort(similarities)[-k:][::-1]
             
-            return [chunks[i] for i in top_indices]
+            return [
+                {"chunk": chunks[i], "score": float(similarities[i]), "position": int(i)}
+                for i in top_indices
+            ]
+    
+    def _search_pages(
+        self,
+        page_index: Dict,
+        query_embedding: np.ndarray,
+        top_k: int
+    ) -> List[Dict]:
+        """
+        Two-stage search: pick the best pages by centroid, then rank only
+        their chunks, taking at most search_max_per_page chunks per page
+        (0 for no cap) while other pages still have candidates.
+        """
+        query = query_embedding.reshape(-1).astype(np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm > 0:
+            query = query / query_norm
+        
+        # Stage 1: pages
+        page_scores = page_index["centroids"] @ query
+        max_per_page = self.search_max_per_page if self.search_max_per_page > 0 else top_k
+        top_pages = max(self.search_top_pages, -(-top_k // max_per_page))
+        top_pages = min(top_pages, len(page_scores))
+        best_pages = np.argpartition(-page_scores, top_pages - 1)[:top_pages]
+        
+        # Stage 2: chunks of those pages only
+        members = page_index["members"]
+        candidates = np.concatenate([members[page] for page in best_pages])
+        candidate_pages = np.concatenate([np.full(len(members[page]), page) for page in best_pages])
+        chunks = page_index["chunks"]
+        scores = page_index["embeddings"][candidates] @ query
+        
+        order = np.argsort(-scores)
+        picked: List[int] = []
+        overflow: List[int] = []
+        per_page: Dict[int, int] = {}
+        for i in order:
+            page = int(candidate_pages[i])
+            if per_page.get(page, 0) < max_per_page:
+                per_page[page] = per_page.get(page, 0) + 1
+                picked.append(i)
+                if len(picked) == top_k:
+                    break
+            elif len(overflow) < top_k:
+                overflow.append(i)
+        
+        # Not enough pages to fill top_k under the cap: take the best of the rest
+        picked.extend(overflow[:top_k - len(picked)])
+        picked.sort(key=lambda i: -scores[i])
+        
+        return [
+            {"chunk": chunks[candidates[i]], "score": float(scores[i]), "position": int(candidates[i])}
+            for i in picked
+        ]
     
     def delete_index(self, index_id: str) -> bool:
         """Delete an index and its associated data."""
@@ -310,6 +605,8 @@ class EmbeddingManager:
             del self.indices[index_id]
             del self.chunks_store[index_id]
             del self.embeddings_store[index_id]
+            self.index_versions.pop(index_id, None)
+            self.page_indices.pop(index_id, None)
             print(f"[EMBEDDINGS] Deleted index '{index_id}'")
             return True
         return False
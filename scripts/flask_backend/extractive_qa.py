@@ -0,0 +1,172 @@
+"""
+Extractive QA Module
+Answers questions locally by picking the best sentences from retrieved chunks,
+and routes each question to a local answer, "not found", or the LLM.
+"""
+
+import re
+import math
+import threading
+from typing import List, Dict, Union
+
+# Common English words that carry no signal for sentence matching
+STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'been', 'do', 'does',
+    'did', 'of', 'to', 'in', 'on', 'for', 'at', 'by', 'with', 'from', 'and',
+    'or', 'but', 'what', 'which', 'who', 'whom', 'how', 'when', 'where', 'why',
+    'can', 'could', 'i', 'you', 'we', 'they', 'it', 'its', 'this', 'that',
+    'these', 'those', 'me', 'my', 'your', 'our', 'their', 'about', 'tell',
+    'please', 'any', 'there', 'have', 'has', 'much', 'many', 'will', 'would'
+}
+
+# Sentences shorter than this are usually headings or UI fragments
+MIN_SENTENCE_CHARS = 20
+
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?।])\s+')
+
+
+def _stem(token: str) -> str:
+    """Strip a plural 's' so "costs" matches "cost"."""
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def _terms(text: str) -> List[str]:
+    """Lowercased, lightly stemmed word tokens without stopwords."""
+    return [_stem(t) for t in re.findall(r'\w+', text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+class ExtractiveAnswerer:
+    """Scores sentences from retrieved chunks against the question."""
+
+    def __init__(self, max_sentences: int = 3, max_chars: int = 600):
+        self.max_sentences = max_sentences
+        self.max_chars = max_chars
+
+    def answer(self, question: str, hits: List[Union[str, Dict]]) -> Dict:
+        """
+        Extract the best answer sentences for a question.
+
+        Args:
+            question: User's question
+            hits: Chunk strings or search hits with 'chunk' and 'score'
+
+        Returns:
+            Dict with 'answer' (may be empty) and 'confidence' in [0, 1],
+            the share of the question's weighted terms the best sentence covers
+        """
+        query_terms = set(_terms(question))
+        if not query_terms or not hits:
+            return {"answer": "", "confidence": 0.0}
+
+        candidates = []
+        seen = set()
+        for rank, hit in enumerate(hits):
+            chunk = hit if isinstance(hit, str) else hit.get("chunk", "")
+            retrieval_score = 1.0 if isinstance(hit, str) else max(0.0, hit.get("score", 0.0))
+            for sentence in SENTENCE_SPLIT.split(chunk):
+                sentence = sentence.strip()
+                key = sentence.lower()
+                # Overlapping chunks repeat sentences; score each once
+                if len(sentence) < MIN_SENTENCE_CHARS or key in seen:
+                    continue
+                seen.add(key)
+                candidates.append((sentence, set(_terms(sentence)), rank, retrieval_score))
+
+        if not candidates:
+            return {"answer": "", "confidence": 0.0}
+
+        # IDF over candidate sentences: terms in every sentence weigh little
+        n = len(candidates)
+        idf = {}
+        for term in query_terms:
+            df = sum(1 for _, terms, _, _ in candidates if term in terms)
+            idf[term] = math.log((n + 1) / (df + 1)) + 1.0
+        total_weight = sum(idf.values())
+
+        scored = []
+        for order, (sentence, terms, rank, retrieval_score) in enumerate(candidates):
+            coverage = sum(idf[t] for t in query_terms if t in terms) / total_weight
+            if coverage == 0:
+                continue
+            # Prefer sentences from better-ranked chunks on ties
+            score = coverage * (0.8 + 0.2 * min(retrieval_score, 1.0)) - 0.01 * rank
+            scored.append((score, coverage, order, sentence))
+
+        if not scored:
+            return {"answer": "", "confidence": 0.0}
+
+        scored.sort(key=lambda s: s[0], reverse=True)
+        best_coverage = scored[0][1]
+
+        picked = []
+        length = 0
+        for score, coverage, order, sentence in scored[:self.max_sentences]:
+            if coverage < best_coverage * 0.5:
+                break
+            if picked and length + len(sentence) > self.max_chars:
+                break
+            picked.append((order, sentence))
+            length += len(sentence)
+
+        # Keep the sentences in document order so the answer reads naturally
+        picked.sort()
+        answer = " ".join(sentence for _, sentence in picked)
+        if len(answer) > self.max_chars:
+            answer = answer[:self.max_chars].rstrip() + "..."
+
+        return {"answer": answer, "confidence": round(best_coverage, 4)}
+
+
+class AnswerRouter:
+    """
+    Decides how to answer from retrieval scores:
+
+    - 'not_found': the best chunk scores below not_found_score, so the
+      site almost certainly doesn't cover the question
+    - 'local': the best chunk scores at least local_score and an extracted
+      sentence covers at least local_confidence of the question; English
+      only, since the scoring and STOPWORDS are English and a local answer
+      is not translated
+    - 'llm': everything else
+    """
+
+    ROUTES = ('local', 'not_found', 'llm')
+
+    def __init__(
+        self,
+        not_found_score: float = 0.2,
+        local_score: float = 0.6,
+        local_confidence: float = 0.8
+    ):
+        self.not_found_score = not_found_score
+        self.local_score = local_score
+        self.local_confidence = local_confidence
+        self._lock = threading.Lock()
+        self.stats = {route: 0 for route in self.ROUTES}
+        self.stats["fallback"] = 0  # LLM unavailable or failed; answered locally
+
+    def route(self, hits: List[Union[str, Dict]], extractive: Dict, language: str = 'en') -> str:
+        """Pick a route for a question given its search hits, local answer and reply language."""
+        scores = [h["score"] for h in hits if isinstance(h, dict) and "score" in h]
+
+        # Without scores (plain chunk strings) there's nothing to judge by
+        if not scores:
+            return 'llm'
+
+        top_score = max(scores)
+        if top_score < self.not_found_score:
+            return 'not_found'
+        if (
+            language == 'en'
+            and extractive.get("answer")
+            and top_score >= self.local_score
+            and extractive.get("confidence", 0.0) >= self.local_confidence
+        ):
+            return 'local'
+        return 'llm'
+
+    def record(self, route: str) -> None:
+        with self._lock:
+            self.stats[route] = self.stats.get(route, 0) + 1
@@ -7,9 +7,18 @@ bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
 backlog = 2048
 
 # Worker processes
-workers = 2
-worker_class = 'sync'
-worker_connections = 1000
+# gevent workers are cooperative: a request waiting on Gemini or a crawl
+# yields instead of pinning the whole process, so each worker can hold up to
+# worker_connections in-flight requests. Set WORKER_CLASS=sync to opt out.
+try:
+    import gevent  # noqa: F401
+    _default_worker_class = 'gevent'
+except ImportError:
+    _default_worker_class = 'sync'
+
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+worker_class = os.environ.get('WORKER_CLASS', _default_worker_class)
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', '1000'))
 timeout = 120
 keepalive = 2
 
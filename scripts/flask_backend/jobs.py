@@ -0,0 +1,340 @@
+"""
+Jobs Module
+SQLite-backed background job queue for scrape and train work, with
+per-kind concurrency limits and progress reporting.
+"""
+
+import os
+import json
+import time
+import contextlib
+import uuid
+import socket
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from db import connect, ensure_parent_dir, transaction
+from metrics import metrics
+
+# Job lifecycle
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    url_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    phase TEXT,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_url_hash_idx ON jobs (url_hash, created_at);
+"""
+
+
+class JobQueue:
+    """
+    Durable job queue shared by all worker processes through one SQLite file.
+
+    Each process runs a small pool of worker threads that claim queued jobs.
+    Per-kind limits (e.g. at most 1 train job at a time) are enforced across
+    processes by counting running rows when claiming. Jobs whose worker stops
+    heartbeating (killed, redeployed) are requeued up to max_attempts times.
+    Finished jobs are deleted once they are older than retention seconds,
+    checked at most every sweep_interval seconds when claiming.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        workers: int = 2,
+        limits: Optional[Dict[str, int]] = None,
+        poll_interval: float = 0.5,
+        stale_after: float = 300,
+        max_attempts: int = 3,
+        retention: float = 7 * 24 * 3600,
+        sweep_interval: float = 3600,
+        profiler=None
+    ):
+        self.db_path = db_path
+        self.workers = workers
+        self.limits = limits or {}
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self.profiler = profiler
+        self.handlers: Dict[str, Callable] = {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads = []
+        self._stop = threading.Event()
+        self._phase_started: Dict[str, float] = {}
+
+        ensure_parent_dir(db_path)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return connect(self.db_path)
+
+    def register(self, kind: str, handler: Callable[[Dict, Callable], Any]) -> None:
+        """
+        Register the handler for a job kind.
+
+        The handler is called as handler(job, report) and returns a
+        JSON-serializable result. report(phase, done=None, total=None,
+        **counters) publishes progress; raising marks the job failed.
+        """
+        self.handlers[kind] = handler
+
+    def submit(self, kind: str, url_hash: str, payload: Dict) -> Dict:
+        """
+        Queue a job, or return the already active job of the same kind
+        for this url_hash.
+
+        Returns:
+            The job as a dict (see get)
+        """
+        now = time.time()
+        with self._connect() as conn, transaction(conn):
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE kind = ? AND url_hash = ? AND status IN (?, ?) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (kind, url_hash, QUEUED, RUNNING)
+            ).fetchone()
+            if row is None:
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, url_hash, payload, status, phase, progress, "
+                    "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, url_hash, json.dumps(payload), QUEUED, QUEUED, '{}', now, now)
+                )
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Look up a job by ID."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def latest_for(self, url_hash: str) -> Optional[Dict]:
+        """Most recently submitted job for a website."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE url_hash = ? ORDER BY created_at DESC LIMIT 1",
+                (url_hash,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def active(self) -> List[Dict]:
+        """Queued and running jobs, oldest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def _row_to_job(self, row: sqlite3.Row) -> Dict:
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "url_hash": row["url_hash"],
+            "payload": json.loads(row["payload"]),
+            "status": row["status"],
+            "phase": row["phase"],
+            "progress": json.loads(row["progress"] or '{}'),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "updated_at": row["updated_at"],
+            "finished_at": row["finished_at"],
+        }
+
+    def _requeue_stale(self, conn: sqlite3.Connection) -> None:
+        """Give jobs abandoned by a dead worker another attempt."""
+        cutoff = time.time() - self.stale_after
+        conn.execute(
+            "UPDATE jobs SET status = ?, phase = ?, error = 'Worker stopped responding', finished_at = ? "
+            "WHERE status = ? AND updated_at < ? AND attempts >= ?",
+            (FAILED, FAILED, time.time(), RUNNING, cutoff, self.max_attempts)
+        )
+        conn.execute(
+            "UPDATE jobs SET status = ?, phase = ?, worker = NULL "
+            "WHERE status = ? AND updated_at < ?",
+            (QUEUED, QUEUED, RUNNING, cutoff)
+        )
+
+    def _sweep_finished(self, conn: sqlite3.Connection) -> None:
+        """Delete done and failed jobs that finished more than retention seconds ago."""
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        deleted = conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+            (DONE, FAILED, now - self.retention)
+        ).rowcount
+        if deleted:
+            print(f"[JOBS] Deleted {deleted} jobs finished over {self.retention:.0f}s ago")
+
+    def _claim(self) -> Optional[Dict]:
+        """Atomically take the oldest queued job whose kind has a free slot."""
+        with self._connect() as conn, transaction(conn):
+            self._requeue_stale(conn)
+            self._sweep_finished(conn)
+            running = {
+                row["kind"]: row["n"] for row in conn.execute(
+                    "SELECT kind, COUNT(*) AS n FROM jobs WHERE status = ? GROUP BY kind",
+                    (RUNNING,)
+                )
+            }
+            row = None
+            for candidate in conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 50", (QUEUED,)
+            ).fetchall():
+                kind = candidate["kind"]
+                if kind not in self.handlers:
+                    continue
+                if running.get(kind, 0) < self.limits.get(kind, self.workers):
+                    row = candidate
+                    break
+
+            if row is None:
+                return None
+
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, "
+                "started_at = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, self.worker_id, now, now, row["id"])
+            )
+        return self.get(row["id"])
+
+    def report(
+        self,
+        job_id: str,
+        phase: str,
+        done: Optional[int] = None,
+        total: Optional[int] = None,
+        **counters
+    ) -> None:
+        """
+        Publish a job's progress and heartbeat.
+
+        ETA is extrapolated from how long the current phase has taken to
+        reach done out of total.
+        """
+        now = time.time()
+        key = f"{job_id}:{phase}"
+        started = self._phase_started.setdefault(key, now)
+
+        with self._connect() as conn:
+            row = conn.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            progress = json.loads(row["progress"] or '{}') if row else {}
+            progress.update(counters)
+            if done is not None and total:
+                progress["done"] = done
+                progress["total"] = total
+                elapsed = now - started
+                progress["eta_seconds"] = round(elapsed / done * (total - done), 1) if done else None
+            conn.execute(
+                "UPDATE jobs SET phase = ?, progress = ?, updated_at = ? WHERE id = ?",
+                (phase, json.dumps(progress), now, job_id)
+            )
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            progress = json.loads(row["progress"] or '{}') if row else {}
+            progress["eta_seconds"] = 0 if status == DONE else None
+            conn.execute(
+                "UPDATE jobs SET status = ?, phase = ?, progress = ?, result = ?, error = ?, "
+                "updated_at = ?, finished_at = ? WHERE id = ?",
+                (status, status, json.dumps(progress),
+                 json.dumps(result) if result is not None else None, error, now, now, job_id)
+            )
+        for key in [k for k in self._phase_started if k.startswith(f"{job_id}:")]:
+            del self._phase_started[key]
+
+    def run_job(self, job: Dict) -> None:
+        """Run one claimed job to completion."""
+        job_id = job["id"]
+        handler = self.handlers[job["kind"]]
+
+        def report(phase: str, done: Optional[int] = None, total: Optional[int] = None, **counters):
+            self.report(job_id, phase, done, total, **counters)
+
+        # Profile jobs whose request asked for it, plus the random sample
+        profile_ctx = contextlib.nullcontext({})
+        if self.profiler and (job["payload"].get("profile") or self.profiler.sample()):
+            profile_ctx = self.profiler.capture(f"job-{job['kind']}-{job['url_hash']}")
+
+        # Stage metrics recorded by the handler are labeled endpoint="job:<kind>"
+        metrics.start_request(f"job:{job['kind']}")
+        try:
+            with profile_ctx as profile_info, metrics.timer('job'):
+                result = handler(job, report)
+            if profile_info.get("name"):
+                result = dict(result or {}, profile=profile_info["name"])
+            elif profile_info.get("skipped") and job["payload"].get("profile"):
+                result = dict(result or {}, profileSkipped="another profile was being captured")
+            self._finish(job_id, DONE, result=result)
+            print(f"[JOBS] {job['kind']} job {job_id} done")
+        except Exception as e:
+            print(f"[JOBS] {job['kind']} job {job_id} failed: {str(e)}")
+            self._finish(job_id, FAILED, error=str(e))
+        finally:
+            metrics.end_request()
+
+    def _worker_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"[JOBS] Could not claim job: {str(e)}")
+                job = None
+
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+
+            self.run_job(job)
+
+    def start(self) -> None:
+        """Start this process's worker threads (idempotent)."""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"[JOBS] Started {self.workers} job workers ({self.worker_id})")
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,106 @@
+"""
+Local Cluster
+Runs a sharded deployment on one machine: several backend nodes, each with
+its own data directory, behind the shard router.
+
+Usage:
+    python local_cluster.py --nodes 3 --spare 1
+
+Spare nodes are started but not in the ring; add one with
+    curl -X POST localhost:8000/cluster/nodes -H "X-Internal-Token: $TOKEN" \\
+         -H "Content-Type: application/json" -d '{"node": "http://127.0.0.1:5004"}'
+"""
+
+import os
+import sys
+import time
+import signal
+import secrets
+import argparse
+import subprocess
+from typing import List
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_healthy(url: str, timeout: float = 60) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local sharded cluster")
+    parser.add_argument('--nodes', type=int, default=3, help='Nodes in the ring')
+    parser.add_argument('--spare', type=int, default=0, help='Extra nodes started outside the ring')
+    parser.add_argument('--base-port', type=int, default=5001, help='Port of the first node')
+    parser.add_argument('--router-port', type=int, default=8000, help='Router port')
+    parser.add_argument('--data-dir', default=os.path.join(HERE, 'data', 'cluster'), help='Parent of per-node data dirs')
+    args = parser.parse_args()
+
+    token = os.environ.get('INTERNAL_TOKEN') or secrets.token_hex(16)
+    processes: List[subprocess.Popen] = []
+    node_urls = []
+
+    def stop(*_):
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for i in range(args.nodes + args.spare):
+        port = args.base_port + i
+        env = dict(
+            os.environ,
+            PORT=str(port),
+            DATA_DIR=os.path.join(args.data_dir, f"node-{i + 1}"),
+            INTERNAL_TOKEN=token,
+            TRUST_PROXY='true'
+        )
+        processes.append(subprocess.Popen([sys.executable, 'app.py'], cwd=HERE, env=env))
+        node_urls.append(f"http://127.0.0.1:{port}")
+
+    for url in node_urls:
+        if not wait_healthy(url):
+            print(f"[CLUSTER] Node {url} did not start")
+            stop()
+
+    router_env = dict(
+        os.environ,
+        PORT=str(args.router_port),
+        SHARD_NODES=','.join(node_urls[:args.nodes]),
+        INTERNAL_TOKEN=token
+    )
+    router_env.pop('ROUTER_STATE_PATH', None)
+    processes.append(subprocess.Popen([sys.executable, 'router.py'], cwd=HERE, env=router_env))
+    router_url = f"http://127.0.0.1:{args.router_port}"
+    if not wait_healthy(router_url):
+        print("[CLUSTER] Router did not start")
+        stop()
+
+    print(f"[CLUSTER] Router: {router_url}")
+    print(f"[CLUSTER] Ring: {', '.join(node_urls[:args.nodes])}")
+    if args.spare:
+        print(f"[CLUSTER] Spare: {', '.join(node_urls[args.nodes:])}")
+    print(f"[CLUSTER] INTERNAL_TOKEN={token}")
+
+    while all(process.poll() is None for process in processes):
+        time.sleep(1)
+    print("[CLUSTER] A process exited; stopping the cluster")
+    stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+Metrics Module
+Per-stage latency histograms and counters, exported in Prometheus text format,
+plus per-request timing breakdowns for response debug fields.
+"""
+
+import os
+import json
+import functools
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Latency buckets in seconds, from in-memory search up to slow crawls / LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_METRIC = 'webot_stage_duration_seconds'
+REQUEST_METRIC = 'webot_request_duration_seconds'
+REQUEST_COUNTER = 'webot_requests_total'
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+class RequestTimings:
+    """Stage timings collected while handling one request or job."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def to_dict(self) -> Dict:
+        """Milliseconds per stage, for a response's debug field."""
+        return {
+            "endpoint": self.endpoint,
+            "totalMs": round((time.perf_counter() - self.started) * 1000, 2),
+            "stagesMs": {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()},
+            "stageCalls": dict(self.counts)
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms.
+
+    Each gunicorn worker has its own registry. When shared_dir is set, every
+    process also snapshots its values there (at most once per
+    flush_interval) and render() sums all snapshots, so /metrics reports
+    the whole node no matter which worker answers the scrape.
+    """
+
+    def __init__(self, shared_dir: Optional[str] = None, flush_interval: float = 1.0):
+        self.shared_dir = shared_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._histograms: Dict[Tuple[str, LabelKey], List] = {}
+        self._last_flush = 0.0
+
+        if self.shared_dir:
+            os.makedirs(self.shared_dir, exist_ok=True)
+
+        self.describe(STAGE_METRIC, 'histogram', 'Time spent in each pipeline stage')
+        self.describe(REQUEST_METRIC, 'histogram', 'HTTP request duration')
+        self.describe(REQUEST_COUNTER, 'counter', 'HTTP requests handled')
+
+    def describe(
+        self,
+        name: str,
+        metric_type: str,
+        help_text: str,
+        buckets: Optional[Tuple[float, ...]] = None
+    ) -> None:
+        """Register help text, and for histograms of non-latency values their buckets."""
+        self._meta[name] = (metric_type, help_text)
+        if buckets:
+            self._buckets[name] = tuple(buckets)
+
+    def buckets_for(self, name: str) -> Tuple[float, ...]:
+        return self._buckets.get(name, DEFAULT_BUCKETS)
+
+    # Request context ------------------------------------------------------
+
+    def start_request(self, endpoint: str) -> RequestTimings:
+        """Begin collecting stage timings for the current request or job."""
+        timings = RequestTimings(endpoint)
+        self._local.timings = timings
+        return timings
+
+    def current(self) -> Optional[RequestTimings]:
+        return getattr(self._local, 'timings', None)
+
+    def end_request(self) -> Optional[RequestTimings]:
+        timings = self.current()
+        self._local.timings = None
+        return timings
+
+    # Recording ------------------------------------------------------------
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+        self._maybe_flush()
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, _label_key(labels))
+        buckets = self.buckets_for(name)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = [[0] * len(buckets), 0.0, 0]
+                self._histograms[key] = hist
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Time a pipeline stage.
+
+        Records into the stage histogram labeled with the current request's
+        endpoint and the outcome ('ok', or 'error' if the block raised), and
+        adds the duration to the current request's timings.
+        """
+        timings = self.current()
+        endpoint = timings.endpoint if timings else 'none'
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            yield
+        except BaseException:
+            outcome = 'error'
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(STAGE_METRIC, elapsed, stage=stage, endpoint=endpoint, outcome=outcome)
+            if timings:
+                timings.add(stage, elapsed)
+
+    def timed(self, stage: str):
+        """Decorator form of timer()."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # Export ---------------------------------------------------------------
+
+    def _snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": [[name, list(key), value] for (name, key), value in self._counters.items()],
+                "histograms": [
+                    [name, list(key), list(hist[0]), hist[1], hist[2]]
+                    for (name, key), hist in self._histograms.items()
+                ]
+            }
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.shared_dir, f"metrics-{pid}.json")
+
+    def _maybe_flush(self, force: bool = False) -> None:
+        if not self.shared_dir:
+            return
+        now = time.time()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        path = self._snapshot_path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[METRICS] Could not write snapshot: {e}")
+
+    def _collect(self) -> Tuple[Dict, Dict]:
+        """Merge this process's values with other workers' snapshots."""
+        snapshots = [self._snapshot()]
+        if self.shared_dir:
+            self._maybe_flush(force=True)
+            own = os.path.basename(self._snapshot_path(os.getpid()))
+            for filename in os.listdir(self.shared_dir):
+                if filename == own or not filename.startswith('metrics-') or not filename.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(self.shared_dir, filename)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        counters: Dict[Tuple[str, LabelKey], float] = {}
+        histograms: Dict[Tuple[str, LabelKey], List] = {}
+        for snapshot in snapshots:
+            for name, key, value in snapshot["counters"]:
+                key = (name, tuple(tuple(pair) for pair in key))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, key, buckets, total, count in snapshot["histograms"]:
+                key = (name, tuple(tuple(pair) for pair in key))
+                merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                merged[1] += total
+                merged[2] += count
+        return counters, histograms
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        counters, histograms = self._collect()
+        lines = []
+
+        names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+        for name in names:
+            metric_type, help_text = self._meta.get(name, ('untyped', ''))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+            for (metric, key), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+
+            for (metric, key), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, bucket_count in zip(self.buckets_for(name), buckets):
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {bucket_count}")
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry used by all modules
+metrics = MetricsRegistry(shared_dir=os.environ.get('METRICS_DIR') or None)
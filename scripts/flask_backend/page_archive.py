@@ -0,0 +1,310 @@
+"""
+Page Archive Module
+Content-addressed store of raw fetched HTML plus response metadata, so text
+extraction, chunking and embedding can be re-run without crawling again.
+"""
+
+import json
+import time
+import zlib
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+from db import connect, ensure_parent_dir, transaction
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive_blobs (
+    digest TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archive_pages (
+    url_hash TEXT NOT NULL,
+    url TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    status_code INTEGER,
+    encoding TEXT,
+    headers TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (url_hash, url)
+);
+CREATE INDEX IF NOT EXISTS archive_pages_digest_idx ON archive_pages (digest);
+CREATE TABLE IF NOT EXISTS archive_pending (
+    url_hash TEXT NOT NULL,
+    url TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    status_code INTEGER,
+    encoding TEXT,
+    headers TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (url_hash, url)
+);
+CREATE INDEX IF NOT EXISTS archive_pending_digest_idx ON archive_pending (digest);
+"""
+
+ZSTD = 'zstd'
+ZLIB = 'zlib'
+
+# Response headers worth keeping next to the body
+KEPT_HEADERS = ('content-type', 'content-language', 'last-modified', 'etag', 'date')
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """Decompress a stored blob (a module-level function so pool workers can call it)."""
+    if codec == ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("Archived page is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class PageArchive:
+    """
+    Raw HTML of every fetched page, keyed by (url_hash, url).
+
+    Pages fetched by a crawl in progress are pending: pages() only returns
+    a site's last successful crawl, which commit() replaces once a crawl's
+    content is stored. A failed crawl's pages are discarded, so the archive
+    never mixes two crawls. Pending pages survive a restart, so a resumed
+    crawl commits the pages fetched before it too.
+
+    Bodies are stored once per SHA-256 digest, so identical pages (within a
+    site or across sites) share one compressed blob; a blob is dropped when
+    no page refers to it any more. New blobs use zstd when the zstandard
+    package is installed and zlib otherwise; each blob records its codec,
+    so archives written either way stay readable.
+    """
+
+    def __init__(self, db_path: str, codec: Optional[str] = None):
+        self.db_path = db_path
+        self.codec = codec or (ZSTD if ZSTD_AVAILABLE else ZLIB)
+        ensure_parent_dir(db_path)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return connect(self.db_path)
+
+    def put(
+        self,
+        url_hash: str,
+        url: str,
+        body: bytes,
+        status_code: Optional[int] = None,
+        headers: Optional[Dict[str, str]] = None,
+        encoding: Optional[str] = None
+    ) -> str:
+        """
+        Archive one page fetched by the site's current crawl, as pending.
+
+        Args:
+            url_hash: Site the page belongs to
+            url: Page URL
+            body: Raw response body
+            status_code: HTTP status
+            headers: Response headers (only KEPT_HEADERS are stored)
+            encoding: Charset the body was decoded with
+
+        Returns:
+            The body's SHA-256 digest
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        kept = {
+            name.lower(): value for name, value in (headers or {}).items()
+            if name.lower() in KEPT_HEADERS
+        }
+
+        with self._connect() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM archive_blobs WHERE digest = ?", (digest,)
+            ).fetchone() is not None
+            # Compress outside the write transaction
+            data = None if exists else compress(body, self.codec)
+
+            with transaction(conn):
+                if data is None and conn.execute(
+                    "SELECT 1 FROM archive_blobs WHERE digest = ?", (digest,)
+                ).fetchone() is None:
+                    data = compress(body, self.codec)  # pruned since the check above
+                if data is not None:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO archive_blobs (digest, codec, size, stored_size, data) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (digest, self.codec, len(body), len(data), data)
+                    )
+                previous = conn.execute(
+                    "SELECT digest FROM archive_pending WHERE url_hash = ? AND url = ?", (url_hash, url)
+                ).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO archive_pending "
+                    "(url_hash, url, digest, status_code, encoding, headers, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url_hash, url, digest, status_code, encoding, json.dumps(kept), time.time())
+                )
+                if previous is not None and previous["digest"] != digest:
+                    self._prune(conn, [previous["digest"]])
+
+        return digest
+
+    def put_response(self, url_hash: str, url: str, response) -> Optional[str]:
+        """
+        Archive a requests.Response; used as the scraper's on_fetch callback.
+
+        Archiving is best effort: a failure is logged and the crawl goes on.
+        """
+        try:
+            return self.put(
+                url_hash,
+                url,
+                response.content,
+                status_code=response.status_code,
+                headers=response.headers,
+                encoding=response.encoding or response.apparent_encoding
+            )
+        except Exception as e:
+            print(f"[ARCHIVE] Failed to archive {url}: {str(e)}")
+            return None
+
+    def _prune(self, conn, digests: Iterable[str]) -> None:
+        """Drop blobs that no archived or pending page refers to any more."""
+        conn.executemany(
+            "DELETE FROM archive_blobs WHERE digest = ? "
+            "AND NOT EXISTS (SELECT 1 FROM archive_pages WHERE digest = ?) "
+            "AND NOT EXISTS (SELECT 1 FROM archive_pending WHERE digest = ?)",
+            [(digest, digest, digest) for digest in set(digests)]
+        )
+
+    def pages(self, url_hash: str) -> List[Dict]:
+        """
+        A site's archived pages in fetch order, with their compressed bodies.
+
+        Bodies are left compressed (see decompress) so callers can fan
+        decompression out to worker processes.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT p.url, p.digest, p.status_code, p.encoding, p.headers, p.fetched_at, "
+                "b.codec, b.size, b.data FROM archive_pages p JOIN archive_blobs b ON b.digest = p.digest "
+                "WHERE p.url_hash = ? ORDER BY p.fetched_at",
+                (url_hash,)
+            ).fetchall()
+        return [
+            {
+                "url": row["url"],
+                "digest": row["digest"],
+                "status_code": row["status_code"],
+                "encoding": row["encoding"],
+                "headers": json.loads(row["headers"]),
+                "fetched_at": row["fetched_at"],
+                "codec": row["codec"],
+                "size": row["size"],
+                "data": row["data"],
+            }
+            for row in rows
+        ]
+
+    def import_pages(self, url_hash: str, pages: List[Dict]) -> None:
+        """
+        Replace a site's archived pages with pages exported by pages() on
+        another node, keeping their compressed bodies and fetch times.
+        """
+        with self._connect() as conn, transaction(conn):
+            previous = self._digests(conn, 'archive_pages', url_hash)
+            conn.execute("DELETE FROM archive_pages WHERE url_hash = ?", (url_hash,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO archive_blobs (digest, codec, size, stored_size, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(page["digest"], page["codec"], page["size"], len(page["data"]), page["data"])
+                 for page in pages]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO archive_pages "
+                "(url_hash, url, digest, status_code, encoding, headers, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(url_hash, page["url"], page["digest"], page["status_code"], page["encoding"],
+                  json.dumps(page["headers"]), page["fetched_at"]) for page in pages]
+            )
+            self._prune(conn, previous)
+
+    def list_hashes(self) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT DISTINCT url_hash FROM archive_pages").fetchall()
+        return [row["url_hash"] for row in rows]
+
+    def _digests(self, conn, table: str, url_hash: str) -> List[str]:
+        return [
+            row["digest"] for row in conn.execute(
+                f"SELECT digest FROM {table} WHERE url_hash = ?", (url_hash,)
+            )
+        ]
+
+    def commit(self, url_hash: str, urls: Iterable[str]) -> int:
+        """
+        Make a finished crawl the site's archived version: its pending pages
+        among urls (the pages it fetched) replace all previously archived
+        pages of the site.
+
+        Returns:
+            Number of pages archived
+        """
+        keep = set(urls)
+        with self._connect() as conn, transaction(conn):
+            previous = self._digests(conn, 'archive_pages', url_hash) + self._digests(conn, 'archive_pending', url_hash)
+            conn.execute("DELETE FROM archive_pages WHERE url_hash = ?", (url_hash,))
+            pending = [
+                row for row in conn.execute("SELECT * FROM archive_pending WHERE url_hash = ?", (url_hash,))
+                if row["url"] in keep
+            ]
+            conn.executemany(
+                "INSERT INTO archive_pages (url_hash, url, digest, status_code, encoding, headers, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(url_hash, row["url"], row["digest"], row["status_code"], row["encoding"],
+                  row["headers"], row["fetched_at"]) for row in pending]
+            )
+            conn.execute("DELETE FROM archive_pending WHERE url_hash = ?", (url_hash,))
+            self._prune(conn, previous)
+        return len(pending)
+
+    def discard(self, url_hash: str) -> None:
+        """Drop the pages of a failed or abandoned crawl; archived pages stay."""
+        with self._connect() as conn, transaction(conn):
+            previous = self._digests(conn, 'archive_pending', url_hash)
+            conn.execute("DELETE FROM archive_pending WHERE url_hash = ?", (url_hash,))
+            self._prune(conn, previous)
+
+    def delete_site(self, url_hash: str) -> None:
+        """Drop a site's archived and pending pages."""
+        with self._connect() as conn, transaction(conn):
+            previous = self._digests(conn, 'archive_pages', url_hash) + self._digests(conn, 'archive_pending', url_hash)
+            conn.execute("DELETE FROM archive_pages WHERE url_hash = ?", (url_hash,))
+            conn.execute("DELETE FROM archive_pending WHERE url_hash = ?", (url_hash,))
+            self._prune(conn, previous)
+
+    def stats(self) -> Dict:
+        with self._connect() as conn:
+            pages = conn.execute("SELECT COUNT(*) AS n FROM archive_pages").fetchone()["n"]
+            blobs = conn.execute(
+                "SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS size, "
+                "COALESCE(SUM(stored_size), 0) AS stored FROM archive_blobs"
+            ).fetchone()
+        return {
+            "pages": pages,
+            "blobs": blobs["n"],
+            "rawBytes": blobs["size"],
+            "storedBytes": blobs["stored"],
+            "codec": self.codec,
+        }
@@ -0,0 +1,160 @@
+"""
+Profiling Module
+Opt-in cProfile capture for individual requests and jobs, kept in a bounded
+on-disk ring buffer.
+"""
+
+import io
+import os
+import re
+import time
+import hmac
+import random
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+PROFILE_SUFFIX = '.prof'
+
+
+class RequestProfiler:
+    """
+    Captures cProfile data for requests that ask for it (by presenting the
+    profiling token) and for a random sample of all requests.
+
+    Profiles are pstats files named "<timestamp>-<label>.prof"; once more
+    than max_files exist the oldest are deleted. With no token configured,
+    on-demand profiling and the download endpoints are disabled; random
+    sampling still works if sample_rate > 0.
+
+    cProfile hooks a whole OS thread, and under gevent workers every
+    greenlet shares the hub's thread: a second capture would replace the
+    first one's hook and the first one's stop would end both. So only one
+    capture runs per process at a time and start() skips the rest. A
+    capture under gevent still includes other greenlets that ran while it
+    was active; profiles are exact only under sync workers.
+    """
+
+    def __init__(
+        self,
+        profile_dir: str,
+        token: Optional[str] = None,
+        sample_rate: float = 0.0,
+        max_files: int = 50
+    ):
+        self.profile_dir = profile_dir
+        self.token = token
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._active = False
+        os.makedirs(self.profile_dir, exist_ok=True)
+
+    def authorized(self, provided: Optional[str]) -> bool:
+        """Check a caller-supplied token against the configured one."""
+        if not self.token or not provided:
+            return False
+        return hmac.compare_digest(self.token, provided)
+
+    def sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def should_profile(self, provided: Optional[str]) -> Optional[str]:
+        """Why to profile this request: 'requested', 'sampled', or None."""
+        if self.authorized(provided):
+            return 'requested'
+        if self.sample():
+            return 'sampled'
+        return None
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """Start profiling; None if a capture is already running in this process."""
+        with self._lock:
+            if self._active:
+                return None
+            self._active = True
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            print(f"[PROFILE] Could not start profiler: {e}")
+            with self._lock:
+                self._active = False
+            return None
+        return profile
+
+    def stop(self, profile: cProfile.Profile, label: str) -> Optional[str]:
+        """Stop profiling and save the capture. Returns the profile name."""
+        profile.disable()
+        with self._lock:
+            self._active = False
+        label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_') or 'request'
+        name = f"{time.time_ns()}-{label}{PROFILE_SUFFIX}"
+        try:
+            profile.dump_stats(os.path.join(self.profile_dir, name))
+        except OSError as e:
+            print(f"[PROFILE] Could not save profile: {e}")
+            return None
+        self._trim()
+        return name
+
+    @contextmanager
+    def capture(self, label: str):
+        """
+        Profile a block of code. Yields a dict that gets the saved 'name',
+        or 'skipped' set when another capture was running.
+        """
+        info: Dict[str, Optional[str]] = {"name": None, "skipped": False}
+        profile = self.start()
+        info["skipped"] = profile is None
+        try:
+            yield info
+        finally:
+            if profile is not None:
+                info["name"] = self.stop(profile, label)
+
+    def _trim(self) -> None:
+        """Keep only the newest max_files profiles."""
+        with self._lock:
+            names = sorted(n for n in os.listdir(self.profile_dir) if n.endswith(PROFILE_SUFFIX))
+            for name in names[:-self.max_files] if len(names) > self.max_files else []:
+                try:
+                    os.remove(os.path.join(self.profile_dir, name))
+                except OSError:
+                    pass
+
+    def list_profiles(self) -> List[Dict]:
+        """Saved profiles, newest first."""
+        profiles = []
+        for name in sorted(os.listdir(self.profile_dir), reverse=True):
+            if not name.endswith(PROFILE_SUFFIX):
+                continue
+            path = os.path.join(self.profile_dir, name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            timestamp, _, label = name[:-len(PROFILE_SUFFIX)].partition('-')
+            profiles.append({
+                "name": name,
+                "label": label,
+                "capturedAt": int(timestamp) / 1e9 if timestamp.isdigit() else None,
+                "bytes": size
+            })
+        return profiles
+
+    def path_for(self, name: str) -> Optional[str]:
+        """Absolute path of a saved profile, or None for unknown/unsafe names."""
+        if os.path.basename(name) != name or not name.endswith(PROFILE_SUFFIX):
+            return None
+        path = os.path.join(self.profile_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def render_text(self, path: str, limit: int = 50) -> str:
+        """Top functions by cumulative time, as plain text."""
+        stream = io.StringIO()
+        stats = pstats.Stats(path, stream=stream)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
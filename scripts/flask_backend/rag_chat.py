@@ -4,9 +4,27 @@ Handles chat generation using Retrieval-Augmented Generation with Google Gemini.
 """
 
 import os
-from typing import List, Optional
+import re
+from typing import List, Dict, Optional, Union
 import google.generativeai as genai
 
+from admission import admission
+from concurrency import is_cooperative
+from context_packer import ContextPacker, estimate_tokens
+from conversation import Conversation
+from extractive_qa import ExtractiveAnswerer, AnswerRouter
+from metrics import metrics
+
+# Questions that lean on earlier turns ("and how much does it cost?")
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(and|but|also|so|what about|how about)\b"
+    r"|\b(it|its|it's|they|them|their|this|these|those|he|she|his|her)\b",
+    re.IGNORECASE
+)
+
+# Short questions are usually follow-ups regardless of wording
+FOLLOW_UP_MAX_WORDS = 6
+
 
 class RAGChatbot:
     """Handles chat generation using RAG with Gemini AI."""
@@ -19,7 +37,10 @@ class RAGChatbot:
             print("[WARNING] No Gemini API key found. Set GOOGLE_GENERATIVE_AI_API_KEY environment variable.")
             self.model = None
         else:
-            genai.configure(api_key=api_key)
+            # The default gRPC transport blocks the gevent hub; REST goes
+            # through pooled, monkey-patched sockets and yields while waiting
+            transport = os.environ.get('GEMINI_TRANSPORT') or ('rest' if is_cooperative() else None)
+            genai.configure(api_key=api_key, transport=transport)
             self.model = genai.GenerativeModel('gemini-1.5-flash')
             print("[RAG] Initialized Gemini model: gemini-1.5-flash")
         
@@ -35,19 +56,65 @@ class RAGChatbot:
             'hi': "मुझे वेबसाइट पर यह जानकारी नहीं मिली।",
             'te': "వెబ్‌సైట్‌లో ఈ సమాచారం కనుగొనలేకపోయాను."
         }
+        
+        # Token budget for retrieved website content in each prompt
+        self.context_packer = ContextPacker(
+            token_budget=int(os.environ.get('CONTEXT_TOKEN_BUDGET', '1500'))
+        )
+        
+        # Retrieval-score routing: answer locally, say "not found", or call Gemini
+        self.extractive = ExtractiveAnswerer()
+        self.router = AnswerRouter(
+            not_found_score=float(os.environ.get('ROUTE_NOT_FOUND_SCORE', '0.2')),
+            local_score=float(os.environ.get('ROUTE_LOCAL_SCORE', '0.6')),
+            local_confidence=float(os.environ.get('ROUTE_LOCAL_CONFIDENCE', '0.8'))
+        )
+    
+    def condense_query(self, question: str, conversation: Optional[Conversation] = None) -> str:
+        """
+        Build a standalone retrieval query for a follow-up question.
+        
+        Follow-ups like "and how much does it cost?" carry no subject of
+        their own, so the previous question is prepended to give retrieval
+        something to match. Standalone questions pass through unchanged.
+        """
+        if conversation is None:
+            return question
+        
+        previous = conversation.last_question()
+        if not previous:
+            return question
+        
+        is_short = len(question.split()) <= FOLLOW_UP_MAX_WORDS
+        if not is_short and not FOLLOW_UP_PATTERN.search(question):
+            return question
+        
+        return f"{previous} {question}"
     
+    @metrics.timed('prompt_build')
     def _create_prompt(
         self,
         question: str,
-        context_chunks: List[str],
+        context_chunks: List[Union[str, Dict]],
         language: str,
-        website_url: str
-    ) -> str:
-        """Create the RAG prompt for Gemini."""
+        website_url: str,
+        conversation: Optional[Conversation] = None
+    ) -> Dict:
+        """
+        Create the RAG prompt for Gemini.
         
-        context = "\n\n---\n\n".join(context_chunks)
+        Returns:
+            Dict with the 'prompt' and the packed context's 'context_tokens',
+            'spans' and 'chunks'
+        """
+        
+        packed = self.context_packer.pack(context_chunks)
+        context = packed["context"]
         language_instruction = self.language_instructions.get(language, self.language_instructions['en'])
         
+        history = conversation.render() if conversation else ""
+        history_section = f"CONVERSATION HISTORY:\n{history}\n\n" if history else ""
+        
         prompt = f"""You are a helpful AI assistant that answers questions ONLY based on the provided website content. 
 
 STRICT RULES:
@@ -61,17 +128,23 @@ STRICT RULES:
 WEBSITE CONTENT:
 {context}
 
-USER QUESTION:
+{history_section}USER QUESTION:
 {question}
 
 ANSWER:"""
         
-        return prompt
+        return {
+            "prompt": prompt,
+            "context_tokens": packed["tokens"],
+            "history_tokens": estimate_tokens(history),
+            "spans": packed["spans"],
+            "chunks": packed["chunks"]
+        }
     
     def generate_answer(
         self,
         question: str,
-        context_chunks: List[str],
+        context_chunks: List[Union[str, Dict]],
         language: str = 'en',
         website_url: str = ''
     ) -> str:
@@ -80,63 +153,124 @@ ANSWER:"""
         
         Args:
             question: User's question
-            context_chunks: Relevant content chunks from the website
+            context_chunks: Relevant content chunks from the website, as
+                            strings or search hits with score/position
             language: Response language ('en', 'hi', 'te')
             website_url: URL of the source website
         
         Returns:
             Generated answer string
         """
+        return self.generate_response(question, context_chunks, language, website_url)["answer"]
+    
+    def generate_response(
+        self,
+        question: str,
+        context_chunks: List[Union[str, Dict]],
+        language: str = 'en',
+        website_url: str = '',
+        conversation: Optional[Conversation] = None,
+        search_query: Optional[str] = None
+    ) -> Dict:
+        """
+        Generate an answer using RAG and report prompt usage.
+        
+        Args:
+            conversation: Optional session whose bounded history is
+                          included in the prompt
+            search_query: Standalone form of a follow-up question (see
+                          condense_query); local answers are scored
+                          against it instead of the raw question
         
-        if not self.model:
-            return self._fallback_response(question, context_chunks, language)
+        Returns:
+            Dict with 'answer', 'route' ('local', 'not_found', 'llm' or
+            'fallback'), 'context_tokens' and 'history_tokens' (0 when no
+            prompt was sent)
+        """
+        result = {"answer": None, "route": None, "context_tokens": 0, "history_tokens": 0}
         
         if not context_chunks:
-            return self.no_info_responses.get(language, self.no_info_responses['en'])
+            result["answer"] = self.no_info_responses.get(language, self.no_info_responses['en'])
+            result["route"] = 'not_found'
+            self.router.record('not_found')
+            return result
+        
+        # Cheap local pass first; the router decides whether the LLM is needed
+        with metrics.timer('extract'):
+            extractive = self.extractive.answer(search_query or question, context_chunks)
+        route = self.router.route(context_chunks, extractive, language)
+        
+        if route == 'not_found':
+            result["answer"] = self.no_info_responses.get(language, self.no_info_responses['en'])
+        elif route == 'local':
+            result["answer"] = self._fallback_response(question, context_chunks, language, extractive)
+        elif not self.model:
+            route = 'fallback'
+            result["answer"] = self._fallback_response(question, context_chunks, language, extractive)
+        else:
+            # Raises Overloaded (503) when too many LLM calls are running or queued
+            with admission.slot('llm'):
+                try:
+                    # Create prompt
+                    prompt_data = self._create_prompt(question, context_chunks, language, website_url, conversation)
+                    prompt = prompt_data["prompt"]
+                    result["context_tokens"] = prompt_data["context_tokens"]
+                    result["history_tokens"] = prompt_data["history_tokens"]
+                    
+                    # Generate response
+                    with metrics.timer('llm'):
+                        response = self.model.generate_content(
+                            prompt,
+                            generation_config=genai.types.GenerationConfig(
+                                temperature=0.3,  # Lower temperature for more focused answers
+                                top_p=0.8,
+                                top_k=40,
+                                max_output_tokens=1024,
+                            )
+                        )
+                    
+                    if response.text:
+                        result["answer"] = response.text.strip()
+                    else:
+                        result["answer"] = self.no_info_responses.get(language, self.no_info_responses['en'])
+                        
+                except Exception as e:
+                    print(f"[RAG] Error generating response: {str(e)}")
+                    route = 'fallback'
+                    result["answer"] = self._fallback_response(question, context_chunks, language, extractive)
         
-        try:
-            # Create prompt
-            prompt = self._create_prompt(question, context_chunks, language, website_url)
-            
-            # Generate response
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.3,  # Lower temperature for more focused answers
-                    top_p=0.8,
-                    top_k=40,
-                    max_output_tokens=1024,
-                )
-            )
-            
-            if response.text:
-                return response.text.strip()
-            else:
-                return self.no_info_responses.get(language, self.no_info_responses['en'])
-                
-        except Exception as e:
-            print(f"[RAG] Error generating response: {str(e)}")
-            return self._fallback_response(question, context_chunks, language)
+        result["route"] = route
+        self.router.record(route)
+        return result
     
     def _fallback_response(
         self,
         question: str,
-        context_chunks: List[str],
-        language: str
+        context_chunks: List[Union[str, Dict]],
+        language: str,
+        extractive: Optional[Dict] = None
     ) -> str:
         """
-        Fallback response when Gemini is not available.
-        Returns relevant context chunks as the answer.
+        Local response used when Gemini is skipped or not available.
+        Returns the best-matching sentences from the context chunks.
         """
         if not context_chunks:
             return self.no_info_responses.get(language, self.no_info_responses['en'])
         
-        # Return the most relevant chunk as a simple response
         prefixes = {
             'en': "Based on the website content:\n\n",
             'hi': "वेबसाइट की सामग्री के आधार पर:\n\n",
             'te': "వెబ్‌సైట్ కంటెంట్ ఆధారంగా:\n\n"
         }
-        
         prefix = prefixes.get(language, prefixes['en'])
-        return prefix + context_chunks[0][:500] + "..."
+        
+        if extractive is None:
+            extractive = self.extractive.answer(question, context_chunks)
+        if extractive.get("answer"):
+            return prefix + extractive["answer"]
+        
+        # No sentence matched the question; return the most relevant chunk
+        top_chunk = context_chunks[0]
+        if isinstance(top_chunk, dict):
+            top_chunk = top_chunk.get("chunk", "")
+        return prefix + top_chunk[:500] + "..."
@@ -0,0 +1,84 @@
+"""
+Reprocess
+Re-runs extraction, chunking and embedding for archived websites from the
+page archive, with no network I/O, after extraction or chunking changes.
+
+Usage:
+    python reprocess.py --all
+    python reprocess.py <url_hash> [<url_hash> ...] --processes 8
+
+Uses the same DATA_DIR / SITES_DB_PATH / PAGE_ARCHIVE_PATH settings as the
+server and can run while it is up: workers notice the new index versions in
+the site registry and reload them on the next chat.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+from dotenv import load_dotenv
+
+from embeddings import EmbeddingManager
+from site_registry import SiteRegistry
+from page_archive import PageArchive
+from bulk_ingest import BulkIngestor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    load_dotenv()
+    data_dir = os.environ.get('DATA_DIR', os.path.join(HERE, 'data'))
+
+    parser = argparse.ArgumentParser(description="Rebuild website content and indexes from the page archive")
+    parser.add_argument('url_hashes', nargs='*', help='Sites to reprocess')
+    parser.add_argument('--all', action='store_true', help='Reprocess every archived site')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='Processes for extraction and chunking, 0 to run them inline (default: CPU count)')
+    parser.add_argument('--threads', type=int, default=8, help='Sites extracted at once')
+    parser.add_argument('--embed-batch-size', type=int,
+                        default=int(os.environ.get('BULK_EMBED_BATCH_SIZE', '1024')),
+                        help='Chunks per embedding batch')
+    parser.add_argument('--sites-db', default=os.environ.get('SITES_DB_PATH', os.path.join(data_dir, 'sites.sqlite3')))
+    parser.add_argument('--archive', default=os.environ.get('PAGE_ARCHIVE_PATH', os.path.join(data_dir, 'archive.sqlite3')))
+    args = parser.parse_args()
+
+    if not args.all and not args.url_hashes:
+        parser.error("give url_hashes or --all")
+    if not os.path.exists(args.archive):
+        parser.error(f"no page archive at {args.archive}")
+
+    site_registry = SiteRegistry(args.sites_db)
+    archive = PageArchive(args.archive)
+    url_hashes = archive.list_hashes() if args.all else args.url_hashes
+
+    sites = []
+    for url_hash in url_hashes:
+        site = site_registry.get(url_hash)
+        if site is None:
+            print(f"[REPROCESS] Skipping {url_hash}: not in the site registry")
+            continue
+        sites.append({"url": site["url"], "url_hash": url_hash, "user_id": site["user_id"]})
+    if not sites:
+        print("[REPROCESS] Nothing to reprocess")
+        return 1
+
+    ingestor = BulkIngestor(
+        EmbeddingManager(),
+        site_registry,
+        crawl_threads=args.threads,
+        processes=args.processes,
+        embed_batch_size=args.embed_batch_size,
+        archive=archive
+    )
+    try:
+        result = ingestor.reprocess(sites)
+    finally:
+        ingestor.close()
+    print(json.dumps(result, indent=2))
+    return 0 if result["throughput"]["failed"] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,424 @@
+"""
+Shard Router
+Thin front end for a sharded deployment: forwards each website's requests to
+the backend node that owns it on a consistent-hash ring, and moves sites
+between nodes when nodes join or leave.
+
+Usage:
+    SHARD_NODES=http://localhost:5001,http://localhost:5002 python router.py
+"""
+
+import os
+import json
+import hmac
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import Flask, Response, request, jsonify
+from flask_cors import CORS
+from dotenv import load_dotenv
+
+from concurrency import HTTP_POOL_SIZE
+from sharding import HashRing, get_url_hash
+
+load_dotenv()
+
+# Request headers passed through to nodes, and response headers passed back
+FORWARD_REQUEST_HEADERS = ('Content-Type', 'Authorization', 'X-Profile')
+FORWARD_RESPONSE_HEADERS = ('Retry-After', 'X-Profile-Id')
+
+
+class ShardRouter:
+    """
+    Tracks cluster membership and routes url_hashes to nodes.
+
+    While sites move after a membership change, requests for a site still
+    in transit go to the node that has it, so scrape -> train -> chat keeps
+    working during a rebalance. Membership is saved to state_path (if set)
+    so a restarted router keeps the ring. A site with scrape or train jobs
+    in flight is only moved once they finish (waiting up to move_wait
+    seconds), so jobs never write a site to a node that no longer owns it.
+    Rebalancing is coordinated by
+    this process, so run the router as a single process (a gevent worker
+    for concurrency).
+    """
+
+    def __init__(
+        self,
+        nodes: List[str],
+        internal_token: Optional[str] = None,
+        state_path: Optional[str] = None,
+        vnodes: int = 128,
+        timeout: float = 60,
+        move_wait: float = 300,
+        poll_interval: float = 1.0
+    ):
+        self.internal_token = internal_token
+        self.state_path = state_path
+        self.timeout = timeout
+        self.move_wait = move_wait
+        self.poll_interval = poll_interval
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        saved = self._load_state()
+        self.ring = HashRing(saved if saved is not None else nodes, vnodes)
+        self.moving: Dict[str, str] = {}  # url_hash -> node still holding it
+        self._lock = threading.Lock()
+        self._rebalance_lock = threading.Lock()
+
+    def _load_state(self) -> Optional[List[str]]:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)["nodes"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[ROUTER] Could not read state: {e}")
+            return None
+
+    def _save_state(self) -> None:
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"nodes": self.ring.nodes}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def node_for(self, url_hash: str) -> Optional[str]:
+        with self._lock:
+            return self.moving.get(url_hash) or self.ring.node_for(url_hash)
+
+    def nodes(self) -> List[str]:
+        with self._lock:
+            return self.ring.nodes
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"nodes": self.ring.nodes, "moving": dict(self.moving)}
+
+    def _internal(self, method: str, node: str, path: str, allow: Tuple[int, ...] = (), **kwargs) -> requests.Response:
+        """Call a node's internal API; error statuses other than those in allow raise."""
+        headers = {'X-Internal-Token': self.internal_token or ''}
+        response = self.session.request(method, node + path, headers=headers, timeout=self.timeout, **kwargs)
+        if response.status_code not in allow:
+            response.raise_for_status()
+        return response
+
+    def _wait_idle(self, deadline: float, url_hash: str) -> None:
+        if time.monotonic() + self.poll_interval > deadline:
+            raise TimeoutError(f"jobs for {url_hash} did not finish within {self.move_wait:.0f}s")
+        time.sleep(self.poll_interval)
+
+    def _plan(self, old_ring: HashRing, new_ring: HashRing) -> Tuple[List[Tuple[str, str, str]], List[str]]:
+        """Sites whose owner changes, as (url_hash, from_node, to_node), plus unreachable nodes."""
+        moves = []
+        unreachable = []
+        for node in old_ring.nodes:
+            try:
+                hashes = self._internal('GET', node, '/internal/sites').json()["sites"]
+            except (requests.RequestException, ValueError, KeyError) as e:
+                print(f"[ROUTER] Could not list sites on {node}: {e}")
+                unreachable.append(node)
+                continue
+            for url_hash in hashes:
+                owner = new_ring.node_for(url_hash)
+                if owner and owner != node:
+                    moves.append((url_hash, node, owner))
+        return moves, unreachable
+
+    def _move(self, url_hash: str, source: str, target: str) -> None:
+        """
+        Copy a site to its new owner, then delete it from the old one.
+
+        The source answers 409 while the site has jobs in flight; the move
+        waits for them. Requests keep going to the source until the copy is
+        on the target. If a job started on the source in the meantime, the
+        delete is refused and the site is copied again once it finishes.
+        """
+        path = f'/internal/sites/{url_hash}'
+        deadline = time.monotonic() + self.move_wait
+        while True:
+            response = self._internal('GET', source, path, allow=(404, 409))
+            if response.status_code == 409:
+                self._wait_idle(deadline, url_hash)
+                continue
+            if response.status_code == 404:
+                # Its jobs finished without storing the site; nothing to move
+                self._route(url_hash, None)
+                return
+            self._internal('PUT', target, path, json=response.json())
+            self._route(url_hash, None)
+            if self._internal('DELETE', source, path, allow=(409,)).status_code != 409:
+                return
+            self._route(url_hash, source)
+            self._wait_idle(deadline, url_hash)
+
+    def _route(self, url_hash: str, node: Optional[str]) -> None:
+        """Pin a site to the node holding it, or (None) route it by the ring."""
+        with self._lock:
+            if node:
+                self.moving[url_hash] = node
+            else:
+                self.moving.pop(url_hash, None)
+
+    def change_membership(self, add: Optional[str] = None, remove: Optional[str] = None) -> Dict:
+        """
+        Add or remove a node and move the sites whose owner changed.
+
+        A leaving node must still be reachable to hand over its sites;
+        sites on an unreachable node are reported and have to be re-ingested.
+
+        Returns:
+            Summary with the new node list, moved and failed site counts
+        """
+        with self._rebalance_lock:
+            with self._lock:
+                old_ring = self.ring
+                new_ring = old_ring.copy()
+                if add:
+                    new_ring.add(add)
+                if remove:
+                    new_ring.remove(remove)
+
+            moves, unreachable = self._plan(old_ring, new_ring)
+
+            # Switch routing now; sites in transit stay with their old node
+            with self._lock:
+                self.moving.update({url_hash: source for url_hash, source, _ in moves})
+                self.ring = new_ring
+            self._save_state()
+
+            moved = 0
+            failed = []
+            for url_hash, source, target in moves:
+                try:
+                    self._move(url_hash, source, target)
+                    moved += 1
+                except (requests.RequestException, ValueError, TimeoutError) as e:
+                    # Keep routing this site to the node that still has it
+                    print(f"[ROUTER] Could not move {url_hash} from {source} to {target}: {e}")
+                    self._route(url_hash, source)
+                    failed.append(url_hash)
+
+            print(f"[ROUTER] Membership now {new_ring.nodes}; moved {moved} sites, {len(failed)} failed")
+            return {
+                "nodes": new_ring.nodes,
+                "moved": moved,
+                "failed": failed,
+                "unreachable": unreachable
+            }
+
+
+app = Flask(__name__)
+
+CORS(app, resources={
+    r"/*": {
+        "origins": ["http://localhost:3000", "https://*.vercel.app", "*"],
+        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Authorization", "X-Profile", "X-Internal-Token"]
+    }
+})
+
+router = ShardRouter(
+    nodes=[node.strip().rstrip('/') for node in os.environ.get('SHARD_NODES', '').split(',') if node.strip()],
+    internal_token=os.environ.get('INTERNAL_TOKEN') or None,
+    state_path=os.environ.get('ROUTER_STATE_PATH') or None,
+    vnodes=int(os.environ.get('SHARD_VNODES', '128')),
+    timeout=float(os.environ.get('ROUTER_TIMEOUT', '60')),
+    move_wait=float(os.environ.get('ROUTER_MOVE_WAIT', '300'))
+)
+
+
+def forward(node: Optional[str], path: str) -> Response:
+    """Proxy the current request to a node and relay its response."""
+    if node is None:
+        return jsonify({"error": "No backend nodes available"}), 503
+
+    headers = {name: request.headers[name] for name in FORWARD_REQUEST_HEADERS if name in request.headers}
+    forwarded_for = request.headers.get('X-Forwarded-For')
+    headers['X-Forwarded-For'] = f"{forwarded_for}, {request.remote_addr}" if forwarded_for else request.remote_addr
+
+    try:
+        upstream = router.session.request(
+            request.method,
+            node + path,
+            params=request.args,
+            data=request.get_data(),
+            headers=headers,
+            timeout=router.timeout
+        )
+    except requests.RequestException as e:
+        print(f"[ROUTER] {node} unavailable: {str(e)}")
+        response = jsonify({"error": "Backend node unavailable. Please retry shortly."})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+
+    response = Response(upstream.content, status=upstream.status_code,
+                         content_type=upstream.headers.get('Content-Type'))
+    for name in FORWARD_RESPONSE_HEADERS:
+        if name in upstream.headers:
+            response.headers[name] = upstream.headers[name]
+    response.headers['X-Shard-Node'] = node
+    return response
+
+
+def fan_out(path: str) -> List[Tuple[str, Optional[requests.Response]]]:
+    """GET path from every node (None for nodes that didn't answer)."""
+    results = []
+    for node in router.nodes():
+        try:
+            results.append((node, router.session.get(node + path, params=request.args, timeout=router.timeout)))
+        except requests.RequestException as e:
+            print(f"[ROUTER] {node} unavailable: {str(e)}")
+            results.append((node, None))
+    return results
+
+
+def request_node() -> Optional[str]:
+    """The "node" field of a JSON object body, if there is one."""
+    data = request.get_json(silent=True)
+    node = data.get('node') if isinstance(data, dict) else None
+    return node if isinstance(node, str) else None
+
+
+def admin_authorized() -> bool:
+    provided = request.headers.get('X-Internal-Token')
+    return bool(router.internal_token and provided and hmac.compare_digest(router.internal_token, provided))
+
+
+@app.route('/scrape-website', methods=['POST'])
+@app.route('/train-website', methods=['POST'])
+@app.route('/chat', methods=['POST'])
+def route_by_url():
+    """Forward to the node that owns the website in the request body."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('url') or not isinstance(data['url'], str):
+        return jsonify({"error": "URL is required"}), 400
+    return forward(router.node_for(get_url_hash(data['url'])), request.path)
+
+
+@app.route('/status/<url_hash>', methods=['GET'])
+def route_status(url_hash: str):
+    return forward(router.node_for(url_hash), request.path)
+
+
+@app.route('/ingest-batch', methods=['POST'])
+def route_ingest_batch():
+    """Split a batch by owning node and submit one batch job per node."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('urls'), list) or not data['urls']:
+        return jsonify({"error": "urls must be a non-empty list"}), 400
+
+    # Check before deduplicating: non-string items may not be hashable
+    invalid = [url for url in data['urls'] if not isinstance(url, str)]
+    if invalid:
+        return jsonify({"error": "Invalid URL", "invalid": invalid}), 400
+
+    by_node: Dict[str, List[str]] = {}
+    for url in dict.fromkeys(data['urls']):
+        node = router.node_for(get_url_hash(url))
+        if node is None:
+            return jsonify({"error": "No backend nodes available"}), 503
+        by_node.setdefault(node, []).append(url)
+
+    jobs = []
+    status = 202
+    for node, urls in by_node.items():
+        try:
+            upstream = router.session.post(
+                node + '/ingest-batch',
+                json=dict(data, urls=urls),
+                headers={'X-Forwarded-For': request.remote_addr},
+                timeout=router.timeout
+            )
+            body = upstream.json()
+        except (requests.RequestException, ValueError) as e:
+            upstream, body = None, {"error": f"Backend node unavailable: {str(e)}"}
+        code = upstream.status_code if upstream is not None else 503
+        if code >= 400:
+            status = 207
+        jobs.append(dict(body, node=node, statusCode=code))
+
+    return jsonify({"success": status == 202, "jobs": jobs}), status
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def route_job(job_id: str):
+    """Job IDs don't say which node ran them, so ask each node."""
+    for node, upstream in fan_out(request.path):
+        if upstream is not None and upstream.status_code == 200:
+            return Response(upstream.content, status=200, content_type=upstream.headers.get('Content-Type'),
+                            headers={'X-Shard-Node': node})
+    return jsonify({"error": "Job not found"}), 404
+
+
+@app.route('/history/<user_id>', methods=['GET'])
+def route_history(user_id: str):
+    """A user's websites from every node."""
+    websites = []
+    for _, upstream in fan_out(request.path):
+        if upstream is not None and upstream.status_code == 200:
+            websites.extend(upstream.json().get("websites", []))
+    return jsonify({"userId": user_id, "websites": websites})
+
+
+@app.route('/stats', methods=['GET'])
+def cluster_stats():
+    """Each node's /stats."""
+    nodes = {}
+    for node, upstream in fan_out('/stats'):
+        nodes[node] = upstream.json() if upstream is not None and upstream.status_code == 200 else None
+    return jsonify({"nodes": nodes})
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Router health plus whether each node answers."""
+    nodes = {node: upstream is not None and upstream.status_code == 200 for node, upstream in fan_out('/health')}
+    return jsonify({
+        "status": "healthy" if nodes and all(nodes.values()) else "degraded",
+        "nodes": nodes
+    })
+
+
+@app.route('/cluster', methods=['GET'])
+def cluster_state():
+    """Ring membership and sites still being moved."""
+    return jsonify(router.snapshot())
+
+
+@app.route('/cluster/nodes', methods=['POST'])
+def join_node():
+    """Add a node to the ring and move its share of sites to it."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    node = (request_node() or '').rstrip('/')
+    if not node.startswith(('http://', 'https://')):
+        return jsonify({"error": "node must be a base URL"}), 400
+    return jsonify(router.change_membership(add=node))
+
+
+@app.route('/cluster/nodes', methods=['DELETE'])
+def leave_node():
+    """Move a node's sites to the remaining nodes and drop it from the ring."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    node = (request_node() or '').rstrip('/')
+    if node not in router.nodes():
+        return jsonify({"error": "Unknown node"}), 404
+    if len(router.nodes()) == 1:
+        return jsonify({"error": "Cannot remove the last node"}), 400
+    return jsonify(router.change_membership(remove=node))
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 8000))
+    print(f"[ROUTER] Routing to {router.nodes()} on port {port}")
+    app.run(host='0.0.0.0', port=port, threaded=True)
@@ -7,10 +7,17 @@ import re
 import time
 import urllib.robotparser
 from urllib.parse import urljoin, urlparse
-from typing import Optional, List, Set
+from typing import Callable, Optional, List, Set, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 
+from concurrency import HTTP_POOL_SIZE
+from metrics import metrics
+from crawl_state import (
+    COMPLETE, PAGE_ERROR, PAGE_OK, PAGE_SKIPPED, CrawlCheckpoint, CrawlState
+)
+
 
 class WebScraper:
     """Scrapes websites and extracts clean text content."""
@@ -24,8 +31,15 @@ class WebScraper:
             'Accept-Encoding': 'gzip, deflate',
             'Connection': 'keep-alive',
         })
+        
+        # Pool connections so concurrent crawls reuse sockets instead of
+        # queueing behind urllib3's default pool of 10
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.timeout = 30
         self.max_pages = 10  # Limit pages to scrape
+        self.request_delay = 0.5  # Politeness delay between requests, in seconds
         self.visited_urls: Set[str] = set()
     
     def can_fetch(self, url: str) -> bool:
@@ -141,8 +155,11 @@ class WebScraper:
         
         return self.clean_text(full_text)
     
-    def get_links(self, html: str, base_url: str) -> List[str]:
+    def get_links(self, html: str, base_url: str, visited: Optional[Set[str]] = None) -> List[str]:
         """Extract internal links from HTML."""
+        if visited is None:
+            visited = self.visited_urls
+        
         soup = BeautifulSoup(html, 'html.parser')
         links = []
         
@@ -161,7 +178,7 @@ class WebScraper:
                 # Remove fragments and query strings for deduplication
                 clean_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
                 
-                if clean_url not in self.visited_urls and self.is_valid_page(clean_url):
+                if clean_url not in visited and self.is_valid_page(clean_url):
                     links.append(clean_url)
         
         return list(set(links))  # Remove duplicates
@@ -192,52 +209,120 @@ class WebScraper:
             print(f"[SCRAPER] Failed to fetch {url}: {str(e)}")
             return None
     
-    def scrape_website(self, start_url: str) -> str:
+    def scrape_website(
+        self,
+        start_url: str,
+        progress: Optional[Callable[[int, int], None]] = None,
+        parse: Optional[Callable[[str, str, bool], Tuple[str, List[str]]]] = None,
+        checkpoint: Optional[CrawlCheckpoint] = None,
+        on_fetch: Optional[Callable[[str, requests.Response], None]] = None
+    ) -> str:
         """
         Scrape a website starting from the given URL.
         Returns combined text content from multiple pages.
+        
+        Args:
+            start_url: Page to start crawling from
+            progress: Optional callback called as progress(pages_fetched, max_pages)
+                      after each page
+            parse: Optional replacement for parse_html(html, url, with_links),
+                   e.g. one that runs it in a process pool
+            checkpoint: Optional crawl checkpoint; the crawl continues from its
+                        state and saves it periodically, so an interrupted
+                        crawl can be resumed
+            on_fetch: Optional callback called as on_fetch(url, response) for
+                      every HTML page before it is parsed, e.g. to archive it
         """
-        self.visited_urls.clear()
-        all_content = []
-        urls_to_visit = [start_url]
+        # Per-call state: under green-thread workers several crawls
+        # share this scraper instance concurrently
+        state = checkpoint.state if checkpoint else CrawlState()
+        if not state.frontier and not state.pages:
+            state.push(start_url, 0)
+        visited = state.visited
+        self.visited_urls = visited
         
-        while urls_to_visit and len(self.visited_urls) < self.max_pages:
-            url = urls_to_visit.pop(0)
+        while state.frontier and len(visited) < self.max_pages:
+            url, depth = state.pop()
             
             print(f"[SCRAPER] Scraping: {url}")
             
             try:
-                response = self.session.get(url, timeout=self.timeout)
-                response.raise_for_status()
+                with metrics.timer('fetch'):
+                    response = self.session.get(url, timeout=self.timeout)
+                    response.raise_for_status()
                 
                 content_type = response.headers.get('Content-Type', '').lower()
                 if 'text/html' not in content_type:
+                    state.record(url, depth, PAGE_SKIPPED, response.status_code)
                     continue
                 
-                self.visited_urls.add(url)
+                if on_fetch:
+                    on_fetch(url, response)
                 
-                # Extract text
-                text = self.extract_text_from_html(response.text, url)
-                if text and len(text) > 100:
-                    all_content.append(text)
+                with metrics.timer('parse'):
+                    # Extract text and, while there is room, more links to visit
+                    want_links = len(visited) + 1 < self.max_pages
+                    if parse:
+                        text, new_links = parse(response.text, url, want_links)
+                    else:
+                        text = self.extract_text_from_html(response.text, url)
+                        new_links = self.get_links(response.text, url, visited) if want_links else []
                 
-                # Get more links to visit
-                if len(self.visited_urls) < self.max_pages:
-                    new_links = self.get_links(response.text, url)
-                    for link in new_links:
-                        if link not in self.visited_urls and link not in urls_to_visit:
-                            urls_to_visit.append(link)
+                state.record(
+                    url, depth, PAGE_OK, response.status_code,
+                    text if text and len(text) > 100 else None
+                )
+                
+                for link in new_links:
+                    state.push(link, depth + 1)
+                
+                if progress:
+                    progress(len(visited), self.max_pages)
                 
                 # Be polite - add delay between requests
-                time.sleep(0.5)
+                if self.request_delay:
+                    time.sleep(self.request_delay)
                 
             except Exception as e:
                 print(f"[SCRAPER] Error scraping {url}: {str(e)}")
+                state.record(url, depth, PAGE_ERROR, error=str(e))
                 continue
+            finally:
+                if checkpoint:
+                    checkpoint.maybe_save()
         
-        # Combine all content
-        combined_content = "\n\n" + "="*50 + "\n\n".join(all_content)
+        if checkpoint:
+            checkpoint.save(COMPLETE)
         
-        print(f"[SCRAPER] Completed. Scraped {len(self.visited_urls)} pages, {len(combined_content)} characters")
+        combined_content = combine_pages(state.texts())
+        
+        print(f"[SCRAPER] Completed. Scraped {len(visited)} pages, {len(combined_content)} characters")
         
         return combined_content
+
+
+def combine_pages(texts: List[str]) -> str:
+    """Combine page texts into a site's stored content."""
+    return "\n\n" + "="*50 + "\n\n".join(texts)
+
+
+# Per-process scraper used by parse_html (process pool workers build their own)
+_parser: Optional[WebScraper] = None
+
+
+def parse_html(html: str, url: str, with_links: bool = True) -> Tuple[str, List[str]]:
+    """
+    Extract a page's text and internal links.
+    
+    A module-level function so it can be sent to a process pool; link
+    filtering against the crawl's visited set is left to the caller.
+    
+    Returns:
+        Tuple of (text, links)
+    """
+    global _parser
+    if _parser is None:
+        _parser = WebScraper()
+    text = _parser.extract_text_from_html(html, url)
+    links = _parser.get_links(html, url, visited=set()) if with_links else []
+    return text, links
@@ -0,0 +1,69 @@
+"""
+Sharding Module
+Consistent-hash ring that assigns websites (by url_hash) to backend nodes.
+"""
+
+import bisect
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+
+def get_url_hash(url: str) -> str:
+    """Generate a unique hash for a URL (the key used for routing and storage)."""
+    return hashlib.md5(url.encode()).hexdigest()
+
+
+def _point(key: str) -> int:
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes.
+
+    Each node owns `vnodes` points on the ring; a key belongs to the node
+    owning the first point clockwise from the key's hash. Adding or removing
+    a node only moves the keys in the arcs it gains or loses, about 1/N of
+    all keys, and virtual nodes keep the arcs evenly sized.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 128):
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self._nodes: List[str] = []
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return list(self._nodes)
+
+    def add(self, node: str) -> None:
+        if node in self._nodes:
+            return
+        self._nodes.append(node)
+        for i in range(self.vnodes):
+            point = _point(f"{node}#{i}")
+            if point in self._owners:
+                continue  # astronomically rare collision; first owner keeps it
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node: str) -> None:
+        if node not in self._nodes:
+            return
+        self._nodes.remove(node)
+        for point in [p for p, owner in self._owners.items() if owner == node]:
+            del self._owners[point]
+        self._points = sorted(self._owners)
+
+    def node_for(self, key: str) -> Optional[str]:
+        """Owning node for a key, or None if the ring is empty."""
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, _point(key)) % len(self._points)
+        return self._owners[self._points[i]]
+
+    def copy(self) -> 'HashRing':
+        return HashRing(self._nodes, self.vnodes)
@@ -0,0 +1,286 @@
+"""
+Single-Flight Module
+Coalesces identical concurrent calls so only one of them does the work.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+
+def make_key(*parts: str) -> str:
+    """Build a coalescing key from normalized parts."""
+    normalized = []
+    for part in parts:
+        part = re.sub(r'\s+', ' ', (part or '').lower()).strip()
+        normalized.append(part.rstrip('?!. '))
+    return hashlib.md5('\x1f'.join(normalized).encode()).hexdigest()
+
+
+class _Call:
+    """One in-flight call that followers wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; concurrent callers with the
+    same key wait for it and all receive its result.
+
+    Within a process, followers wait on the leader's event. When shared_dir
+    is set, leaders in different worker processes also serialize on a lock
+    file per key, and results go into a TTL cache on disk: for shared_ttl
+    seconds after a call finishes, a call with the same key in any worker
+    returns the cached result instead of recomputing it, so an answer can
+    be up to shared_ttl seconds old. Shared results must be
+    JSON-serializable.
+
+    Expired results and their idle lock files are swept every
+    sweep_interval seconds, so one-off keys don't pile up in shared_dir.
+    """
+
+    def __init__(
+        self,
+        shared_dir: Optional[str] = None,
+        shared_ttl: float = 5.0,
+        shared_wait: float = 60.0,
+        poll_interval: float = 0.05,
+        sweep_interval: float = 60.0
+    ):
+        self.shared_dir = shared_dir if FCNTL_AVAILABLE else None
+        self.shared_ttl = shared_ttl
+        self.shared_wait = shared_wait
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+
+        if self.shared_dir:
+            os.makedirs(self.shared_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.stats = {
+            "executed": 0,       # calls that actually ran func
+            "coalesced": 0,      # in-process duplicates that waited instead
+            "shared_hits": 0,    # duplicates served from another worker's result
+            "in_flight": 0
+        }
+
+    def do(self, key: str, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run func once for all concurrent callers with the same key.
+
+        Args:
+            key: Coalescing key (see make_key)
+            func: Zero-argument callable doing the work
+
+        Returns:
+            Tuple of (result, shared) where shared is True if this caller
+            received a result computed for someone else
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.stats["in_flight"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        shared = False
+        try:
+            if self.shared_dir:
+                call.result, shared = self._do_shared(key, func)
+            else:
+                call.result = self._execute(func)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self.stats["in_flight"] -= 1
+            call.done.set()
+
+        return call.result, shared
+
+    def _execute(self, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.stats["executed"] += 1
+        return func()
+
+    def _read_shared(self, result_path: str) -> Optional[Any]:
+        """Return another worker's result if it's still fresh."""
+        try:
+            if time.time() - os.path.getmtime(result_path) > self.shared_ttl:
+                return None
+            with open(result_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        return (
+            os.path.join(self.shared_dir, f"{key}.lock"),
+            os.path.join(self.shared_dir, f"{key}.json")
+        )
+
+    @staticmethod
+    def _is_current(lock_file, lock_path: str) -> bool:
+        """Whether an open lock file is still the one at lock_path (not swept)."""
+        try:
+            return os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino
+        except OSError:
+            return False
+
+    def _acquire(self, lock_path: str) -> Tuple[Any, bool]:
+        """
+        Open and lock a key's lock file, giving up after shared_wait seconds.
+
+        Returns:
+            Tuple of (open lock file, whether it is locked)
+        """
+        # Poll instead of blocking so green-thread workers keep serving
+        deadline = time.time() + self.shared_wait
+        while True:
+            lock_file = open(lock_path, 'a')
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except OSError:
+                    if time.time() >= deadline:
+                        return lock_file, False
+                    time.sleep(self.poll_interval)
+            if self._is_current(lock_file, lock_path):
+                return lock_file, True
+            # Swept while we waited; another leader may hold the new file
+            lock_file.close()
+
+    def _do_shared(self, key: str, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Serialize leaders across processes with a per-key lock file."""
+        self._maybe_sweep()
+        lock_path, result_path = self._paths(key)
+
+        lock_file, locked = self._acquire(lock_path)
+        try:
+            cached = self._read_shared(result_path)
+            if cached is not None:
+                with self._lock:
+                    self.stats["shared_hits"] += 1
+                return cached, True
+            if locked:
+                # Expired (or unreadable); don't leave it behind if func fails
+                self._unlink(result_path)
+
+            result = self._execute(func)
+
+            tmp_path = f"{result_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(result, f)
+                os.replace(tmp_path, result_path)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"[SINGLEFLIGHT] Could not share result for {key}: {e}")
+                self._unlink(tmp_path)
+            return result, False
+        finally:
+            if locked:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _maybe_sweep(self) -> None:
+        with self._lock:
+            now = time.time()
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        try:
+            removed = self.sweep()
+            if removed:
+                print(f"[SINGLEFLIGHT] Swept {removed} expired results")
+        except OSError as e:
+            print(f"[SINGLEFLIGHT] Sweep failed: {e}")
+
+    def sweep(self) -> int:
+        """
+        Remove expired results and the lock files of keys no leader holds,
+        plus temp files left by a crashed worker.
+
+        Returns:
+            Number of keys removed
+        """
+        if not self.shared_dir:
+            return 0
+
+        now = time.time()
+        keys = set()
+        for name in os.listdir(self.shared_dir):
+            path = os.path.join(self.shared_dir, name)
+            if name.endswith('.tmp'):
+                try:
+                    if now - os.path.getmtime(path) > self.shared_wait:
+                        self._unlink(path)
+                except OSError:
+                    pass
+            elif name.endswith('.lock') or name.endswith('.json'):
+                keys.add(name.rsplit('.', 1)[0])
+
+        removed = 0
+        for key in keys:
+            if self._sweep_key(key, now):
+                removed += 1
+        return removed
+
+    def _sweep_key(self, key: str, now: float) -> bool:
+        """Drop one key's files unless its result is fresh or a leader holds its lock."""
+        lock_path, result_path = self._paths(key)
+        with open(lock_path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False  # a leader is working on it
+            try:
+                if not self._is_current(lock_file, lock_path):
+                    return False
+                try:
+                    if now - os.path.getmtime(result_path) <= self.shared_ttl:
+                        return False
+                except FileNotFoundError:
+                    pass
+                self._unlink(result_path)
+                self._unlink(lock_path)
+                return True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,278 @@
+"""
+Site Registry Module
+Process-shared store of website metadata, scraped content and vector indexes,
+backed by SQLite in WAL mode with zlib-compressed blobs.
+"""
+
+import json
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from db import connect, ensure_parent_dir, transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sites (
+    url_hash TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    content_length INTEGER NOT NULL DEFAULT 0,
+    chunks_count INTEGER NOT NULL DEFAULT 0,
+    index_version INTEGER NOT NULL DEFAULT 0,
+    scraped_at TEXT,
+    trained_at TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sites_user_id_idx ON sites (user_id, updated_at);
+CREATE TABLE IF NOT EXISTS site_content (
+    url_hash TEXT PRIMARY KEY,
+    content BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS site_indexes (
+    url_hash TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    dimension INTEGER NOT NULL,
+    chunks BLOB NOT NULL,
+    embeddings BLOB NOT NULL
+);
+"""
+
+# Site lifecycle
+SCRAPED = 'scraped'
+READY = 'ready'
+DELETED = 'deleted'  # tombstone that keeps index_version increasing
+
+
+def _compress(data: bytes) -> bytes:
+    return zlib.compress(data, 6)
+
+
+def _decompress(blob: bytes) -> bytes:
+    return zlib.decompress(blob)
+
+
+class SiteRegistry:
+    """
+    Registry of processed websites shared by every worker process.
+
+    Metadata rows are small and indexed by url_hash and user_id; scraped
+    text and vector indexes live in separate compressed blob tables and are
+    only read when a train job or a cold worker needs them.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        ensure_parent_dir(db_path)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return connect(self.db_path)
+
+    def _row_to_site(self, row) -> Dict:
+        return {
+            "url_hash": row["url_hash"],
+            "url": row["url"],
+            "user_id": row["user_id"],
+            "status": row["status"],
+            "content_length": row["content_length"],
+            "chunks_count": row["chunks_count"],
+            "index_version": row["index_version"],
+            "scraped_at": row["scraped_at"],
+            "trained_at": row["trained_at"],
+        }
+
+    def get(self, url_hash: str) -> Optional[Dict]:
+        """Site metadata, without content."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM sites WHERE url_hash = ? AND status != ?", (url_hash, DELETED)
+            ).fetchone()
+        return self._row_to_site(row) if row else None
+
+    def __contains__(self, url_hash: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sites WHERE url_hash = ? AND status != ?", (url_hash, DELETED)
+            ).fetchone()
+        return row is not None
+
+    def list_for_user(self, user_id: str, limit: int = 100) -> List[Dict]:
+        """A user's websites, most recently updated first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM sites WHERE user_id = ? AND status != ? ORDER BY updated_at DESC LIMIT ?",
+                (user_id, DELETED, limit)
+            ).fetchall()
+        return [self._row_to_site(row) for row in rows]
+
+    def save_scraped(self, url_hash: str, url: str, user_id: str, content: str) -> None:
+        """Store scraped content and mark the site scraped, in one transaction."""
+        now = time.time()
+        blob = _compress(content.encode('utf-8'))
+        with self._connect() as conn, transaction(conn):
+            conn.execute(
+                "INSERT INTO sites (url_hash, url, user_id, status, content_length, scraped_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(url_hash) DO UPDATE SET url = excluded.url, user_id = excluded.user_id, "
+                "status = excluded.status, content_length = excluded.content_length, "
+                "scraped_at = excluded.scraped_at, updated_at = excluded.updated_at",
+                (url_hash, url, user_id, SCRAPED, len(content), datetime.utcnow().isoformat(), now)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO site_content (url_hash, content) VALUES (?, ?)",
+                (url_hash, blob)
+            )
+
+    def get_content(self, url_hash: str) -> Optional[str]:
+        """Decompressed scraped text for a site."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT content FROM site_content WHERE url_hash = ?", (url_hash,)).fetchone()
+        return _decompress(row["content"]).decode('utf-8') if row else None
+
+    def save_index(self, url_hash: str, chunks: List[str], embeddings: np.ndarray) -> int:
+        """
+        Store a site's chunks and vectors and mark it ready, atomically.
+
+        Returns:
+            The new index version; workers holding an older version reload
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        chunks_blob = _compress(json.dumps(chunks).encode('utf-8'))
+        vectors_blob = _compress(embeddings.tobytes())
+        now = time.time()
+
+        with self._connect() as conn, transaction(conn):
+            row = conn.execute("SELECT index_version, status FROM sites WHERE url_hash = ?", (url_hash,)).fetchone()
+            if row is None or row["status"] == DELETED:
+                raise ValueError("Website not found. Please scrape the website first.")
+            version = row["index_version"] + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO site_indexes (url_hash, version, dimension, chunks, embeddings) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url_hash, version, embeddings.shape[1], chunks_blob, vectors_blob)
+            )
+            conn.execute(
+                "UPDATE sites SET status = ?, chunks_count = ?, index_version = ?, trained_at = ?, "
+                "updated_at = ? WHERE url_hash = ?",
+                (READY, len(chunks), version, datetime.utcnow().isoformat(), now, url_hash)
+            )
+        return version
+
+    def load_index(self, url_hash: str) -> Optional[Tuple[int, List[str], np.ndarray]]:
+        """
+        Load a site's stored index.
+
+        Returns:
+            Tuple of (version, chunks, embeddings) or None if not trained
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM site_indexes WHERE url_hash = ?", (url_hash,)).fetchone()
+        if row is None:
+            return None
+        chunks = json.loads(_decompress(row["chunks"]).decode('utf-8'))
+        embeddings = np.frombuffer(_decompress(row["embeddings"]), dtype=np.float32)
+        embeddings = embeddings.reshape(-1, row["dimension"]).copy()
+        return row["version"], chunks, embeddings
+
+    def counts(self) -> Dict[str, int]:
+        """Number of sites per status."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM sites WHERE status != ? GROUP BY status", (DELETED,)
+            ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def list_hashes(self) -> List[str]:
+        """url_hash of every stored site."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT url_hash FROM sites WHERE status != ?", (DELETED,)).fetchall()
+        return [row["url_hash"] for row in rows]
+
+    def export_site(self, url_hash: str) -> Optional[Dict]:
+        """
+        Everything stored for a site, with blobs left compressed, for moving
+        it to another node.
+
+        Returns:
+            Dict with 'site' (row), 'content' and 'index' (or None), or None
+            if the site is unknown
+        """
+        with self._connect() as conn:
+            site = conn.execute(
+                "SELECT * FROM sites WHERE url_hash = ? AND status != ?", (url_hash, DELETED)
+            ).fetchone()
+            if site is None:
+                return None
+            content = conn.execute(
+                "SELECT content FROM site_content WHERE url_hash = ?", (url_hash,)
+            ).fetchone()
+            index = conn.execute("SELECT * FROM site_indexes WHERE url_hash = ?", (url_hash,)).fetchone()
+        return {
+            "site": dict(site),
+            "content": content["content"] if content else None,
+            "index": dict(index) if index else None,
+        }
+
+    def import_site(self, data: Dict) -> None:
+        """
+        Store a site exported by export_site, replacing any local copy.
+
+        The index version is raised above any version this node used for
+        the site before, so no worker mistakes an old in-memory index for
+        the imported one.
+        """
+        site = dict(data["site"])
+        url_hash = site["url_hash"]
+        columns = [
+            "url_hash", "url", "user_id", "status", "content_length", "chunks_count",
+            "index_version", "scraped_at", "trained_at", "updated_at"
+        ]
+        index = data.get("index")
+        with self._connect() as conn, transaction(conn):
+            local = conn.execute("SELECT index_version FROM sites WHERE url_hash = ?", (url_hash,)).fetchone()
+            if local is not None and local["index_version"] >= site["index_version"]:
+                site["index_version"] = local["index_version"] + 1
+            if index is not None:
+                index = dict(index, version=site["index_version"])
+            conn.execute(
+                f"INSERT OR REPLACE INTO sites ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                [site[column] for column in columns]
+            )
+            conn.execute("DELETE FROM site_content WHERE url_hash = ?", (url_hash,))
+            if data.get("content") is not None:
+                conn.execute(
+                    "INSERT INTO site_content (url_hash, content) VALUES (?, ?)",
+                    (url_hash, data["content"])
+                )
+            conn.execute("DELETE FROM site_indexes WHERE url_hash = ?", (url_hash,))
+            if index is not None:
+                conn.execute(
+                    "INSERT INTO site_indexes (url_hash, version, dimension, chunks, embeddings) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (url_hash, index["version"], index["dimension"], index["chunks"], index["embeddings"])
+                )
+
+    def delete_site(self, url_hash: str) -> bool:
+        """
+        Remove a site's content and index.
+
+        The metadata row stays behind as a tombstone with a bumped
+        index_version, so workers holding the old index in memory see it
+        is stale, and a later scrape or import of the site gets a newer
+        version than any they hold.
+        """
+        with self._connect() as conn, transaction(conn):
+            deleted = conn.execute(
+                "UPDATE sites SET status = ?, index_version = index_version + 1, chunks_count = 0, "
+                "content_length = 0, updated_at = ? WHERE url_hash = ? AND status != ?",
+                (DELETED, time.time(), url_hash, DELETED)
+            ).rowcount
+            conn.execute("DELETE FROM site_content WHERE url_hash = ?", (url_hash,))
+            conn.execute("DELETE FROM site_indexes WHERE url_hash = ?", (url_hash,))
+        return deleted > 0
@@ -0,0 +1,189 @@
+"""
+Tests for admission control: token-bucket rate limits (429) and work pools
+with bounded waits (503), both with Retry-After hints.
+"""
+
+import threading
+import time
+
+import pytest
+
+import admission
+from admission import Overloaded, RateLimit, TokenBucket, WorkPool
+
+
+class FakeClock:
+    """Stands in for the time module inside admission so buckets refill on demand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(admission, 'time', clock)
+    return clock
+
+
+def test_token_bucket_refills_up_to_burst():
+    bucket = TokenBucket(rate=2, burst=3)
+    now = bucket.updated
+    for _ in range(3):
+        assert bucket.wait_time(now) == 0
+        bucket.consume()
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+
+    assert bucket.wait_time(now + 0.5) == 0
+    # A long idle period refills to burst, not beyond
+    bucket.wait_time(now + 100)
+    assert bucket.tokens == 3
+
+
+def test_user_limit_applies_per_user(clock):
+    limit = RateLimit('chat', rate=100, burst=100, user_rate=1, user_burst=2)
+    limit.check('alice')
+    limit.check('alice')
+
+    with pytest.raises(Overloaded) as excinfo:
+        limit.check('alice')
+    assert excinfo.value.status == 429
+    assert excinfo.value.retry_after == 1
+    assert "slow down" in str(excinfo.value)
+
+    # Other users have their own bucket
+    limit.check('bob')
+
+    clock.advance(1)
+    limit.check('alice')
+
+
+def test_global_limit_applies_across_users(clock):
+    limit = RateLimit('ingest', rate=0.5, burst=2, user_rate=10, user_burst=10)
+    limit.check('alice')
+    limit.check('bob')
+
+    with pytest.raises(Overloaded) as excinfo:
+        limit.check('carol')
+    assert excinfo.value.status == 429
+    assert excinfo.value.retry_after == 2
+    assert "busy" in str(excinfo.value)
+
+    clock.advance(2)
+    limit.check('carol')
+
+
+def test_rejected_request_takes_no_tokens(clock):
+    limit = RateLimit('chat', rate=1, burst=2, user_rate=1, user_burst=1)
+    limit.check('alice')
+    with pytest.raises(Overloaded):
+        limit.check('alice')
+    # The global bucket still holds its second token for someone else
+    limit.check('bob')
+
+
+def test_zero_rate_disables_a_bucket(clock):
+    limit = RateLimit('chat', rate=0, burst=0, user_rate=0, user_burst=0)
+    for _ in range(100):
+        limit.check('alice')
+
+
+def test_least_recently_seen_users_are_dropped(clock):
+    limit = RateLimit('chat', rate=0, burst=0, user_rate=1, user_burst=1, max_users=2)
+    for user in ('alice', 'bob', 'carol'):
+        limit.check(user)
+    assert list(limit._users) == ['bob', 'carol']
+
+
+def test_full_queue_is_rejected_immediately():
+    pool = WorkPool('llm', limit=1, max_waiting=0, max_wait=5)
+    with pool.slot():
+        started = time.monotonic()
+        with pytest.raises(Overloaded) as excinfo:
+            with pool.slot():
+                pass
+        assert time.monotonic() - started < 1
+    assert excinfo.value.status == 503
+    assert excinfo.value.retry_after >= 1
+    assert pool.snapshot()["rejected_full"] == 1
+
+
+def test_wait_past_max_wait_is_rejected():
+    pool = WorkPool('llm', limit=1, max_waiting=1, max_wait=0.1)
+    with pool.slot():
+        with pytest.raises(Overloaded) as excinfo:
+            with pool.slot():
+                pass
+    assert excinfo.value.status == 503
+    snapshot = pool.snapshot()
+    assert snapshot["rejected_timeout"] == 1
+    assert snapshot["waiting"] == 0
+    assert snapshot["active"] == 0
+
+
+def run_in_thread(pool: WorkPool, background: bool):
+    """Start a thread that takes a slot; returns (acquired event, errors list, thread)."""
+    acquired = threading.Event()
+    errors = []
+
+    def take():
+        try:
+            with pool.slot(background=background):
+                acquired.set()
+        except Overloaded as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=take)
+    thread.start()
+    return acquired, errors, thread
+
+
+def test_waiting_caller_gets_a_released_slot():
+    pool = WorkPool('llm', limit=1, max_waiting=1, max_wait=5)
+    with pool.slot():
+        acquired, errors, thread = run_in_thread(pool, background=False)
+        time.sleep(0.05)
+        assert not acquired.is_set()
+    thread.join(5)
+    assert acquired.is_set() and not errors
+
+
+def test_background_callers_wait_without_a_deadline():
+    # max_waiting=0 and a tiny max_wait would reject any interactive caller
+    pool = WorkPool('crawl', limit=1, max_waiting=0, max_wait=0.01)
+    with pool.slot(background=True):
+        acquired, errors, thread = run_in_thread(pool, background=True)
+        time.sleep(0.3)
+        assert not acquired.is_set()
+        assert pool.snapshot()["waiting"] == 1
+    thread.join(5)
+    assert acquired.is_set() and not errors
+    assert pool.snapshot()["admitted"] == 2
+
+
+def test_background_waiter_heartbeats_until_it_gets_a_slot():
+    pool = WorkPool('crawl', limit=1, heartbeat_interval=0.05)
+    beats = []
+    acquired = threading.Event()
+
+    def take():
+        with pool.slot(background=True, heartbeat=lambda: beats.append(time.monotonic())):
+            acquired.set()
+
+    with pool.slot(background=True):
+        thread = threading.Thread(target=take)
+        thread.start()
+        time.sleep(0.3)
+        assert not acquired.is_set()
+        assert len(beats) >= 3
+    thread.join(5)
+    assert acquired.is_set()
+    count = len(beats)
+    time.sleep(0.1)
+    assert len(beats) == count  # no heartbeats once the slot is held
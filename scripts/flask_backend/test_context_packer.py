@@ -0,0 +1,86 @@
+"""
+Tests for context packing: overlap stripping between adjacent chunks,
+deduplication and the token budget.
+"""
+
+import random
+import re
+
+from context_packer import ContextPacker, SPAN_SEPARATOR, estimate_tokens, merge_overlapping
+from embeddings import split_text
+
+
+def make_text(sentences: int = 60, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    return ' '.join(
+        f"Sentence number {i} talks about {rng.choice(['pricing', 'support', 'shipping'])} in some detail."
+        for i in range(sentences)
+    )
+
+
+def test_merge_strips_shared_text():
+    left = "The plan includes support by email and phone during business hours"
+    right = "email and phone during business hours, and chat on weekends."
+    assert merge_overlapping(left, right) == (
+        "The plan includes support by email and phone during business hours, and chat on weekends."
+    )
+
+
+def test_merge_keeps_short_coincidental_matches():
+    # Shorter than MIN_OVERLAP_CHARS, so not treated as chunk overlap
+    assert merge_overlapping("Prices start at ten", "ten dollars a month.") == (
+        "Prices start at ten ten dollars a month."
+    )
+
+
+def test_adjacent_chunks_rebuild_the_source_text():
+    text = make_text()
+    chunks = split_text(text)
+    assert len(chunks) > 2
+
+    merged = chunks[0]
+    for chunk in chunks[1:]:
+        merged = merge_overlapping(merged, chunk)
+    assert merged == re.sub(r'\s+', ' ', text).strip()
+
+
+def test_pack_merges_consecutive_positions_into_one_span():
+    text = make_text()
+    chunks = split_text(text)
+    hits = [{"chunk": chunk, "score": 0.5, "position": i} for i, chunk in enumerate(chunks)]
+
+    packed = ContextPacker(token_budget=10000).pack(hits)
+
+    assert packed["spans"] == 1
+    assert packed["chunks"] == len(chunks)
+    assert packed["context"] == re.sub(r'\s+', ' ', text).strip()
+
+
+def test_pack_drops_duplicate_spans_and_orders_by_score():
+    hits = [
+        {"chunk": "Shipping takes three to five business days.", "score": 0.4, "position": 7},
+        {"chunk": "Support is available around the clock.", "score": 0.9, "position": 2},
+        {"chunk": "Shipping takes three to five business days.", "score": 0.3, "position": 12},
+    ]
+    packed = ContextPacker(token_budget=1000).pack(hits)
+
+    assert packed["context"].split(SPAN_SEPARATOR) == [
+        "Support is available around the clock.",
+        "Shipping takes three to five business days.",
+    ]
+
+
+def test_pack_respects_the_token_budget():
+    chunks = split_text(make_text(200))
+    hits = [{"chunk": chunk, "score": 1.0 - i / 100} for i, chunk in enumerate(chunks)]
+
+    packed = ContextPacker(token_budget=300).pack(hits)
+
+    assert 0 < packed["tokens"] <= 300
+    assert estimate_tokens(packed["context"]) <= 300
+
+
+def test_pack_trims_an_oversized_best_span():
+    packed = ContextPacker(token_budget=50).pack([make_text(100)])
+    assert packed["spans"] == 1
+    assert 0 < packed["tokens"] <= 50
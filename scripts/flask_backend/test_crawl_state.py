@@ -0,0 +1,101 @@
+"""
+Tests for crawl checkpoints: an interrupted crawl resumes without fetching
+its visited pages again, and stale checkpoints are started over.
+"""
+
+import pytest
+
+from benchmark import FixtureSite
+from crawl_state import CrawlCheckpointStore, PAGE_OK
+from db import connect
+from scraper import WebScraper
+
+MAX_PAGES = 20
+
+
+class Interrupted(BaseException):
+    """
+    Stands in for the worker being killed mid-crawl (a BaseException, since
+    the scraper records ordinary fetch errors and carries on).
+    """
+
+
+@pytest.fixture(scope="module")
+def site_url():
+    site = FixtureSite(pages=30, paragraphs=5, seed=1)
+    url = site.start()
+    yield url
+    site.stop()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CrawlCheckpointStore(str(tmp_path / "crawls.sqlite3"), every_pages=3, every_seconds=100)
+
+
+def make_scraper(fetched, fail_after=None):
+    scraper = WebScraper()
+    scraper.request_delay = 0
+    scraper.max_pages = MAX_PAGES
+    get = scraper.session.get
+
+    def counting_get(url, **kwargs):
+        if fail_after is not None and len(fetched) >= fail_after:
+            raise Interrupted(url)
+        fetched.append(url)
+        return get(url, **kwargs)
+
+    scraper.session.get = counting_get
+    return scraper
+
+
+def test_resumed_crawl_does_not_refetch_visited_pages(store, site_url):
+    first = []
+    checkpoint = store.open("site", site_url)
+    with pytest.raises(Interrupted):
+        make_scraper(first, fail_after=8).scrape_website(site_url, checkpoint=checkpoint)
+
+    saved = store.status("site")["pages"][PAGE_OK]
+    assert 0 < saved < len(first)
+
+    second = []
+    checkpoint = store.open("site", site_url)
+    assert checkpoint.resumed
+    visited = set(checkpoint.state.visited)
+    assert len(visited) == saved
+
+    content = make_scraper(second).scrape_website(site_url, checkpoint=checkpoint)
+
+    assert not visited & set(second)
+    # Only the pages fetched after the last checkpoint are fetched twice
+    assert len(first) + len(second) - len(set(first) | set(second)) == len(first) - saved
+    reference = make_scraper([]).scrape_website(site_url)
+    assert content.count("Page: ") == reference.count("Page: ") == MAX_PAGES
+
+
+def test_checkpoint_for_another_start_url_is_not_resumed(store, site_url):
+    checkpoint = store.open("site", site_url)
+    checkpoint.state.record(site_url, 0, PAGE_OK, 200, "home")
+    checkpoint.save()
+
+    assert not store.open("site", site_url + "page-3.html").resumed
+
+
+def test_stale_checkpoint_starts_over(store, site_url):
+    checkpoint = store.open("site", site_url)
+    checkpoint.state.record(site_url, 0, PAGE_OK, 200, "home")
+    checkpoint.save()
+    with connect(store.db_path) as conn:
+        conn.execute("UPDATE crawls SET updated_at = updated_at - ?", (store.max_age + 1,))
+
+    checkpoint = store.open("site", site_url)
+    assert not checkpoint.resumed
+    assert checkpoint.state.visited == set()
+    assert store.status("site")["pages"] == {}
+
+
+def test_discard_drops_the_checkpoint(store, site_url):
+    checkpoint = store.open("site", site_url)
+    checkpoint.save()
+    store.discard("site")
+    assert store.status("site") is None
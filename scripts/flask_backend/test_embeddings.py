@@ -0,0 +1,122 @@
+"""
+Tests for page assignment and the two-stage (page, then chunk) search used
+for large sites.
+"""
+
+import numpy as np
+import pytest
+
+from embeddings import EmbeddingManager, assign_pages
+
+
+@pytest.fixture
+def manager():
+    manager = EmbeddingManager()
+    manager.hierarchical_min_chunks = 1
+    manager.search_top_pages = 2
+    manager.search_max_per_page = 2
+    return manager
+
+
+def load_site(manager: EmbeddingManager, pages: int, chunks_per_page: int, index_id: str = "site"):
+    """
+    Index a site whose page p's chunks point along axis p; later chunks of
+    a page lean towards a shared last axis, so they score a little lower.
+    """
+    dimension = pages + 1
+    chunks, vectors = [], []
+    for page in range(pages):
+        for j in range(chunks_per_page):
+            marker = f"Page: https://example.com/p{page}\n" if j == 0 else ""
+            chunks.append(f"{marker}page {page} chunk {j}")
+            vector = np.zeros(dimension, dtype=np.float32)
+            vector[page] = 1.0
+            vector[-1] = 0.1 * j
+            vectors.append(vector)
+    manager.dimension = dimension
+    manager.load_index(index_id, chunks, np.array(vectors))
+    return chunks
+
+
+def query_for(manager: EmbeddingManager, weights):
+    """Query vector with the given weight on each page's axis."""
+    query = np.zeros((1, manager.dimension), dtype=np.float32)
+    for page, weight in weights.items():
+        query[0, page] = weight
+    return query
+
+
+def search(manager: EmbeddingManager, chunks, query, top_k: int, index_id: str = "site"):
+    return manager._search_vectors(index_id, chunks, query, top_k)
+
+
+def pages_of(hits, chunks):
+    page_ids = assign_pages(chunks)
+    return [page_ids[hit["position"]] for hit in hits]
+
+
+def test_assign_pages_follows_markers():
+    chunks = [
+        "intro before any marker",
+        "Page: https://example.com/a first page",
+        "still the first page",
+        "Page: https://example.com/b ends b and starts Page: https://example.com/c",
+        "rest of c",
+        "Page: https://example.com/a seen again",
+    ]
+    # A chunk with two markers belongs to the last one; b never owns a chunk
+    assert assign_pages(chunks) == [0, 0, 0, 1, 1, 0]
+
+
+def test_small_site_uses_flat_search(manager):
+    manager.hierarchical_min_chunks = 1000
+    chunks = load_site(manager, pages=6, chunks_per_page=5)
+    assert "site" not in manager.page_indices
+
+    hits = search(manager, chunks, query_for(manager, {0: 1.0}), top_k=4)
+    # No per-page cap: all four hits come from page 0
+    assert pages_of(hits, chunks) == [0, 0, 0, 0]
+    assert [hit["position"] for hit in hits] == [0, 1, 2, 3]
+
+
+def test_site_with_few_pages_uses_flat_search(manager):
+    chunks = load_site(manager, pages=manager.search_top_pages, chunks_per_page=5)
+    assert "site" not in manager.page_indices
+    assert pages_of(search(manager, chunks, query_for(manager, {0: 1.0}), top_k=3), chunks) == [0, 0, 0]
+
+
+def test_large_site_builds_a_page_index(manager):
+    load_site(manager, pages=6, chunks_per_page=5)
+    page_index = manager.page_indices["site"]
+    assert len(page_index["members"]) == 6
+    assert [list(members) for members in page_index["members"]][1] == [5, 6, 7, 8, 9]
+
+
+def test_per_page_cap_spreads_hits_over_pages(manager):
+    chunks = load_site(manager, pages=6, chunks_per_page=5)
+
+    hits = search(manager, chunks, query_for(manager, {0: 1.0, 1: 0.8}), top_k=4)
+
+    assert sorted(pages_of(hits, chunks)) == [0, 0, 1, 1]
+    # Best first, and each page contributes its best chunks
+    assert [hit["position"] for hit in hits] == [0, 1, 5, 6]
+    assert [hit["score"] for hit in hits] == sorted((hit["score"] for hit in hits), reverse=True)
+
+
+def test_overflow_fills_top_k_when_too_few_pages_have_candidates(manager):
+    manager.search_max_per_page = 1
+    chunks = load_site(manager, pages=3, chunks_per_page=4)
+
+    hits = search(manager, chunks, query_for(manager, {0: 1.0, 1: 0.9, 2: 0.8}), top_k=5)
+
+    # Each page's best chunk under the cap (0, 4, 8), then the best of
+    # the rest (page 0's next two) to reach top_k, all in score order
+    assert [hit["position"] for hit in hits] == [0, 1, 2, 4, 8]
+    assert set(pages_of(hits, chunks)) == {0, 1, 2}
+
+
+def test_reloading_a_small_version_drops_the_page_index(manager):
+    load_site(manager, pages=6, chunks_per_page=5)
+    manager.hierarchical_min_chunks = 1000
+    load_site(manager, pages=6, chunks_per_page=5)
+    assert "site" not in manager.page_indices
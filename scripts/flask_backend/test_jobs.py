@@ -0,0 +1,172 @@
+"""
+Tests for the job queue: claiming under per-kind limits, requeueing jobs
+whose worker stopped heartbeating, and retention of finished jobs.
+"""
+
+import threading
+import time
+
+import pytest
+
+from admission import WorkPool
+from db import connect
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(
+        str(tmp_path / "jobs.sqlite3"),
+        workers=2,
+        limits={'scrape': 1},
+        stale_after=300,
+        max_attempts=2,
+        retention=3600
+    )
+    queue.register('scrape', lambda job, report: {"ok": True})
+    queue.register('train', lambda job, report: {"ok": True})
+    return queue
+
+
+def age(queue: JobQueue, job_id: str, seconds: float, column: str = 'updated_at') -> None:
+    """Move one of a job's timestamps into the past."""
+    with connect(queue.db_path) as conn:
+        conn.execute(f"UPDATE jobs SET {column} = {column} - ? WHERE id = ?", (seconds, job_id))
+
+
+def test_submit_returns_the_active_job_for_a_site(queue):
+    first = queue.submit('scrape', 'site', {"url": "https://example.com/"})
+    again = queue.submit('scrape', 'site', {"url": "https://example.com/"})
+    assert again["id"] == first["id"]
+    assert queue.submit('train', 'site', {})["id"] != first["id"]
+
+
+def test_claim_takes_the_oldest_job_within_kind_limits(queue):
+    first = queue.submit('scrape', 'a', {})
+    second = queue.submit('scrape', 'b', {})
+    train = queue.submit('train', 'a', {})
+
+    claimed = queue._claim()
+    assert claimed["id"] == first["id"]
+    assert claimed["status"] == RUNNING
+    assert claimed["attempts"] == 1
+
+    # At most one scrape runs at a time, so the train job goes next
+    assert queue._claim()["id"] == train["id"]
+    assert queue._claim() is None
+    assert queue.get(second["id"])["status"] == QUEUED
+
+
+def test_jobs_without_a_handler_are_left_queued(queue):
+    job = queue.submit('bulk_ingest', 'batch', {})
+    assert queue._claim() is None
+    assert queue.get(job["id"])["status"] == QUEUED
+
+
+def test_run_job_records_result_and_failure(queue):
+    queue.register('train', lambda job, report: 1 / 0)
+    scrape = queue.submit('scrape', 'a', {})
+    train = queue.submit('train', 'a', {})
+    queue.run_job(queue._claim())
+    queue.run_job(queue._claim())
+
+    assert queue.get(scrape["id"])["status"] == DONE
+    assert queue.get(scrape["id"])["result"] == {"ok": True}
+    failed = queue.get(train["id"])
+    assert failed["status"] == FAILED
+    assert "division by zero" in failed["error"]
+
+
+def test_silent_running_job_is_requeued_then_failed(queue):
+    job = queue.submit('scrape', 'a', {})
+    queue._claim()
+
+    age(queue, job["id"], 301)
+    retried = queue._claim()
+    assert retried["id"] == job["id"]
+    assert retried["attempts"] == 2
+
+    # Out of attempts: failed instead of requeued
+    age(queue, job["id"], 301)
+    assert queue._claim() is None
+    stale = queue.get(job["id"])
+    assert stale["status"] == FAILED
+    assert stale["error"] == 'Worker stopped responding'
+
+
+def test_reporting_job_is_not_requeued(queue):
+    job = queue.submit('scrape', 'a', {})
+    queue._claim()
+
+    age(queue, job["id"], 301)
+    queue.report(job["id"], "fetching", 1, 10)
+    assert queue._claim() is None
+    assert queue.get(job["id"])["attempts"] == 1
+
+
+def test_report_publishes_progress_and_eta(queue):
+    job = queue.submit('scrape', 'a', {})
+    queue._claim()
+    queue.report(job["id"], "fetching", 0, 10)
+    queue.report(job["id"], "fetching", 5, 10, pages_fetched=5)
+
+    progress = queue.get(job["id"])["progress"]
+    assert (progress["done"], progress["total"], progress["pages_fetched"]) == (5, 10, 5)
+    assert progress["eta_seconds"] >= 0
+
+
+def test_retention_deletes_only_old_finished_jobs(queue):
+    old_done = queue.submit('scrape', 'a', {})
+    old_failed = queue.submit('train', 'a', {})
+    queue.register('train', lambda job, report: 1 / 0)
+    queue.run_job(queue._claim())
+    queue.run_job(queue._claim())
+    recent = queue.submit('scrape', 'b', {})
+    queue.run_job(queue._claim())
+    waiting = queue.submit('scrape', 'c', {})
+
+    for job in (old_done, old_failed):
+        age(queue, job["id"], 3601, 'finished_at')
+    age(queue, waiting["id"], 7200, 'created_at')
+
+    queue._last_sweep = 0
+    queue._claim()
+
+    assert queue.get(old_done["id"]) is None
+    assert queue.get(old_failed["id"]) is None
+    assert queue.get(recent["id"])["status"] == DONE
+    assert queue.get(waiting["id"]) is not None
+
+
+def test_retention_sweep_is_rate_limited(queue):
+    job = queue.submit('scrape', 'a', {})
+    queue.run_job(queue._claim())
+    age(queue, job["id"], 3601, 'finished_at')
+
+    queue._last_sweep = time.time()
+    queue._claim()
+    assert queue.get(job["id"]) is not None
+
+
+def test_job_waiting_for_a_busy_pool_is_not_requeued(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), stale_after=0.2)
+    pool = WorkPool('crawl', limit=1, heartbeat_interval=0.05)
+
+    def handler(job, report):
+        with pool.slot(background=True, heartbeat=lambda: report("waiting")):
+            return {"ok": True}
+
+    queue.register('scrape', handler)
+    job = queue.submit('scrape', 'a', {})
+
+    with pool.slot(background=True):
+        worker = threading.Thread(target=queue.run_job, args=(queue._claim(),))
+        worker.start()
+        time.sleep(0.6)
+        # Well past stale_after, but the heartbeat keeps the job ours
+        assert queue._claim() is None
+        assert queue.get(job["id"])["phase"] == "waiting"
+    worker.join(5)
+
+    finished = queue.get(job["id"])
+    assert (finished["status"], finished["attempts"]) == (DONE, 1)
@@ -0,0 +1,95 @@
+"""
+Tests for the page archive: content-addressed dedup, commit/discard of a
+crawl's pending pages and pruning of unreferenced blobs.
+"""
+
+import pytest
+
+from page_archive import PageArchive, ZLIB, decompress
+
+HTML = b"<html><body><p>Same page on two sites.</p></body></html>"
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return PageArchive(str(tmp_path / "archive.sqlite3"), codec=ZLIB)
+
+
+def bodies(archive: PageArchive, url_hash: str):
+    return {page["url"]: decompress(page["data"], page["codec"]) for page in archive.pages(url_hash)}
+
+
+def test_identical_bodies_share_one_blob(archive):
+    digest_a = archive.put("site-a", "https://a.example/", HTML, status_code=200)
+    digest_b = archive.put("site-b", "https://b.example/", HTML, status_code=200)
+    archive.commit("site-a", ["https://a.example/"])
+    archive.commit("site-b", ["https://b.example/"])
+
+    assert digest_a == digest_b
+    stats = archive.stats()
+    assert stats["pages"] == 2
+    assert stats["blobs"] == 1
+    assert bodies(archive, "site-b") == {"https://b.example/": HTML}
+
+
+def test_pending_pages_are_hidden_until_commit(archive):
+    archive.put("site", "https://a.example/", HTML)
+    assert archive.pages("site") == []
+
+    assert archive.commit("site", ["https://a.example/"]) == 1
+    assert list(bodies(archive, "site")) == ["https://a.example/"]
+
+
+def test_only_headers_worth_keeping_are_stored(archive):
+    archive.put("site", "https://a.example/", HTML, headers={
+        "Content-Type": "text/html", "Set-Cookie": "secret", "ETag": "abc"
+    })
+    archive.commit("site", ["https://a.example/"])
+    assert archive.pages("site")[0]["headers"] == {"content-type": "text/html", "etag": "abc"}
+
+
+def test_commit_replaces_the_previous_crawl_and_prunes(archive):
+    archive.put("site", "https://a.example/", b"old home")
+    archive.put("site", "https://a.example/gone", b"old page")
+    archive.commit("site", ["https://a.example/", "https://a.example/gone"])
+
+    archive.put("site", "https://a.example/", b"new home")
+    archive.put("site", "https://a.example/unvisited", b"not part of the crawl")
+    archive.commit("site", ["https://a.example/"])
+
+    assert bodies(archive, "site") == {"https://a.example/": b"new home"}
+    assert archive.stats()["blobs"] == 1
+
+
+def test_discard_keeps_the_last_successful_crawl(archive):
+    archive.put("site", "https://a.example/", b"good crawl")
+    archive.commit("site", ["https://a.example/"])
+
+    archive.put("site", "https://a.example/", b"failed crawl")
+    archive.discard("site")
+
+    assert bodies(archive, "site") == {"https://a.example/": b"good crawl"}
+    assert archive.stats()["blobs"] == 1
+
+
+def test_shared_blob_survives_until_last_reference(archive):
+    for site in ("site-a", "site-b"):
+        archive.put(site, f"https://{site}/", HTML)
+        archive.commit(site, [f"https://{site}/"])
+
+    archive.delete_site("site-a")
+    assert archive.stats()["blobs"] == 1
+    archive.delete_site("site-b")
+    stats = archive.stats()
+    assert (stats["pages"], stats["blobs"], stats["storedBytes"]) == (0, 0, 0)
+
+
+def test_import_pages_copies_another_nodes_archive(archive, tmp_path):
+    archive.put("site", "https://a.example/", HTML, status_code=200)
+    archive.commit("site", ["https://a.example/"])
+
+    other = PageArchive(str(tmp_path / "other.sqlite3"))
+    other.import_pages("site", archive.pages("site"))
+
+    assert bodies(other, "site") == {"https://a.example/": HTML}
+    assert other.pages("site")[0]["status_code"] == 200
@@ -0,0 +1,41 @@
+"""
+Tests for the request profiler: one capture per process at a time, and the
+bounded set of saved profiles.
+"""
+
+import pytest
+
+from profiling import RequestProfiler
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    return RequestProfiler(str(tmp_path / "profiles"), token="secret", max_files=2)
+
+
+def test_overlapping_capture_is_skipped(profiler):
+    with profiler.capture("first") as first:
+        with profiler.capture("second") as second:
+            sum(range(1000))
+        assert second == {"name": None, "skipped": True}
+    assert first["name"] and not first["skipped"]
+
+    # The slot is free again once the first capture is saved
+    with profiler.capture("third") as third:
+        pass
+    assert third["name"]
+
+
+def test_only_the_newest_profiles_are_kept(profiler):
+    names = []
+    for i in range(4):
+        with profiler.capture(f"run-{i}") as info:
+            pass
+        names.append(info["name"])
+    assert [profile["name"] for profile in profiler.list_profiles()] == names[:1:-1]
+
+
+def test_token_is_checked(profiler):
+    assert profiler.should_profile("secret") == 'requested'
+    assert profiler.should_profile("wrong") is None
+    assert profiler.path_for("../secret.prof") is None
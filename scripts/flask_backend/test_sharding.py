@@ -0,0 +1,59 @@
+"""
+Tests for the consistent-hash ring: membership changes only move the keys
+of the arcs a node gains or loses.
+"""
+
+from sharding import HashRing, get_url_hash
+
+NODES = [f"http://node-{i}:5000" for i in range(5)]
+KEYS = [get_url_hash(f"https://site-{i}.example.com/") for i in range(5000)]
+
+
+def assignments(ring: HashRing):
+    return {key: ring.node_for(key) for key in KEYS}
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing().node_for(KEYS[0]) is None
+
+
+def test_assignment_is_deterministic():
+    assert assignments(HashRing(NODES)) == assignments(HashRing(reversed(NODES)))
+
+
+def test_keys_spread_over_all_nodes():
+    owners = list(assignments(HashRing(NODES)).values())
+    for node in NODES:
+        # Each of 5 nodes should get roughly 20% of the keys
+        assert 0.1 < owners.count(node) / len(KEYS) < 0.3
+
+
+def test_removing_a_node_moves_only_its_keys():
+    ring = HashRing(NODES)
+    before = assignments(ring)
+    removed = NODES[2]
+    ring.remove(removed)
+    after = assignments(ring)
+
+    moved = {key for key in KEYS if before[key] != after[key]}
+    assert moved == {key for key in KEYS if before[key] == removed}
+    assert removed not in after.values()
+
+
+def test_adding_a_node_moves_about_one_nth_of_keys_to_it():
+    ring = HashRing(NODES[:4])
+    before = assignments(ring)
+    ring.add(NODES[4])
+    after = assignments(ring)
+
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert all(after[key] == NODES[4] for key in moved)
+    assert 0.1 < len(moved) / len(KEYS) < 0.3
+
+
+def test_copy_is_independent():
+    ring = HashRing(NODES)
+    copy = ring.copy()
+    copy.remove(NODES[0])
+    assert ring.nodes == NODES
+    assert assignments(ring) != assignments(copy)
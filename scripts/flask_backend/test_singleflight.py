@@ -0,0 +1,173 @@
+"""
+Tests for single-flight coalescing: in-process followers, cross-worker lock
+files, the shared result TTL cache and its sweep.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from singleflight import FCNTL_AVAILABLE, SingleFlight, make_key
+
+needs_fcntl = pytest.mark.skipif(not FCNTL_AVAILABLE, reason="shared mode needs fcntl")
+
+
+def run_concurrently(callers):
+    """Run zero-argument callables in threads; returns their results or exceptions."""
+    results = [None] * len(callers)
+
+    def run(i):
+        try:
+            results[i] = callers[i]()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(callers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def slow(value, calls, delay=0.2):
+    def func():
+        calls.append(1)
+        time.sleep(delay)
+        return value
+    return func
+
+
+def age(path: str, seconds: float) -> None:
+    mtime = os.path.getmtime(path) - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_make_key_normalizes_whitespace_case_and_punctuation():
+    assert make_key("site", "What is  the PRICE?") == make_key("site", "what is the price")
+    assert make_key("site", "price") != make_key("other", "price")
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    results = run_concurrently([lambda: flight.do("k", slow({"answer": 42}, calls))] * 5)
+
+    assert len(calls) == 1
+    assert [result for result, _ in results] == [{"answer": 42}] * 5
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert flight.stats["executed"] == 1
+    assert flight.stats["coalesced"] == 4
+    assert flight.stats["in_flight"] == 0
+
+
+def test_exception_reaches_every_follower():
+    flight = SingleFlight()
+
+    def fail():
+        time.sleep(0.2)
+        raise RuntimeError("LLM unavailable")
+
+    results = run_concurrently([lambda: flight.do("k", fail)] * 4)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    # The failure is not cached: the next call runs again
+    assert flight.do("k", lambda: "ok") == ("ok", False)
+
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    calls = []
+    results = run_concurrently([
+        lambda: flight.do("a", slow("a", calls)),
+        lambda: flight.do("b", slow("b", calls)),
+    ])
+    assert len(calls) == 2
+    assert [result for result, _ in results] == ["a", "b"]
+
+
+@needs_fcntl
+def test_workers_share_one_execution_through_lock_files(tmp_path):
+    workers = [SingleFlight(shared_dir=str(tmp_path), shared_ttl=5) for _ in range(3)]
+    calls = []
+    results = run_concurrently([lambda w=w: w.do("k", slow("answer", calls)) for w in workers])
+
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["answer"] * 3
+    assert sum(w.stats["shared_hits"] for w in workers) == 2
+
+
+@needs_fcntl
+def test_shared_result_is_reused_only_within_ttl(tmp_path):
+    first = SingleFlight(shared_dir=str(tmp_path), shared_ttl=5)
+    second = SingleFlight(shared_dir=str(tmp_path), shared_ttl=5)
+
+    assert first.do("k", lambda: "old") == ("old", False)
+    assert second.do("k", lambda: "new") == ("old", True)
+
+    age(str(tmp_path / "k.json"), 6)
+    assert second.do("k", lambda: "new") == ("new", False)
+    assert first.do("k", lambda: "newer") == ("new", True)
+
+
+@needs_fcntl
+def test_unshareable_result_leaves_no_files_behind(tmp_path):
+    flight = SingleFlight(shared_dir=str(tmp_path))
+    result = object()
+    assert flight.do("k", lambda: result) == (result, False)
+    assert sorted(os.listdir(tmp_path)) == ["k.lock"]
+
+
+@needs_fcntl
+def test_sweep_removes_expired_files(tmp_path):
+    flight = SingleFlight(shared_dir=str(tmp_path), shared_ttl=5, shared_wait=60)
+    for key in ("old", "fresh"):
+        flight.do(key, lambda: key)
+    age(str(tmp_path / "old.json"), 6)
+    (tmp_path / "orphan.lock").touch()
+    (tmp_path / "old.json.123.tmp").touch()
+    (tmp_path / "new.json.456.tmp").touch()
+    age(str(tmp_path / "old.json.123.tmp"), 61)
+
+    assert flight.sweep() == 2
+
+    assert sorted(os.listdir(tmp_path)) == ["fresh.json", "fresh.lock", "new.json.456.tmp"]
+
+
+@needs_fcntl
+def test_sweep_skips_keys_a_leader_holds(tmp_path):
+    flight = SingleFlight(shared_dir=str(tmp_path), shared_ttl=5)
+    started = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    thread = threading.Thread(target=flight.do, args=("busy", hold))
+    thread.start()
+    started.wait(5)
+    try:
+        assert flight.sweep() == 0
+        assert os.path.exists(tmp_path / "busy.lock")
+    finally:
+        release.set()
+        thread.join(5)
+
+
+@needs_fcntl
+def test_sweep_runs_at_most_every_sweep_interval(tmp_path):
+    flight = SingleFlight(shared_dir=str(tmp_path), shared_ttl=5, sweep_interval=3600)
+    flight.do("old", lambda: 1)
+    age(str(tmp_path / "old.json"), 6)
+
+    # The first call swept already; the next one within the interval doesn't
+    flight.do("a", lambda: 1)
+    assert os.path.exists(tmp_path / "old.json")
+
+    flight._last_sweep -= 3600
+    flight.do("b", lambda: 1)
+    assert not os.path.exists(tmp_path / "old.json")